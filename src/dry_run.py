@@ -0,0 +1,112 @@
+# Local stand-ins for Firestore, the scraper and SendGrid, used by `run_newsletter --dry-run`.
+
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+import asyncio
+import json
+import os
+import re
+
+try:
+    from src.extract_user_information import DEFAULT_PAGE_SIZE, UserPreference
+    from src.newsletter import (DeliveryStatus, MAX_PERSONALIZATIONS, NAME_TAG, NewsletterGenerator,
+                                Recipient, ScrapedItem, UNSUBSCRIBE_TAG)
+except ImportError:  # running as a script from inside src/
+    from extract_user_information import DEFAULT_PAGE_SIZE, UserPreference
+    from newsletter import (DeliveryStatus, MAX_PERSONALIZATIONS, NAME_TAG, NewsletterGenerator,
+                            Recipient, ScrapedItem, UNSUBSCRIBE_TAG)
+
+SAMPLE_SUBSCRIBERS = [
+    {'user_id': 'dry-1', 'email': 'ann@example.com', 'name': 'Ann', 'sport_preferences': ['basketball']},
+    {'user_id': 'dry-2', 'email': 'ben@example.com', 'name': 'Ben', 'sport_preferences': ['soccer', 'tennis']},
+    {'user_id': 'dry-3', 'email': 'cat@example.com', 'name': 'Cat', 'sport_preferences': ['basketball']},
+    {'user_id': 'dry-4', 'email': 'dan@example.com', 'name': 'Dan', 'sport_preferences': []},
+]
+
+def load_dry_run_subscribers(path: Optional[str] = None, frequency: str = 'weekly') -> List[UserPreference]:
+    """
+    Subscribers from a JSON list of {user_id, email, name, sport_preferences}
+    objects, or a small built-in sample
+    """
+    entries = SAMPLE_SUBSCRIBERS
+    if path:
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    return [
+        UserPreference(
+            user_id=entry['user_id'],
+            email=entry['email'],
+            name=entry.get('name', ''),
+            sport_preferences=entry.get('sport_preferences', []),
+            notification_frequency=entry.get('notification_frequency', frequency),
+            last_newsletter_sent=None,
+            is_active=True
+        )
+        for entry in entries
+    ]
+
+class DryRunSubscriberSource:
+    """
+    The parts of FirebaseManager the run orchestrator uses, over an
+    in-memory list of subscribers
+    """
+
+    def __init__(self, subscribers: List[UserPreference]):
+        self.subscribers = subscribers
+        self.last_sent: Dict[str, datetime] = {}
+
+    async def iter_users_due_for_newsletter(self, frequency: str,
+                                            page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[List[UserPreference]]:
+        due = [s for s in self.subscribers
+               if s.is_active and s.notification_frequency == frequency and s.user_id not in self.last_sent]
+        for start in range(0, len(due), page_size):
+            await asyncio.sleep(0)
+            yield due[start:start + page_size]
+
+    async def update_last_sent_timestamps(self, user_ids: Iterable[str],
+                                          frequencies: Optional[Dict[str, str]] = None) -> Dict[str, bool]:
+        now = datetime.now(timezone.utc)
+        results = {}
+        for user_id in user_ids:
+            self.last_sent[user_id] = now
+            results[user_id] = True
+        return results
+
+def dry_run_content(sport: str) -> List[ScrapedItem]:
+    """
+    Canned article HTML for a sport instead of scraping live sites
+    """
+    label = sport or 'sports'
+    html = (f"<html><head><title>{label.title()} roundup</title></head><body><article>"
+            f"<h1>{label.title()} roundup</h1>"
+            f"<p>This is placeholder {label} coverage generated for a dry run. "
+            f"No pages were fetched and no email was sent.</p>"
+            f"</article></body></html>")
+    return [(f"https://dry-run.local/{label.replace(' ', '-')}", html)]
+
+class OutboxNewsletterGenerator(NewsletterGenerator):
+    """
+    NewsletterGenerator that writes each personalized email to a local
+    outbox directory instead of sending it through SendGrid
+    """
+
+    def __init__(self, outbox_dir: str, max_workers: Optional[int] = 1):
+        super().__init__('dry-run', max_workers=max_workers)
+        self.outbox_dir = outbox_dir
+        os.makedirs(outbox_dir, exist_ok=True)
+
+    def send_bulk(self, recipients: List[Recipient], html_content: str, subject: str,
+                  batch_size: int = MAX_PERSONALIZATIONS) -> List[DeliveryStatus]:
+        statuses = []
+        for recipient in recipients:
+            substitutions = recipient.substitutions()
+            body = html_content.replace(NAME_TAG, substitutions[NAME_TAG])\
+                               .replace(UNSUBSCRIBE_TAG, substitutions[UNSUBSCRIBE_TAG])
+            filename = re.sub(r'[^A-Za-z0-9._-]', '_', recipient.email) + '.html'
+            with open(os.path.join(self.outbox_dir, filename), 'w') as f:
+                f.write(f"<!-- Subject: {subject} -->\n{body}")
+            statuses.append(DeliveryStatus(recipient.email, True, 202))
+        return statuses
+
+    def send_newsletter(self, recipient_email: str, html_content: str, sport: str) -> bool:
+        return self.send_bulk([Recipient(recipient_email)], html_content, f"Your {sport} Newsletter Update")[0].delivered
@@ -0,0 +1,133 @@
+from typing import List, Optional, Sequence
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'embeddings.sqlite')
+DEFAULT_MAX_ENTRIES = 200_000
+
+def text_hash(text: str) -> str:
+    """
+    Returns the cache key for a chunk of text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache backed by SQLite.
+
+    Vectors are keyed by (model name, text hash) and stored as float32 blobs.
+    When the cache grows past `max_entries` the least recently used vectors
+    are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)'
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up cached vectors for `texts`.
+
+        Returns:
+            List[Optional[List[float]]]: One entry per text, None where the text is not cached
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT text_hash, vector FROM embeddings '
+                    f'WHERE model = ? AND text_hash IN ({placeholders})',
+                    [model, *chunk]
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?',
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+
+        return [
+            np.frombuffer(found[h], dtype=np.float32).tolist() if h in found else None
+            for h in hashes
+        ]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Stores vectors for `texts` and evicts the least recently used entries
+        if the cache is over capacity.
+        """
+        now = time.time()
+        rows = [
+            (model, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """
+        Deletes the least recently used rows above `max_entries`.
+        """
+        (count,) = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                'DELETE FROM embeddings WHERE rowid IN ('
+                'SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)',
+                (excess,)
+            )
+            logger.info(f"Evicted {excess} embeddings from cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,185 @@
+# Chunks documents and embeds the chunks in length-sorted batches, optionally across processes.
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+import logging
+import multiprocessing
+import os
+import time
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+
+try:
+    from src.embedding_cache import EmbeddingCache
+    from src.embeddings import CachedEmbedding, get_model_name, load_base_model
+    from src.metrics import metrics
+except ImportError:  # running as a script from inside src/
+    from embedding_cache import EmbeddingCache
+    from embeddings import CachedEmbedding, get_model_name, load_base_model
+    from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Chunks sent to the model per call
+DEFAULT_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '64'))
+# Embedding processes; 1 embeds in the calling process with the shared model
+DEFAULT_WORKERS = int(os.getenv('EMBED_WORKERS', '1'))
+
+@dataclass
+class EmbeddingStats:
+    documents: int = 0
+    chunks: int = 0
+    cached: int = 0      # Chunks whose embedding came from the embedding cache
+    embedded: int = 0    # Chunks run through the model
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+# Model loaded once in each worker process by _init_worker
+_worker_model: Optional[BaseEmbedding] = None
+
+def _init_worker(model_factory: Callable[[], BaseEmbedding]) -> None:
+    global _worker_model
+    _worker_model = model_factory()
+
+def _embed_batch(model_name: str, texts: List[str]) -> List[Embedding]:
+    # Vectors are cached under the caller's model name, so they must come from that model
+    if _worker_model.model_name != model_name:
+        raise ValueError(f"Worker loaded {_worker_model.model_name!r} but the pipeline embeds with {model_name!r}")
+    return _worker_model.get_text_embedding_batch(texts)
+
+def chunk_documents(documents: Sequence[Document]) -> List[BaseNode]:
+    """
+    Split documents into chunks with the configured node parser
+    """
+    return run_transformations(list(documents), Settings.transformations)
+
+def _batches(texts: List[str], batch_size: int) -> List[List[int]]:
+    """
+    Indices of texts grouped into batches of similar length, so short
+    chunks are not padded out to the longest chunk in a batch
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+class EmbeddingPipeline:
+    """
+    Embeds chunks in tunable, length-sorted batches. Cached embeddings are
+    looked up first; the rest are embedded in-process or spread over a
+    pool of worker processes that each load the model once.
+    """
+
+    def __init__(self,
+                 embed_model: Optional[BaseEmbedding] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = DEFAULT_WORKERS,
+                 model_factory: Optional[Callable[[], BaseEmbedding]] = None):
+        """
+        Args:
+            embed_model: Model for in-process embedding, defaults to Settings.embed_model
+            batch_size: Chunks per model call
+            workers: Worker processes; 1 embeds in the calling process
+            model_factory: Picklable function that loads the same model in a
+                worker. Defaults to load_base_model when the model in use is the
+                configured one (EMBED_MODEL_NAME/PATH); any other model is run
+                in-process, since workers could not load it.
+        """
+        self.embed_model = embed_model
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model_factory = model_factory
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self, model_factory: Callable[[], BaseEmbedding]) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: torch is loaded by now, and its thread pools
+            # do not survive a fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(model_factory,)
+            )
+        return self._executor
+
+    def _worker_model_factory(self, model_name: str) -> Optional[Callable[[], BaseEmbedding]]:
+        if self.model_factory is not None:
+            return self.model_factory
+        if model_name == get_model_name():
+            return load_base_model
+        logger.warning(f"Embedding model {model_name!r} is not the configured one, embedding in-process")
+        return None
+
+    def embed_nodes(self, nodes: Sequence[BaseNode]) -> EmbeddingStats:
+        """
+        Set the embedding of every node that does not have one yet
+        """
+        start = time.perf_counter()
+        stats = EmbeddingStats(chunks=len(nodes))
+        pending = [node for node in nodes if node.embedding is None]
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+
+        embed_model = self.embed_model or Settings.embed_model
+        cache: Optional[EmbeddingCache] = None
+        model_name = embed_model.model_name
+        if isinstance(embed_model, CachedEmbedding):
+            cache = embed_model.cache
+            cached = cache.get_many(model_name, texts)
+            for node, vector in zip(pending, cached):
+                node.embedding = vector
+            stats.cached = sum(vector is not None for vector in cached)
+            embed_model = embed_model.inner
+
+        missing = [i for i, node in enumerate(pending) if node.embedding is None]
+        missing_texts = [texts[i] for i in missing]
+        batches = _batches(missing_texts, self.batch_size)
+        batch_texts = [[missing_texts[i] for i in batch] for batch in batches]
+
+        model_factory = self._worker_model_factory(model_name) if self.workers > 1 and len(batches) > 1 else None
+        if model_factory is not None:
+            results = self._get_executor(model_factory).map(_embed_batch, [model_name] * len(batch_texts), batch_texts)
+        else:
+            results = (embed_model.get_text_embedding_batch(batch) for batch in batch_texts)
+
+        for batch, vectors in zip(batches, results):
+            for i, vector in zip(batch, vectors):
+                pending[missing[i]].embedding = vector
+            stats.batches += 1
+        stats.embedded = len(missing)
+
+        if cache is not None and missing:
+            cache.put_many(model_name, missing_texts, [pending[i].embedding for i in missing])
+
+        stats.seconds = time.perf_counter() - start
+        metrics.observe('embedding_seconds', stats.seconds)
+        metrics.incr('embedding_chunks', stats.cached, source='cache')
+        metrics.incr('embedding_chunks', stats.embedded, source='model')
+        metrics.incr('embedding_batches', stats.batches)
+        logger.info(f"Embedded {stats.chunks} chunks ({stats.cached} cached) in {stats.batches} batches: "
+                    f"{stats.chunks_per_second:.1f} chunks/s")
+        return stats
+
+    def embed_documents(self, documents: Sequence[Document]) -> Tuple[List[BaseNode], EmbeddingStats]:
+        """
+        Chunk documents and embed every chunk
+
+        Returns:
+            The embedded chunks, ready for VectorStoreIndex.insert_nodes, and timing stats
+        """
+        start = time.perf_counter()
+        nodes = chunk_documents(documents)
+        stats = self.embed_nodes(nodes)
+        stats.documents = len(documents)
+        stats.seconds = time.perf_counter() - start
+        return nodes, stats
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,154 @@
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from typing import List, Optional
+import logging
+import os
+import threading
+
+try:
+    from src.embedding_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, EmbeddingCache
+except ImportError:  # running as a script from inside src/
+    from embedding_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Process-wide embedding model, loaded on first use
+_embed_model: Optional[BaseEmbedding] = None
+_lock = threading.Lock()
+
+def get_model_name() -> str:
+    """
+    Returns the model to load: a local path from EMBED_MODEL_PATH if set,
+    otherwise EMBED_MODEL_NAME or the default Hugging Face model.
+    """
+    return os.getenv('EMBED_MODEL_PATH') or os.getenv('EMBED_MODEL_NAME', DEFAULT_MODEL_NAME)
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with a persistent EmbeddingCache, so text that
+    was embedded in an earlier run is looked up instead of re-embedded.
+    Query embeddings are not cached.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs
+        )
+        self._inner = inner
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._inner.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        vectors = self._cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = self._inner.get_text_embedding_batch(missing_texts)
+            self._cache.put_many(self.model_name, missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embedding(text)
+
+def load_base_model() -> BaseEmbedding:
+    """
+    Loads the sentence-transformers weights without the embedding cache,
+    e.g. once in each embedding worker process. With EMBED_MODEL_PATH
+    pointing at a saved model directory no network access is needed.
+    """
+    model_name = get_model_name()
+    logger.info(f"Loading embedding model: {model_name}")
+    return HuggingFaceEmbedding(
+        model_name=model_name,
+        cache_folder=os.getenv('EMBED_CACHE_FOLDER')
+    )
+
+def _load_embed_model() -> BaseEmbedding:
+    """
+    Loads the shared embedding model. Unless EMBEDDING_CACHE_PATH is set
+    to an empty string, the model is wrapped in a persistent embedding cache.
+    """
+    embed_model = load_base_model()
+
+    cache_path = os.getenv('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH)
+    if not cache_path:
+        return embed_model
+    cache = EmbeddingCache(
+        cache_path,
+        max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+    )
+    return CachedEmbedding(embed_model, cache)
+
+def get_embed_model() -> BaseEmbedding:
+    """
+    Returns the shared embedding model, loading it on the first call.
+
+    Returns:
+        BaseEmbedding: Embedding model shared by every caller in the process
+    """
+    global _embed_model
+    if _embed_model is None:
+        with _lock:
+            if _embed_model is None:
+                _embed_model = _load_embed_model()
+    return _embed_model
+
+def set_embed_model(embed_model: Optional[BaseEmbedding]) -> None:
+    """
+    Replaces the shared embedding model, e.g. with a mock in tests.
+    Passing None makes the next get_embed_model() call load it again.
+    """
+    global _embed_model
+    with _lock:
+        _embed_model = embed_model
+
+def use_shared_embed_model() -> BaseEmbedding:
+    """
+    Points LlamaIndex's Settings.embed_model at the shared model.
+    """
+    embed_model = get_embed_model()
+    if Settings._embed_model is not embed_model:
+        Settings.embed_model = embed_model
+    return embed_model
+
+def warm_up() -> BaseEmbedding:
+    """
+    Loads the model and runs one embedding so the first real request does
+    not pay for weight loading. Call this when a worker starts.
+    """
+    embed_model = use_shared_embed_model()
+    # Straight to the model: through the cache this is a hit after the first run
+    model = embed_model.inner if isinstance(embed_model, CachedEmbedding) else embed_model
+    model.get_text_embedding("warm up")
+    return embed_model
@@ -1,11 +1,25 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
-from typing import Dict, List, Optional
+from google.cloud.firestore import AsyncClient
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core import exceptions as google_exceptions
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+import asyncio
 import os
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+try:
+    from firebase_admin import firestore_async
+except ImportError:  # firebase-admin without the async Firestore client
+    firestore_async = None
+
+try:
+    from src.metrics import metrics
+except ImportError:  # running as a script from inside src/
+    from metrics import metrics
+
 # Load environment variables
 load_dotenv()
 
@@ -19,23 +33,85 @@ class UserPreference:
     last_newsletter_sent: datetime
     is_active: bool
 
+# Documents per get_all() call when loading subscribers in bulk
+DEFAULT_READ_BATCH_SIZE = 300
+# get_all() calls allowed in flight at once
+DEFAULT_READ_CONCURRENCY = 8
+# Preference documents per page when streaming subscribers
+DEFAULT_PAGE_SIZE = 500
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+# Commit errors worth retrying; anything else fails the batch straight away
+TRANSIENT_ERRORS = (
+    google_exceptions.Aborted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+)
+
+FREQUENCY_INTERVALS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+}
+# next_due_at for users who have never been sent a newsletter
+NEVER_SENT_DUE_AT = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def compute_next_due_at(last_sent: Optional[datetime], frequency: str) -> Optional[datetime]:
+    """
+    When a user next becomes due, or None for an unknown frequency
+    """
+    interval = FREQUENCY_INTERVALS.get(frequency)
+    if interval is None:
+        return None
+    if not last_sent:
+        return NEVER_SENT_DUE_AT
+    if last_sent.tzinfo is None:
+        # Firestore stores naive datetimes as UTC
+        last_sent = last_sent.replace(tzinfo=timezone.utc)
+    return last_sent + interval
+
 class FirebaseManager:
-    def __init__(self, credentials_path: str = None):
+    def __init__(self, credentials_path: str = None, db: Any = None,
+                 read_batch_size: int = DEFAULT_READ_BATCH_SIZE,
+                 read_concurrency: int = DEFAULT_READ_CONCURRENCY,
+                 use_async_client: Optional[bool] = None):
         """
         Initialize Firebase connection
         
         Args:
             credentials_path: Path to Firebase service account key JSON file
+            db: Firestore client to use instead of the default app's client,
+                e.g. one pointed at the emulator or an in-memory fake
+            read_batch_size: Number of user documents fetched per multi-document read
+            read_concurrency: Number of multi-document reads run concurrently
+            use_async_client: Whether `db` is an async Firestore client. By default
+                the async client is used when available; a sync client has its
+                blocking calls offloaded to a thread pool instead.
         """
-        if not firebase_admin._apps:
-            cred_path = credentials_path or os.getenv('FIREBASE_CREDENTIALS_PATH')
-            if not cred_path:
-                raise ValueError("Firebase credentials path not provided")
-            
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
+        self.read_batch_size = read_batch_size
+        self.read_concurrency = read_concurrency
+        
+        if db is None:
+            if not firebase_admin._apps:
+                cred_path = credentials_path or os.getenv('FIREBASE_CREDENTIALS_PATH')
+                if not cred_path:
+                    raise ValueError("Firebase credentials path not provided")
+                
+                cred = credentials.Certificate(cred_path)
+                firebase_admin.initialize_app(cred)
+            if use_async_client is None:
+                use_async_client = firestore_async is not None
+            db = firestore_async.client() if use_async_client else firestore.client()
+        elif use_async_client is None:
+            use_async_client = isinstance(db, AsyncClient)
         
-        self.db = firestore.client()
+        self.db = db
+        self.is_async = use_async_client
         self.users_ref = self.db.collection('users')
         self.preferences_ref = self.db.collection('newsletter_preferences')
 
@@ -44,23 +120,15 @@ class FirebaseManager:
         Retrieve user preferences from Firebase
         """
         try:
-            user_doc = self.users_ref.document(user_id).get()
+            user_doc = await self._get(self.users_ref.document(user_id))
             if not user_doc.exists:
                 return None
 
             user_data = user_doc.to_dict()
-            pref_doc = self.preferences_ref.document(user_id).get()
+            pref_doc = await self._get(self.preferences_ref.document(user_id))
             pref_data = pref_doc.to_dict() if pref_doc.exists else {}
 
-            return UserPreference(
-                user_id=user_id,
-                email=user_data.get('email'),
-                name=user_data.get('name'),
-                sport_preferences=pref_data.get('sport_preferences', []),
-                notification_frequency=pref_data.get('notification_frequency', 'weekly'),
-                last_newsletter_sent=pref_data.get('last_newsletter_sent'),
-                is_active=pref_data.get('is_active', True)
-            )
+            return self._build_user_preference(user_id, user_data, pref_data)
         except Exception as e:
             print(f"Error fetching user preferences: {e}")
             return None
@@ -70,40 +138,150 @@ class FirebaseManager:
         Get all active newsletter subscribers
         """
         try:
-            # Query for active subscribers
-            active_prefs = self.preferences_ref.where('is_active', '==', True).stream()
-            
             subscribers = []
-            for pref in active_prefs:
-                user_id = pref.id
-                user_doc = self.users_ref.document(user_id).get()
-                
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
-                    pref_data = pref.to_dict()
-                    
-                    subscribers.append(UserPreference(
-                        user_id=user_id,
-                        email=user_data.get('email'),
-                        name=user_data.get('name'),
-                        sport_preferences=pref_data.get('sport_preferences', []),
-                        notification_frequency=pref_data.get('notification_frequency', 'weekly'),
-                        last_newsletter_sent=pref_data.get('last_newsletter_sent'),
-                        is_active=True
-                    ))
-            
+            async for batch in self.iter_active_subscribers():
+                subscribers.extend(batch)
             return subscribers
         except Exception as e:
             print(f"Error fetching active subscribers: {e}")
             return []
 
+    async def iter_active_subscribers(self, page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[List[UserPreference]]:
+        """
+        Stream active newsletter subscribers one page at a time
+        
+        Args:
+            page_size: Number of preference documents read per page
+        """
+        # Query for active subscribers
+        query = self.preferences_ref.where('is_active', '==', True)
+        async for page in self._iter_pages(query, page_size):
+            yield await self.load_subscribers(page)
+
+    async def _iter_pages(self, query: Any, page_size: int,
+                          order_by: Iterable[str] = ()) -> AsyncIterator[List[Any]]:
+        """
+        Page through a query with cursors, ordered by `order_by` and then
+        document id. The next page is fetched while the caller processes
+        the current one.
+        """
+        for field in order_by:
+            query = query.order_by(field)
+        query = query.order_by(FieldPath.document_id())
+        page = await self._stream(query.limit(page_size))
+        next_page = None
+        try:
+            while page:
+                next_page = None
+                if len(page) == page_size:
+                    next_page = asyncio.ensure_future(
+                        self._stream(query.start_after(page[-1]).limit(page_size))
+                    )
+                yield page
+                page = await next_page if next_page else []
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    async def load_subscribers(self, pref_docs: Iterable[Any]) -> List[UserPreference]:
+        """
+        Join preference snapshots with their user documents using batched
+        multi-document reads instead of one read per subscriber
+        
+        Args:
+            pref_docs: Snapshots from the newsletter_preferences collection
+        """
+        pref_docs = list(pref_docs)
+        chunks = [
+            pref_docs[start:start + self.read_batch_size]
+            for start in range(0, len(pref_docs), self.read_batch_size)
+        ]
+        semaphore = asyncio.Semaphore(self.read_concurrency)
+        
+        async def load_chunk(chunk: List[Any]) -> List[UserPreference]:
+            refs = [self.users_ref.document(pref.id) for pref in chunk]
+            async with semaphore:
+                user_docs = await self._get_all(refs)
+            
+            users_by_id = {doc.id: doc for doc in user_docs if doc.exists}
+            subscribers = []
+            for pref in chunk:
+                user_doc = users_by_id.get(pref.id)
+                if user_doc is not None:
+                    subscribers.append(
+                        self._build_user_preference(pref.id, user_doc.to_dict(), pref.to_dict())
+                    )
+            return subscribers
+        
+        results = await asyncio.gather(*[load_chunk(chunk) for chunk in chunks])
+        return [subscriber for chunk in results for subscriber in chunk]
+
+    async def _call(self, method: Callable, *args, **kwargs) -> Any:
+        """
+        Await a Firestore call: natively with the async client, or on a
+        worker thread with the blocking sync client
+        """
+        with metrics.timer('firestore_seconds', op=getattr(method, '__name__', 'call')):
+            if self.is_async:
+                return await method(*args, **kwargs)
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def _get(self, doc_ref: Any) -> Any:
+        return await self._call(doc_ref.get)
+
+    async def _stream(self, query: Any) -> List[Any]:
+        with metrics.timer('firestore_seconds', op='stream'):
+            if self.is_async:
+                docs = [doc async for doc in query.stream()]
+            else:
+                docs = await asyncio.to_thread(lambda: list(query.stream()))
+        metrics.incr('firestore_documents_read', len(docs))
+        return docs
+
+    async def _get_all(self, doc_refs: List[Any]) -> List[Any]:
+        with metrics.timer('firestore_seconds', op='get_all'):
+            if self.is_async:
+                docs = [doc async for doc in self.db.get_all(doc_refs)]
+            else:
+                docs = await asyncio.to_thread(lambda: list(self.db.get_all(doc_refs)))
+        metrics.incr('firestore_documents_read', len(docs))
+        return docs
+
+    def _build_user_preference(self, user_id: str, user_data: Dict, pref_data: Dict) -> UserPreference:
+        """
+        Combine a user document and its preference document
+        """
+        return UserPreference(
+            user_id=user_id,
+            email=user_data.get('email'),
+            name=user_data.get('name'),
+            sport_preferences=pref_data.get('sport_preferences', []),
+            notification_frequency=pref_data.get('notification_frequency', 'weekly'),
+            last_newsletter_sent=pref_data.get('last_newsletter_sent'),
+            is_active=pref_data.get('is_active', True)
+        )
+
     async def update_user_preferences(self, user_id: str, preferences: Dict) -> bool:
         """
-        Update user preferences in Firebase
+        Update user preferences in Firebase, keeping next_due_at in step
+        with the notification frequency
         """
         try:
+            if 'notification_frequency' in preferences or 'last_newsletter_sent' in preferences:
+                pref_doc = await self._get(self.preferences_ref.document(user_id))
+                current = pref_doc.to_dict() if pref_doc.exists else {}
+                current.update(preferences)
+                preferences = {
+                    **preferences,
+                    'next_due_at': compute_next_due_at(
+                        current.get('last_newsletter_sent'),
+                        current.get('notification_frequency', 'weekly')
+                    )
+                }
+            
             # Update preferences
-            self.preferences_ref.document(user_id).set(
+            await self._call(
+                self.preferences_ref.document(user_id).set,
                 preferences,
                 merge=True
             )
@@ -112,41 +290,179 @@ class FirebaseManager:
             print(f"Error updating user preferences: {e}")
             return False
 
-    async def update_last_sent_timestamp(self, user_id: str) -> bool:
+    async def update_last_sent_timestamp(self, user_id: str, frequency: Optional[str] = None) -> bool:
         """
-        Update the timestamp of last sent newsletter
+        Update the timestamp of last sent newsletter and when the next one is due
+        
+        Args:
+            user_id: User the newsletter was sent to
+            frequency: The user's notification frequency; read from Firestore if omitted
         """
         try:
-            self.preferences_ref.document(user_id).update({
-                'last_newsletter_sent': datetime.now()
+            if frequency is None:
+                pref_doc = await self._get(self.preferences_ref.document(user_id))
+                frequency = (pref_doc.to_dict() or {}).get('notification_frequency', 'weekly')
+            
+            sent_at = datetime.now(timezone.utc)
+            await self._call(self.preferences_ref.document(user_id).update, {
+                'last_newsletter_sent': sent_at,
+                'next_due_at': compute_next_due_at(sent_at, frequency)
             })
             return True
         except Exception as e:
             print(f"Error updating last sent timestamp: {e}")
             return False
 
+    async def update_last_sent_timestamps(self, user_ids: Iterable[str],
+                                          frequencies: Optional[Dict[str, str]] = None,
+                                          chunk_size: int = MAX_BATCH_WRITES,
+                                          max_retries: int = 3,
+                                          retry_delay: float = 0.5) -> Dict[str, bool]:
+        """
+        Record a completed send for many users with batched writes
+        
+        Each write is an update, so a preference document deleted since the
+        user was loaded is never recreated. If the commit finds one gone, the
+        chunk's documents are read to drop the deleted ones and the rest are
+        written again. Only transient commit errors are retried.
+        
+        Args:
+            user_ids: Users whose newsletter was delivered
+            frequencies: Notification frequency per user, used for next_due_at;
+                missing entries are read from Firestore in bulk
+            chunk_size: Writes per batch, capped at Firestore's limit of 500
+            max_retries: Extra attempts for a chunk whose commit fails transiently
+            retry_delay: Initial delay between attempts, doubled each retry
+            
+        Returns:
+            Per user id: True if the timestamps were saved, False if the write
+            failed, None if the preference document no longer exists (nothing
+            is written for it)
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        frequencies = dict(frequencies or {})
+        chunk_size = min(chunk_size, MAX_BATCH_WRITES)
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+        semaphore = asyncio.Semaphore(self.read_concurrency)
+        
+        async def commit_chunk(chunk: List[str]) -> Dict[str, Optional[bool]]:
+            deleted = set()
+            
+            async def read_chunk(user_ids: List[str]) -> None:
+                pref_docs = await self._get_all([self.preferences_ref.document(user_id) for user_id in user_ids])
+                for pref in pref_docs:
+                    if not pref.exists:
+                        deleted.add(pref.id)
+                    elif pref.id not in frequencies:
+                        frequencies[pref.id] = pref.to_dict().get('notification_frequency', 'weekly')
+            
+            async with semaphore:
+                try:
+                    missing = [user_id for user_id in chunk if user_id not in frequencies]
+                    if missing:
+                        await read_chunk(missing)
+                except Exception as e:
+                    print(f"Error reading frequencies for timestamp batch: {e}")
+                    return {user_id: False for user_id in chunk}
+                
+                delay = retry_delay
+                for attempt in range(max_retries + 1):
+                    existing = [user_id for user_id in chunk if user_id not in deleted]
+                    sent_at = datetime.now(timezone.utc)
+                    batch = self.db.batch()
+                    for user_id in existing:
+                        batch.update(self.preferences_ref.document(user_id), {
+                            'last_newsletter_sent': sent_at,
+                            'next_due_at': compute_next_due_at(sent_at, frequencies.get(user_id, 'weekly'))
+                        })
+                    try:
+                        if existing:
+                            await self._call(batch.commit)
+                        return {user_id: None if user_id in deleted else True for user_id in chunk}
+                    except google_exceptions.NotFound as e:
+                        # A document was deleted since it was loaded: find it and write the rest
+                        print(f"Preference document missing from timestamp batch: {e}")
+                        try:
+                            await read_chunk(existing)
+                        except Exception as e:
+                            print(f"Error reading timestamp batch documents: {e}")
+                            break
+                        if not deleted.intersection(existing):
+                            break
+                    except TRANSIENT_ERRORS as e:
+                        print(f"Error committing timestamp batch (attempt {attempt + 1}): {e}")
+                        if attempt < max_retries:
+                            await asyncio.sleep(delay)
+                            delay *= 2
+                    except Exception as e:
+                        print(f"Error committing timestamp batch, not retrying: {e}")
+                        break
+                return {user_id: False for user_id in chunk}
+        
+        results = await asyncio.gather(*[commit_chunk(chunk) for chunk in chunks])
+        outcomes = {}
+        for result in results:
+            outcomes.update(result)
+        return outcomes
+
     async def get_users_due_for_newsletter(self, frequency: str) -> List[UserPreference]:
         """
         Get users who are due for a newsletter based on their frequency preference
         """
         try:
-            # Query for active users with matching frequency
-            query = self.preferences_ref.where('is_active', '==', True)\
-                                     .where('notification_frequency', '==', frequency)
-            
             users_due = []
-            for pref in query.stream():
-                last_sent = pref.get('last_newsletter_sent')
-                if self._is_due_for_newsletter(last_sent, frequency):
-                    user_pref = await self.get_user_preferences(pref.id)
-                    if user_pref:
-                        users_due.append(user_pref)
-            
+            async for batch in self.iter_users_due_for_newsletter(frequency):
+                users_due.extend(batch)
             return users_due
         except Exception as e:
             print(f"Error fetching users due for newsletter: {e}")
             return []
 
+    async def iter_users_due_for_newsletter(self, frequency: str,
+                                            page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[List[UserPreference]]:
+        """
+        Stream users due for a newsletter one page at a time
+        
+        Args:
+            frequency: 'daily', 'weekly' or 'monthly'
+            page_size: Number of preference documents read per page
+        """
+        # Range query on the precomputed next_due_at, so only due users are read
+        query = self.preferences_ref.where('is_active', '==', True)\
+                                 .where('notification_frequency', '==', frequency)\
+                                 .where('next_due_at', '<=', datetime.now(timezone.utc))
+        
+        async for page in self._iter_pages(query, page_size, order_by=['next_due_at']):
+            yield await self.load_subscribers(page)
+
+    async def backfill_next_due_at(self, page_size: int = MAX_BATCH_WRITES) -> int:
+        """
+        One-off migration that sets next_due_at on existing preference
+        documents from their last_newsletter_sent and frequency
+        
+        Returns:
+            Number of documents updated
+        """
+        updated = 0
+        page_size = min(page_size, MAX_BATCH_WRITES)
+        async for page in self._iter_pages(self.preferences_ref, page_size):
+            batch = self.db.batch()
+            writes = 0
+            for pref in page:
+                pref_data = pref.to_dict()
+                next_due_at = compute_next_due_at(
+                    pref_data.get('last_newsletter_sent'),
+                    pref_data.get('notification_frequency', 'weekly')
+                )
+                if next_due_at is not None and pref_data.get('next_due_at') != next_due_at:
+                    batch.update(self.preferences_ref.document(pref.id), {'next_due_at': next_due_at})
+                    writes += 1
+            if writes:
+                await self._call(batch.commit)
+                updated += writes
+        print(f"Backfilled next_due_at on {updated} preference documents")
+        return updated
+
     def _is_due_for_newsletter(self, last_sent: datetime, frequency: str) -> bool:
         """
         Check if a user is due for a newsletter based on their frequency preference
@@ -154,7 +470,7 @@ class FirebaseManager:
         if not last_sent:
             return True
             
-        now = datetime.now()
+        now = datetime.now(last_sent.tzinfo)
         delta = now - last_sent
         
         if frequency == 'daily':
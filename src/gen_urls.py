@@ -1,72 +1,82 @@
 
-def generate_urls_from_query(query):
+from typing import Dict, Iterable, List, Optional
+import json
+import os
+import re
+import threading
+
+# Keyword -> URL registry; entries earlier in the file take priority
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'url_registry.json')
+
+class UrlRegistry:
     """
-    Dynamically generates a list of URLs to scrape based on the user's query.
+    Keyword to URL mapping compiled once into a single alternation regex.
+    Longer keywords are tried first, so an overlapping phrase such as
+    "sports betting" is matched as a whole.
     """
-    # Example mapping of keywords to URLs (can be expanded)
-    keyword_to_urls = {
-        'soccer': [
-            'https://www.espn.com/soccer/',
-            'https://www.bbc.com/sport/football',
-            'https://www.goal.com/',
-        ],
-        'basketball': [
-            'https://www.espn.com/nba/',
-            'https://www.nba.com/news',
-            'https://bleacherreport.com/nba',
-        ],
-        'tennis': [
-            'https://www.atptour.com/',
-            'https://www.wtatennis.com/',
-            'https://tennis.com/',
-        ],
-        'sports betting': [
-            'https://www.sportsbettingdime.com/',
-            'https://www.actionnetwork.com/',
-            'https://www.oddschecker.com/',
-        ],
-        'baseball': [
-            'https://www.mlb.com/',
-            'https://www.espn.com/mlb/',
-            'https://bleacherreport.com/mlb',
-        ],
-        'football': [
-            'https://www.nfl.com/',
-            'https://www.espn.com/nfl/',
-            'https://www.profootballfocus.com/',
-        ],
-        'hockey': [
-            'https://www.nhl.com/',
-            'https://www.espn.com/nhl/',
-            'https://www.hockeybuzz.com/',
-        ],
-        'cricket': [
-            'https://www.espncricinfo.com/',
-            'https://www.cricket.com/',
-            'https://www.icc-cricket.com/',
-        ],
-        'golf': [
-            'https://www.pgatour.com/',
-            'https://www.golfchannel.com/',
-            'https://www.espn.com/golf/',
-        ],
-        'mma': [
-            'https://www.ufc.com/',
-            'https://www.mmafighting.com/',
-            'https://www.espn.com/mma/',
-        ]
-    }
 
+    def __init__(self, keyword_to_urls: Dict[str, List[str]], default_urls: Optional[List[str]] = None):
+        self.keyword_to_urls = {keyword.lower(): list(urls) for keyword, urls in keyword_to_urls.items()}
+        self.default_urls = list(default_urls or [])
+        self._priority = {keyword: rank for rank, keyword in enumerate(self.keyword_to_urls)}
+        keywords = sorted(self.keyword_to_urls, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(keyword) for keyword in keywords)) if keywords else None
+
+    @classmethod
+    def from_file(cls, path: str) -> 'UrlRegistry':
+        """
+        Load a registry from JSON, or YAML if the file ends in .yaml/.yml:
+        {"keywords": {keyword: [urls]}, "default": [urls]}
+        """
+        with open(path, 'r') as f:
+            if path.endswith(('.yaml', '.yml')):
+                import yaml
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        return cls(data.get('keywords', {}), data.get('default', []))
 
-    # Check for keywords in the query
-    query_lower = query.lower()
-    urls = []
-    for keyword, associated_urls in keyword_to_urls.items():
-        if keyword in query_lower:
-            urls.extend(associated_urls)
+    def match_keywords(self, query: str) -> List[str]:
+        """
+        Registry keywords found in the query, in priority order
+        """
+        if self._pattern is None:
+            return []
+        found = {match.group(0) for match in self._pattern.finditer(query.lower())}
+        return sorted(found, key=self._priority.__getitem__)
 
-    # Fallback to default sports betting URLs if no keywords match
-    if not urls:
-        urls = ['https://www.sportsbettingdime.com/', 'https://www.actionnetwork.com/']
+    def urls_for(self, query: str) -> List[str]:
+        return _dedupe(url for keyword in self.match_keywords(query)
+                       for url in self.keyword_to_urls[keyword]) or list(self.default_urls)
 
-    return urls
\ No newline at end of file
+def _dedupe(urls: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(urls))
+
+_registry: Optional[UrlRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> UrlRegistry:
+    """
+    Shared registry, loaded from URL_REGISTRY_PATH on first use
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = UrlRegistry.from_file(os.getenv('URL_REGISTRY_PATH', DEFAULT_REGISTRY_PATH))
+    return _registry
+
+def set_registry(registry: Optional[UrlRegistry]) -> None:
+    """
+    Replace the shared registry; None reloads it from disk on next use
+    """
+    global _registry
+    with _registry_lock:
+        _registry = registry
+
+def generate_urls_from_query(query):
+    """
+    Dynamically generates a list of URLs to scrape based on the user's query.
+    """
+    # Falls back to the registry's default sports betting URLs if no keywords match
+    return get_registry().urls_for(query)
@@ -0,0 +1,175 @@
+# HTML-to-text extraction backends for the scraper.
+
+from typing import Callable, Dict, List, Optional
+import logging
+import os
+import time
+from bs4 import BeautifulSoup
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Elements whose contents are never part of the article text
+BOILERPLATE_TAGS = frozenset(['script', 'style', 'nav', 'footer'])
+# Elements that hold the main content of a page, when it marks one up
+MAIN_CONTENT_TAGS = frozenset(['main', 'article'])
+
+DEFAULT_BACKEND = os.getenv('HTML_EXTRACTOR', 'lxml')
+
+Extractor = Callable[[str], str]
+
+def extract_text_bs4(html: str, main_content: bool = False) -> str:
+    """
+    Reference extractor: BeautifulSoup with the pure-Python parser.
+
+    Args:
+        html (str): Raw HTML of the page
+        main_content (bool): Only keep text inside <main>/<article> when the page has one
+
+    Returns:
+        str: Visible text, one stripped string per line
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    # Remove unnecessary elements
+    for script in soup(list(BOILERPLATE_TAGS)):
+        script.decompose()
+
+    if main_content:
+        regions = [region for region in soup(list(MAIN_CONTENT_TAGS))
+                   if not region.find_parent(list(MAIN_CONTENT_TAGS))]
+        if regions:
+            return '\n'.join(region.get_text(separator='\n', strip=True) for region in regions)
+    return soup.get_text(separator='\n', strip=True)
+
+class _TextTarget:
+    """
+    lxml parser target that collects text while the document streams
+    through the parser, without building a tree. Text inside boilerplate
+    elements is skipped by tracking how deep inside them the parser is.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.main_parts: List[str] = []
+        self._buffer: List[str] = []
+        self._skip_depth = 0
+        self._main_depth = 0
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        text = ''.join(self._buffer).strip()
+        self._buffer = []
+        if text:
+            self.parts.append(text)
+            if self._main_depth:
+                self.main_parts.append(text)
+
+    def start(self, tag, attrib) -> None:
+        self._flush()
+        if self._skip_depth or tag in BOILERPLATE_TAGS:
+            self._skip_depth += 1
+        elif tag in MAIN_CONTENT_TAGS:
+            self._main_depth += 1
+
+    def end(self, tag) -> None:
+        self._flush()
+        if self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in MAIN_CONTENT_TAGS and self._main_depth:
+            self._main_depth -= 1
+
+    def data(self, data) -> None:
+        if not self._skip_depth:
+            self._buffer.append(data)
+
+    def comment(self, text) -> None:
+        # Comments are dropped but still split the text around them
+        self._flush()
+
+    def close(self) -> '_TextTarget':
+        self._flush()
+        return self
+
+def extract_text_lxml(html: str, main_content: bool = False) -> str:
+    """
+    Fast extractor: streams the page through lxml's C HTML parser.
+
+    Args:
+        html (str): Raw HTML of the page
+        main_content (bool): Only keep text inside <main>/<article> when the page has one
+
+    Returns:
+        str: Visible text, one stripped string per line
+    """
+    if not html or not html.strip():
+        return ''
+    parser = etree.HTMLParser(target=_TextTarget(), remove_comments=False)
+    try:
+        parser.feed(html)
+        target = parser.close()
+    except etree.LxmlError as e:
+        logger.warning(f"lxml could not parse page, falling back to BeautifulSoup: {e}")
+        return extract_text_bs4(html, main_content)
+    parts = target.main_parts if main_content and target.main_parts else target.parts
+    return '\n'.join(parts)
+
+EXTRACTORS: Dict[str, Extractor] = {
+    'lxml': extract_text_lxml,
+    'bs4': extract_text_bs4,
+}
+
+def register_extractor(name: str, extractor: Extractor) -> None:
+    """
+    Make an extraction backend selectable by name. The scraper calls it
+    with the HTML and, for main-content extraction, main_content=True.
+    """
+    EXTRACTORS[name] = extractor
+
+def get_extractor(name: Optional[str] = None) -> Extractor:
+    """
+    Extraction backend by name, defaulting to HTML_EXTRACTOR ('lxml')
+    """
+    name = name or DEFAULT_BACKEND
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor {name!r}, expected one of {sorted(EXTRACTORS)}")
+    return EXTRACTORS[name]
+
+def benchmark(pages: Dict[str, str], repeat: int = 20) -> Dict[str, Dict[str, float]]:
+    """
+    Time every backend on the given pages and check their output matches
+    the BeautifulSoup reference.
+
+    Args:
+        pages (Dict[str, str]): Page name to raw HTML
+        repeat (int): Extractions per backend per page
+
+    Returns:
+        Dict[str, Dict[str, float]]: Per page, milliseconds per extraction for
+        each backend, plus the speedup over bs4 and whether outputs matched
+    """
+    results = {}
+    for name, html in pages.items():
+        reference = extract_text_bs4(html)
+        timings: Dict[str, float] = {}
+        for backend, extractor in EXTRACTORS.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                text = extractor(html)
+            timings[backend] = (time.perf_counter() - start) * 1000 / repeat
+            timings[f'{backend}_matches'] = float(text == reference)
+        timings['speedup'] = timings['bs4'] / timings['lxml']
+        results[name] = timings
+    return results
+
+if __name__ == "__main__":
+    import sys
+    pages_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join('tests', 'mock_data', 'pages')
+    pages = {}
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith('.html'):
+            with open(os.path.join(pages_dir, filename), 'r') as f:
+                pages[filename] = f.read()
+    for name, timings in benchmark(pages).items():
+        print(f"{name}: bs4 {timings['bs4']:.2f} ms, lxml {timings['lxml']:.2f} ms "
+              f"({timings['speedup']:.1f}x), output matches: {bool(timings['lxml_matches'])}")
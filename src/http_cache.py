@@ -0,0 +1,125 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'http.sqlite')
+
+@dataclass
+class CachedResponse:
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: str
+    text: str  # Extracted document text, reused on a 304
+    fetched_at: float
+    extraction: str = ''  # Extractor settings `text` was produced with
+
+@dataclass
+class HttpCacheStats:
+    hits: int = 0            # 304 Not Modified, cached document reused
+    misses: int = 0          # Full download, nothing usable in the cache
+    revalidations: int = 0   # Conditional requests sent
+    bytes_saved: int = 0     # Cached body bytes that did not have to be downloaded
+
+class HttpCache:
+    """
+    Local response cache for conditional HTTP requests.
+
+    Stores the body, extracted text and ETag/Last-Modified validators of
+    each page so the next fetch can send If-None-Match/If-Modified-Since
+    and reuse the cached document on a 304. The text is only reused with
+    the extractor settings it was produced with; otherwise the cached body
+    is extracted again.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        self.stats = HttpCacheStats()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body TEXT NOT NULL,
+                text TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                extraction TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(responses)')]
+        if 'extraction' not in columns:
+            # Caches written before extraction settings were recorded
+            self._conn.execute("ALTER TABLE responses ADD COLUMN extraction TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT url, etag, last_modified, body, text, fetched_at, extraction '
+                'FROM responses WHERE url = ?',
+                (url,)
+            ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str],
+            body: str, text: str, extraction: str = '') -> None:
+        """
+        Stores a response. Responses without validators are not cached,
+        since they could never be revalidated.
+        """
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(url, etag, last_modified, body, text, fetched_at, extraction) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, body, text, time.time(), extraction)
+            )
+            self._conn.commit()
+
+    def conditional_headers(self, cached: Optional[CachedResponse]) -> Dict[str, str]:
+        """
+        Returns the validator headers for a conditional request.
+        """
+        headers = {}
+        if cached is None:
+            return headers
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        return headers
+
+    def record_revalidation(self) -> None:
+        with self._lock:
+            self.stats.revalidations += 1
+
+    def record_hit(self, cached: CachedResponse) -> None:
+        with self._lock:
+            self.stats.hits += 1
+            self.stats.bytes_saved += len(cached.body.encode('utf-8'))
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.stats.misses += 1
+
+    def stats_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return asdict(self.stats)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,243 @@
+# SQLite-backed storage for the vector index, written through on every change.
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from llama_index.core import StorageContext
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, Document
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION, BaseKVStore
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.simple import SimpleVectorStoreData
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+INDEX_DB_FILE = 'index.sqlite'
+
+# Collection holding the full text of every indexed document, keyed by URL
+DOCUMENTS_COLLECTION = 'scraped_documents'
+
+def _connect(path: str) -> sqlite3.Connection:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class SqliteKVStore(BaseKVStore):
+    """
+    Key-value store for the docstore and index store: each put or delete
+    writes only its own rows
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                collection TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (collection, key)
+            )
+        """)
+        self._conn.commit()
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    def put_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                batch_size: int = 1) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)',
+                [(collection, key, json.dumps(val)) for key, val in kv_pairs]
+            )
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM kv WHERE collection = ? AND key = ?', (collection, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, value FROM kv WHERE collection = ? ORDER BY rowid', (collection,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM kv WHERE collection = ? AND key = ?', (collection, key))
+        return cursor.rowcount > 0
+
+    # The file is local, so the async variants just run the sync ones
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection)
+
+    async def aput_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                       batch_size: int = 1) -> None:
+        self.put_all(kv_pairs, collection, batch_size)
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection)
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM kv')
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class SqliteVectorStore(SimpleVectorStore):
+    """
+    SimpleVectorStore (in-memory, brute-force queries) whose adds and
+    deletes are also written to SQLite as float32 blobs, so persisting
+    never rewrites the vectors that did not change
+    """
+
+    _conn: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def from_path(cls, path: str) -> 'SqliteVectorStore':
+        conn = _connect(path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                node_id TEXT PRIMARY KEY,
+                ref_doc_id TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_vectors_ref_doc ON vectors (ref_doc_id)')
+        conn.commit()
+
+        data = SimpleVectorStoreData()
+        for node_id, ref_doc_id, vector, metadata in conn.execute(
+            'SELECT node_id, ref_doc_id, vector, metadata FROM vectors ORDER BY rowid'
+        ):
+            data.embedding_dict[node_id] = np.frombuffer(vector, dtype=np.float32).tolist()
+            data.text_id_to_ref_doc_id[node_id] = ref_doc_id
+            data.metadata_dict[node_id] = json.loads(metadata)
+
+        store = cls(data=data)
+        store._conn = conn
+        store._lock = threading.Lock()
+        return store
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        node_ids = super().add(nodes, **add_kwargs)
+        rows = []
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            metadata.pop('_node_content', None)
+            rows.append((node.node_id, node.ref_doc_id or 'None',
+                         np.asarray(node.get_embedding(), dtype=np.float32).tobytes(), json.dumps(metadata)))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO vectors (node_id, ref_doc_id, vector, metadata) VALUES (?, ?, ?, ?)', rows
+            )
+        return node_ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        super().delete(ref_doc_id, **delete_kwargs)
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM vectors WHERE ref_doc_id = ?', (ref_doc_id,))
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Any = None, **delete_kwargs: Any) -> None:
+        before = set(self.data.embedding_dict)
+        super().delete_nodes(node_ids, filters, **delete_kwargs)
+        removed = before - set(self.data.embedding_dict)
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM vectors WHERE node_id = ?', [(node_id,) for node_id in removed])
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM vectors')
+
+    def persist(self, persist_path: str = '', fs: Any = None) -> None:
+        """
+        Nothing to do: every change is already on disk
+        """
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class IndexStorage:
+    """
+    The index's docstore, index store, vectors and the full text of each
+    indexed document, in one SQLite file (WAL mode).
+
+    Updates cost what changed: a new document writes its own nodes and
+    vectors plus the index store's node list, instead of re-serializing
+    the whole index.
+    """
+
+    def __init__(self, persist_dir: str):
+        self.path = os.path.join(persist_dir, INDEX_DB_FILE)
+        self.kvstore = SqliteKVStore(self.path)
+        self.vector_store = SqliteVectorStore.from_path(self.path)
+        self.context = StorageContext.from_defaults(
+            docstore=KVDocumentStore(self.kvstore),
+            index_store=KVIndexStore(self.kvstore),
+            vector_store=self.vector_store
+        )
+
+    def save_documents(self, documents: Iterable[Document]) -> None:
+        self.kvstore.put_all(
+            [(doc.metadata.get('url') or doc.id_, {
+                'id': doc.id_,
+                'text': doc.text,
+                'metadata': doc.metadata,
+                'excluded_embed_metadata_keys': doc.excluded_embed_metadata_keys,
+                'excluded_llm_metadata_keys': doc.excluded_llm_metadata_keys,
+            }) for doc in documents],
+            collection=DOCUMENTS_COLLECTION
+        )
+
+    def delete_document(self, key: str) -> None:
+        self.kvstore.delete(key, collection=DOCUMENTS_COLLECTION)
+
+    def documents(self) -> List[Document]:
+        """
+        Every indexed document as scraped, in the order they were (re-)indexed
+        """
+        documents = []
+        for entry in self.kvstore.get_all(collection=DOCUMENTS_COLLECTION).values():
+            doc = Document(
+                text=entry['text'],
+                extra_info=entry['metadata'],
+                excluded_embed_metadata_keys=entry['excluded_embed_metadata_keys'],
+                excluded_llm_metadata_keys=entry['excluded_llm_metadata_keys']
+            )
+            doc.id_ = entry['id']
+            documents.append(doc)
+        return documents
+
+    def clear(self) -> None:
+        self.kvstore.clear()
+        self.vector_store.clear()
+
+    def close(self) -> None:
+        self.kvstore.close()
+        self.vector_store.close()
@@ -0,0 +1,268 @@
+# Timers, counters and histograms for the hot paths, exported per run as JSON or Prometheus text.
+#
+#   METRICS_ENABLED=1 python -m src.run_newsletter ...
+#   python -m src.run_newsletter --metrics metrics.prom
+
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Sequence, Tuple
+import functools
+import inspect
+import json
+import math
+import os
+import re
+import threading
+import time
+
+# Recording is off unless enabled here or with Metrics.enable()
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# Histogram bucket upper bounds; timers observe seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix for metric names in the Prometheus export
+PROMETHEUS_PREFIX = 'sports_newsletter_'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with count, sum, min and max
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> Dict[str, int]:
+        """
+        Observations at or below each bucket bound, keyed like Prometheus' `le`
+        """
+        result, total = {}, 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result['+Inf' if bound == math.inf else repr(float(bound))] = total
+        return result
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max if self.count else 0.0,
+            'buckets': self.cumulative(),
+        }
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: Labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.metrics._observe(self.name, time.perf_counter() - self.start, self.labels)
+        if exc_type is not None:
+            self.metrics._incr(f"{self.name}_errors", 1, self.labels)
+        return False
+
+class _NullTimer:
+    """
+    What timer() hands out while recording is disabled: does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullTimer':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+NULL_TIMER = _NullTimer()
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class Metrics:
+    """
+    Registry of counters and histograms, keyed by name and labels.
+
+    Every recording call returns straight away while the registry is
+    disabled, so instrumented hot paths cost one attribute check.
+    Timers that exit with an exception also count `<name>_errors`.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._started = time.time()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._started = time.time()
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        if self.enabled:
+            self._incr(name, value, _labels(labels))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if self.enabled:
+            self._observe(name, value, _labels(labels))
+
+    def timer(self, name: str, **labels):
+        """
+        Context manager recording the seconds spent in its block
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name, _labels(labels))
+
+    def timed(self, name: str, **labels) -> Callable:
+        """
+        Decorator recording the seconds spent in each call, for plain and
+        async functions
+        """
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    with self.timer(name, **labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _incr(self, name: str, value: float, labels: Labels) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def _observe(self, name: str, value: float, labels: Labels) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_labels(labels))
+
+    def snapshot(self) -> Dict:
+        """
+        Everything recorded since the last reset, as plain data
+        """
+        with self._lock:
+            return {
+                'started_at': self._started,
+                'seconds': time.time() - self._started,
+                'counters': {
+                    name: [{'labels': dict(labels), 'value': value} for labels, value in sorted(series.items())]
+                    for name, series in sorted(self._counters.items())
+                },
+                'histograms': {
+                    name: [{'labels': dict(labels), **histogram.to_dict()}
+                           for labels, histogram in sorted(series.items())]
+                    for name, series in sorted(self._histograms.items())
+                },
+            }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix: str = PROMETHEUS_PREFIX) -> str:
+        """
+        Prometheus text exposition format (counters get a `_total` suffix)
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, series in snapshot['counters'].items():
+            metric = _metric_name(prefix + name) + '_total'
+            lines.append(f"# TYPE {metric} counter")
+            for entry in series:
+                lines.append(f"{metric}{_format_labels(entry['labels'])} {_format_value(entry['value'])}")
+        for name, series in snapshot['histograms'].items():
+            metric = _metric_name(prefix + name)
+            lines.append(f"# TYPE {metric} histogram")
+            for entry in series:
+                for bound, count in entry['buckets'].items():
+                    labels = _format_labels({**entry['labels'], 'le': bound})
+                    lines.append(f"{metric}_bucket{labels} {count}")
+                labels = _format_labels(entry['labels'])
+                lines.append(f"{metric}_sum{labels} {_format_value(entry['sum'])}")
+                lines.append(f"{metric}_count{labels} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """
+        Write a summary to `path`: JSON for a .json file, Prometheus text otherwise
+        """
+        content = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_:]', '_', name)
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels.items():
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{_metric_name(key)}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Process-wide registry the instrumented modules record into
+metrics = Metrics()
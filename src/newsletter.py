@@ -1,82 +1,392 @@
 #Contains all the code to generate dynamic newsletter based on user cateogry. 
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
 import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+import hashlib
+import multiprocessing
+import re
+import threading
+import requests
+from requests.adapters import HTTPAdapter
 from newspaper import Article
 from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Content
-from jinja2 import Template
-import json
+from sendgrid.helpers.mail import Mail, Content, CustomArg, Personalization, Substitution, To
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup, escape
+from urllib.parse import urlencode
+
+try:
+    from src.metrics import metrics
+    from src.preference_store import LEGACY_JSON_PATH, PreferenceStore
+except ImportError:  # running as a script from inside src/
+    from metrics import metrics
+    from preference_store import LEGACY_JSON_PATH, PreferenceStore
+
+# A scraped item is raw HTML/text, or a (url, raw HTML/text) pair
+ScrapedItem = Union[str, Tuple[str, str]]
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR', os.path.join('.cache', 'jinja'))
+# Base URL for unsubscribe links; the user id is appended as a query parameter
+UNSUBSCRIBE_URL = os.getenv('UNSUBSCRIBE_URL', '')
+
+SENDGRID_API_HOST = os.getenv('SENDGRID_API_HOST', 'https://api.sendgrid.com')
+SENDER_EMAIL = os.getenv('SENDGRID_SENDER_EMAIL', 'your-verified-sender@domain.com')
+# SendGrid accepts at most 1000 personalizations per request
+MAX_PERSONALIZATIONS = 1000
+
+# SendGrid substitution tags for per-recipient fields in bulk sends
+NAME_TAG = '-name-'
+UNSUBSCRIBE_TAG = '-unsubscribe_url-'
+
+# Placeholders the shared body is split on; recipient fragments are joined in between
+GREETING_MARKER = '<!--newsletter:greeting-->'
+FOOTER_MARKER = '<!--newsletter:footer-->'
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    On-disk bytecode cache whose directory is created on the first write.
+    If it cannot be written, templates are still compiled, just not cached.
+    """
+    
+    def load_bytecode(self, bucket) -> None:
+        try:
+            super().load_bytecode(bucket)
+        except OSError:
+            pass
+
+    def dump_bytecode(self, bucket) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            print(f"Not caching compiled template {bucket.key}: {e}")
+
+def _create_template_env() -> Environment:
+    """
+    Module-wide Jinja2 environment: templates are parsed and compiled once,
+    and the compiled bytecode is cached on disk across processes
+    """
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        bytecode_cache=TemplateBytecodeCache(TEMPLATE_CACHE_DIR),
+        autoescape=select_autoescape(['html']),
+        auto_reload=False
+    )
+
+template_env = _create_template_env()
+
+class PreparedNewsletter:
+    """
+    A newsletter body rendered once per segment. Personalizing it only
+    renders the small greeting and footer fragments and joins strings.
+    """
+    
+    def __init__(self, head: str, middle: str, tail: str, article_count: int = 0):
+        self.head = head
+        self.middle = middle
+        self.tail = tail
+        # Articles in the body; 0 means it only says there are no updates
+        self.article_count = article_count
+        self._greeting = template_env.get_template('greeting.html')
+        self._footer = template_env.get_template('footer.html')
+    
+    def personalize(self, name: Optional[str] = None, unsubscribe_url: Optional[str] = None) -> str:
+        return ''.join((
+            self.head,
+            self._greeting.render(name=name),
+            self.middle,
+            self._footer.render(unsubscribe_url=unsubscribe_url),
+            self.tail
+        ))
+    
+    def with_substitution_tags(self, include_unsubscribe: Optional[bool] = None) -> str:
+        """
+        Body for a bulk send, with SendGrid substitution tags in place of
+        the recipient's name and unsubscribe link
+        """
+        if include_unsubscribe is None:
+            include_unsubscribe = bool(UNSUBSCRIBE_URL)
+        return self.personalize(NAME_TAG, UNSUBSCRIBE_TAG if include_unsubscribe else None)
+
+@dataclass
+class Recipient:
+    email: str
+    name: Optional[str] = None
+    unsubscribe_url: Optional[str] = None
+    # Sent with the message and echoed back in SendGrid event webhooks
+    custom_args: Dict[str, str] = field(default_factory=dict)
+    
+    def substitutions(self) -> Dict[str, str]:
+        """
+        Values for the substitution tags, escaped since SendGrid inserts them into HTML as-is
+        """
+        return {
+            NAME_TAG: str(escape(self.name or 'there')),
+            UNSUBSCRIBE_TAG: str(escape(self.unsubscribe_url or '')),
+        }
+
+@dataclass
+class DeliveryStatus:
+    email: str
+    delivered: bool
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+
+def unsubscribe_url_for(user_id: str) -> Optional[str]:
+    """
+    Unsubscribe link for a user, or None if UNSUBSCRIBE_URL is not configured
+    """
+    if not UNSUBSCRIBE_URL:
+        return None
+    separator = '&' if '?' in UNSUBSCRIBE_URL else '?'
+    return f"{UNSUBSCRIBE_URL}{separator}{urlencode({'user': user_id})}"
+
+# Markup that marks content as an HTML page rather than extracted text
+HTML_PATTERN = re.compile(r'<\s*(!doctype|html|head|body|article|div|p|h[1-6])\b', re.IGNORECASE)
+# Longest first line of extracted text still taken as its title
+MAX_TITLE_LENGTH = 150
+# Extracted text shorter than this is not worth an entry in the newsletter
+MIN_TEXT_WORDS = 10
+
+def text_article(url: str, text: str) -> Optional[Dict]:
+    """
+    Article dict for already-extracted text (scraped documents, ranked
+    chunks): the first line is the title and the rest the preview
+    """
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    if sum(len(line.split()) for line in lines) < MIN_TEXT_WORDS:
+        return None
+    
+    title = lines[0] if len(lines) > 1 and len(lines[0]) <= MAX_TITLE_LENGTH else ''
+    body = ' '.join(lines[1:] if title else lines)
+    return {
+        'title': title or url,
+        'text': body[:500],  # First 500 chars for preview
+        'summary': '',
+        'keywords': [],
+        'publish_date': None
+    }
+
+def extract_article(url: str, raw_content: str) -> Optional[Dict]:
+    """
+    Run newspaper3k extraction and NLP on already-downloaded content.
+    Plain text is turned into an article directly, since newspaper3k
+    only parses HTML. Module-level so it can run in a worker process.
+    """
+    if not HTML_PATTERN.search(raw_content):
+        return text_article(url, raw_content)
+    
+    # Use newspaper3k to extract article content
+    article = Article(url=url or '')
+    article.download(input_html=raw_content)
+    article.parse()
+    if not article.title and not article.text:
+        return None
+    
+    try:
+        article.nlp()
+    except Exception as e:
+        # Summary and keywords need NLTK data; fall back to the bare article
+        print(f"Skipping article NLP for {url or 'content'}: {e}")
+    
+    return {
+        'title': article.title,
+        'text': article.text[:500],  # First 500 chars for preview
+        'summary': article.summary,
+        'keywords': article.keywords,
+        'publish_date': article.publish_date
+    }
+
+class ArticleCache:
+    """
+    In-memory LRU cache of extracted articles keyed by URL and content hash,
+    so an article shared by many newsletters is extracted only once
+    """
+    
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(url: str, raw_content: str) -> Tuple[str, str]:
+        return url or '', hashlib.sha256(raw_content.encode('utf-8')).hexdigest()
+    
+    def get(self, key: Tuple[str, str]) -> Optional[Dict]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key: Tuple[str, str], article: Dict) -> None:
+        with self._lock:
+            self._entries[key] = article
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+def _extract_article_safely(url: str, raw_content: str) -> Optional[Dict]:
+    try:
+        return extract_article(url, raw_content)
+    except Exception as e:
+        print(f"Error processing content: {e}")
+        return None
+
+# Shared across generators so repeated runs in one process reuse extractions
+article_cache = ArticleCache()
 
 class NewsletterGenerator:
-    def __init__(self, sendgrid_api_key: str):
+    def __init__(self, sendgrid_api_key: str, max_workers: Optional[int] = None,
+                 preference_store: Optional[PreferenceStore] = None):
+        """
+        Args:
+            sendgrid_api_key: SendGrid API key
+            max_workers: Processes used for article extraction; 1 disables
+                the process pool, None uses one per CPU
+            preference_store: Local subscriber preference store; opened at
+                the default path on first use if not given
+        """
         self.sg = SendGridAPIClient(sendgrid_api_key)
+        self.sendgrid_api_key = sendgrid_api_key
+        self._session: Optional[requests.Session] = None
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Render workers on other threads may all ask for the pool at once
+        self._executor_lock = threading.Lock()
+        self._preference_store = preference_store
+        # A store passed in belongs to the caller, who closes it
+        self._owns_preference_store = False
         
-    def process_scraped_content(self, raw_content: str) -> Dict:
+    def process_scraped_content(self, raw_content: str, url: str = '') -> Dict:
         """
         Process scraped content into structured data for the newsletter
         """
         try:
-            # Use newspaper3k to extract article content
-            article = Article(url='')
-            article.download()
-            article.parse()
+            key = ArticleCache.key(url, raw_content)
+            cached = article_cache.get(key)
+            if cached is not None:
+                return cached
             
-            return {
-                'title': article.title,
-                'text': article.text[:500],  # First 500 chars for preview
-                'summary': article.summary,
-                'keywords': article.keywords,
-                'publish_date': article.publish_date
-            }
+            article = extract_article(url, raw_content)
+            if article is not None:
+                article_cache.put(key, article)
+            return article
         except Exception as e:
             print(f"Error processing content: {e}")
             return None
 
-    def generate_newsletter_content(self, sport_preference: str, scraped_data: List[str]) -> str:
+    @metrics.timed('article_extract_seconds')
+    def process_scraped_items(self, scraped_data: List[ScrapedItem]) -> List[Dict]:
         """
-        Generate newsletter HTML content based on sport preference and scraped data
-        """
-        # Basic newsletter template
-        template_str = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>{{ sport }} Newsletter</title>
-        </head>
-        <body>
-            <h1>{{ sport }} News Update</h1>
-            <p>Here are the latest updates in {{ sport }}:</p>
-            
-            {% for article in articles %}
-            <div class="article">
-                <h2>{{ article.title }}</h2>
-                <p>{{ article.summary }}</p>
-                {% if article.keywords %}
-                <p>Topics: {{ article.keywords|join(', ') }}</p>
-                {% endif %}
-            </div>
-            {% endfor %}
-        </body>
-        </html>
+        Process many scraped items, reusing cached extractions and running
+        the remaining ones across a process pool
         """
+        items = [item if isinstance(item, tuple) else ('', item) for item in scraped_data]
+        if self.max_workers == 1 or len(set(items)) <= 1:
+            processed = [self.process_scraped_content(raw_content, url) for url, raw_content in items]
+            return [article for article in processed if article]
         
+        results: List[Optional[Dict]] = [None] * len(items)
+        pending = {}
+        for position, (url, raw_content) in enumerate(items):
+            key = ArticleCache.key(url, raw_content)
+            if key in pending:
+                pending[key].append(position)
+                continue
+            cached = article_cache.get(key)
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending[key] = [position]
+        
+        if pending:
+            keys = list(pending)
+            first_items = [items[pending[key][0]] for key in keys]
+            try:
+                extracted = list(self._get_executor().map(
+                    _extract_article_safely,
+                    [url for url, _ in first_items],
+                    [raw_content for _, raw_content in first_items]
+                ))
+            except Exception as e:
+                print(f"Error extracting articles in process pool: {e}")
+                extracted = [None] * len(keys)
+            for key, article in zip(keys, extracted):
+                if article is not None:
+                    article_cache.put(key, article)
+                for position in pending[key]:
+                    results[position] = article
+        
+        return [article for article in results if article]
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # Spawned, not forked: the process has threads by now, and a fork
+                # could copy a lock some other thread holds
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def close(self) -> None:
+        """
+        Shut down the extraction process pool, the HTTP session and the
+        preference store, if the generator opened it
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        if self._owns_preference_store:
+            self._preference_store.close()
+            self._preference_store = None
+            self._owns_preference_store = False
+
+    @metrics.timed('render_seconds')
+    def prepare_newsletter(self, sport_preference: str, scraped_data: List[ScrapedItem]) -> 'PreparedNewsletter':
+        """
+        Render the shared part of a newsletter once, leaving only the
+        per-recipient greeting and unsubscribe link to fill in
+        """
         # Process all scraped content
-        processed_articles = []
-        for content in scraped_data:
-            if processed := self.process_scraped_content(content):
-                processed_articles.append(processed)
+        processed_articles = self.process_scraped_items(scraped_data)
         
-        # Generate HTML using Jinja2
-        template = Template(template_str)
-        html_content = template.render(
+        # Generate HTML using Jinja2, with markers where recipient fragments go
+        html_content = template_env.get_template('newsletter.html').render(
             sport=sport_preference,
             articles=processed_articles,
-            date=datetime.now().strftime("%Y-%m-%d")
+            date=datetime.now().strftime("%Y-%m-%d"),
+            greeting=Markup(GREETING_MARKER),
+            footer=Markup(FOOTER_MARKER)
         )
-        
-        return html_content
+        head, rest = html_content.split(GREETING_MARKER, 1)
+        middle, tail = rest.split(FOOTER_MARKER, 1)
+        return PreparedNewsletter(head, middle, tail, len(processed_articles))
+
+    def generate_newsletter_content(self, sport_preference: str, scraped_data: List[ScrapedItem]) -> str:
+        """
+        Generate newsletter HTML content based on sport preference and scraped data
+        """
+        return self.prepare_newsletter(sport_preference, scraped_data).personalize()
 
     def send_newsletter(self, recipient_email: str, html_content: str, sport: str) -> bool:
         """
@@ -84,39 +394,139 @@ class NewsletterGenerator:
         """
         try:
             message = Mail(
-                from_email='your-verified-sender@domain.com',
+                from_email=SENDER_EMAIL,
                 to_emails=recipient_email,
                 subject=f'Your {sport} Newsletter Update',
                 html_content=html_content
             )
             
-            response = self.sg.send(message)
+            with metrics.timer('sendgrid_seconds'):
+                response = self.sg.send(message)
+            metrics.incr('sendgrid_responses', status=response.status_code)
             return response.status_code == 202
             
         except Exception as e:
             print(f"Error sending newsletter: {e}")
             return False
 
+    @property
+    def session(self) -> requests.Session:
+        """
+        Pooled HTTP session reused across bulk send requests
+        """
+        if self._session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.headers.update({
+                'Authorization': f'Bearer {self.sendgrid_api_key}',
+                'Content-Type': 'application/json'
+            })
+            self._session = session
+        return self._session
+
+    def build_bulk_messages(self, recipients: List[Recipient], html_content: str, subject: str,
+                            batch_size: int = MAX_PERSONALIZATIONS) -> List[Tuple[List[Recipient], Dict]]:
+        """
+        Pack recipients sharing a body into SendGrid mail/send payloads of
+        up to `batch_size` personalizations each
+        
+        Returns:
+            (recipients in the batch, JSON payload) per request
+        """
+        batch_size = min(batch_size, MAX_PERSONALIZATIONS)
+        messages = []
+        for start in range(0, len(recipients), batch_size):
+            batch = recipients[start:start + batch_size]
+            message = Mail(from_email=SENDER_EMAIL, subject=subject, html_content=html_content)
+            for recipient in batch:
+                personalization = Personalization()
+                personalization.add_to(To(recipient.email, recipient.name))
+                for tag, value in recipient.substitutions().items():
+                    personalization.add_substitution(Substitution(tag, value))
+                for key, value in recipient.custom_args.items():
+                    personalization.add_custom_arg(CustomArg(key, value))
+                # Append, so personalizations keep the order of `recipients`
+                message.add_personalization(personalization, index=len(message.personalizations or []))
+            messages.append((batch, message.get()))
+        return messages
+
+    def send_bulk(self, recipients: List[Recipient], html_content: str, subject: str,
+                  batch_size: int = MAX_PERSONALIZATIONS) -> List[DeliveryStatus]:
+        """
+        Send one body to many recipients, packing up to `batch_size`
+        personalizations into each SendGrid request
+        
+        Args:
+            recipients: Recipients and their per-user substitution values
+            html_content: Shared body, see PreparedNewsletter.with_substitution_tags
+            subject: Email subject
+            batch_size: Personalizations per request, at most 1000
+        
+        Returns:
+            Delivery status for each recipient, in order
+        """
+        statuses = []
+        for batch, payload in self.build_bulk_messages(recipients, html_content, subject, batch_size):
+            try:
+                with metrics.timer('sendgrid_seconds'):
+                    response = self.session.post(
+                        f"{SENDGRID_API_HOST}/v3/mail/send",
+                        json=payload,
+                        timeout=30
+                    )
+                metrics.incr('sendgrid_responses', status=response.status_code)
+                metrics.incr('sendgrid_recipients', len(batch))
+                delivered = response.status_code == 202
+                error = None if delivered else response.text[:500]
+                status_code = response.status_code
+            except requests.exceptions.RequestException as e:
+                print(f"Error sending newsletter batch: {e}")
+                delivered, status_code, error = False, None, str(e)
+            
+            statuses.extend(
+                DeliveryStatus(recipient.email, delivered, status_code, error) for recipient in batch
+            )
+        return statuses
+
+    @property
+    def preference_store(self) -> PreferenceStore:
+        """
+        Local preference store, migrating the legacy JSON file the first time
+        """
+        if self._preference_store is None:
+            self._preference_store = PreferenceStore()
+            self._owns_preference_store = True
+            self._preference_store.migrate_from_json(LEGACY_JSON_PATH)
+        return self._preference_store
+
     def save_subscriber_preference(self, email: str, sport_preference: str) -> None:
         """
-        Save subscriber preferences to a JSON file
+        Save a subscriber's sport preference to the local preference store
         """
         try:
-            preferences = {}
-            if os.path.exists('subscriber_preferences.json'):
-                with open('subscriber_preferences.json', 'r') as f:
-                    preferences = json.load(f)
-            
-            preferences[email] = sport_preference
-            
-            with open('subscriber_preferences.json', 'w') as f:
-                json.dump(preferences, f)
-                
+            self.preference_store.upsert(email, sport_preference)
+        except Exception as e:
+            print(f"Error saving preferences: {e}")
+
+    def save_subscriber_preferences(self, preferences: Dict[str, str]) -> None:
+        """
+        Save many {email: sport} preferences in one batched write
+        """
+        try:
+            self.preference_store.upsert_many(preferences.items())
         except Exception as e:
             print(f"Error saving preferences: {e}")
 
-# Usage example:
+# Usage example; `python -m src.run_newsletter` runs the full pipeline for all due subscribers
 if __name__ == "__main__":
+    try:
+        from src.gen_urls import generate_urls_from_query
+        from src.scraper import scrape_and_add_dynamic
+    except ImportError:  # running as a script from inside src/
+        from gen_urls import generate_urls_from_query
+        from scraper import scrape_and_add_dynamic
+    
     # Initialize the newsletter generator
     SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
     newsletter_gen = NewsletterGenerator(SENDGRID_API_KEY)
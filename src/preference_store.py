@@ -0,0 +1,130 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.getenv('PREFERENCE_STORE_PATH', os.path.join('.cache', 'preferences.sqlite'))
+LEGACY_JSON_PATH = 'subscriber_preferences.json'
+
+class PreferenceStore:
+    """
+    Local subscriber preference store backed by SQLite in WAL mode.
+
+    One row per email, with an index on sport so subscribers for a sport
+    can be looked up without scanning. Writes are single upserts or
+    batched in one transaction, instead of rewriting a whole JSON file.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS subscriber_preferences (
+                email TEXT PRIMARY KEY,
+                sport TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_subscriber_preferences_sport '
+            'ON subscriber_preferences (sport)'
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                name TEXT PRIMARY KEY,
+                applied_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def upsert(self, email: str, sport: str) -> None:
+        self.upsert_many([(email, sport)])
+
+    def upsert_many(self, preferences: Iterable[Tuple[str, str]]) -> int:
+        """
+        Insert or update many (email, sport) pairs in a single transaction
+
+        Returns:
+            Number of rows written
+        """
+        now = time.time()
+        rows = [(email, sport, now) for email, sport in preferences]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO subscriber_preferences (email, sport, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(email) DO UPDATE SET sport = excluded.sport, updated_at = excluded.updated_at',
+                rows
+            )
+        return len(rows)
+
+    def get(self, email: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT sport FROM subscriber_preferences WHERE email = ?', (email,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def emails_for_sport(self, sport: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT email FROM subscriber_preferences WHERE sport = ? ORDER BY email', (sport,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def all(self) -> Dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT email, sport FROM subscriber_preferences').fetchall()
+        return dict(rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM subscriber_preferences').fetchone()[0]
+
+    def migrate_from_json(self, json_path: str = LEGACY_JSON_PATH) -> int:
+        """
+        One-shot import of the legacy {email: sport} JSON file. The migration
+        is recorded in the store, so later calls are no-ops even if the file
+        is still there; entries already in the store are not overwritten.
+
+        Returns:
+            Number of preferences imported
+        """
+        with self._lock:
+            done = self._conn.execute(
+                'SELECT 1 FROM migrations WHERE name = ?', (json_path,)
+            ).fetchone()
+        if done or not os.path.exists(json_path):
+            return 0
+
+        with open(json_path, 'r') as f:
+            preferences = json.load(f)
+
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                'INSERT OR IGNORE INTO subscriber_preferences (email, sport, updated_at) VALUES (?, ?, ?)',
+                [(email, sport, now) for email, sport in preferences.items()]
+            )
+            self._conn.execute(
+                'INSERT INTO migrations (name, applied_at) VALUES (?, ?)', (json_path, now)
+            )
+        logger.info(f"Migrated {cursor.rowcount} preferences from {json_path}")
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,143 @@
+# Ranks indexed articles per sport and collapses near-duplicate stories.
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+import logging
+import os
+import numpy as np
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+logger = logging.getLogger(__name__)
+
+# Candidates retrieved from the index per sport, before deduplication
+DEFAULT_TOP_K = int(os.getenv('RANKING_TOP_K', '20'))
+# Articles kept per sport after deduplication
+DEFAULT_MAX_ARTICLES = int(os.getenv('RANKING_MAX_ARTICLES', '5'))
+# Cosine similarity to the sport query below which an article is not about the sport
+DEFAULT_MIN_SCORE = float(os.getenv('RANKING_MIN_SCORE', '0.2'))
+# Cosine similarity above which two articles count as the same story
+DEFAULT_DUPLICATE_THRESHOLD = float(os.getenv('RANKING_DUPLICATE_THRESHOLD', '0.92'))
+
+@dataclass
+class RankedArticle:
+    url: str
+    text: str
+    score: float
+
+def collapse_near_duplicates(embeddings: np.ndarray, threshold: float = DEFAULT_DUPLICATE_THRESHOLD) -> List[int]:
+    """
+    Greedily keep rows that are not near-duplicates of an earlier kept row.
+
+    Args:
+        embeddings (np.ndarray): One embedding per row, best-ranked first
+        threshold (float): Cosine similarity at or above which rows are duplicates
+
+    Returns:
+        List[int]: Indices of the rows to keep, in order
+    """
+    if len(embeddings) == 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    similarity = vectors @ vectors.T
+
+    kept: List[int] = []
+    for i in range(len(vectors)):
+        if not kept or similarity[i, kept].max() < threshold:
+            kept.append(i)
+    return kept
+
+def _node_embeddings(index: VectorStoreIndex, nodes: List[NodeWithScore]) -> np.ndarray:
+    """
+    Stored embeddings of the retrieved nodes, re-embedding any the vector
+    store cannot return (embedding lookups hit the embedding cache)
+    """
+    embeddings = []
+    missing = []
+    for i, result in enumerate(nodes):
+        embedding = result.node.embedding
+        if embedding is None:
+            try:
+                embedding = index.vector_store.get(result.node.node_id)
+            except Exception:
+                embedding = None
+        if embedding is None:
+            missing.append(i)
+        embeddings.append(embedding)
+    if missing:
+        texts = [nodes[i].node.get_content() for i in missing]
+        for i, embedding in zip(missing, Settings.embed_model.get_text_embedding_batch(texts)):
+            embeddings[i] = embedding
+    return np.asarray(embeddings, dtype=np.float32)
+
+def rank_articles(sport: str,
+                  index: Optional[VectorStoreIndex] = None,
+                  urls: Optional[Iterable[str]] = None,
+                  top_k: int = DEFAULT_TOP_K,
+                  max_articles: int = DEFAULT_MAX_ARTICLES,
+                  threshold: float = DEFAULT_DUPLICATE_THRESHOLD,
+                  min_score: float = DEFAULT_MIN_SCORE) -> List[RankedArticle]:
+    """
+    Retrieve the articles most relevant to a sport and drop near-duplicates.
+
+    Retrieval from the scraper's SimpleVectorStore is a brute-force scan,
+    so it costs time linear in the number of indexed chunks. Only the top_k
+    retrieved candidates are compared with each other, so deduplication
+    does not grow with the size of the index.
+
+    Args:
+        sport (str): Sport to rank articles for
+        index (Optional[VectorStoreIndex]): Index to query, defaults to the scraper's
+        urls (Optional[Iterable[str]]): Only rank articles from these URLs, e.g. the sport's sources
+        top_k (int): Candidates to retrieve from the index
+        max_articles (int): Articles to return
+        threshold (float): Cosine similarity at which articles are duplicates
+        min_score (float): Cosine similarity to the query below which articles are dropped
+
+    Returns:
+        List[RankedArticle]: Distinct articles, most relevant first
+    """
+    if index is None:
+        try:
+            from src import scraper
+        except ImportError:  # running as a script from inside src/
+            import scraper
+        index = scraper.get_index()
+    if index is None or not sport:
+        return []
+    filters = None
+    if urls is not None:
+        urls = list(urls)
+        if not urls:
+            return []
+        filters = MetadataFilters(filters=[MetadataFilter(key='url', value=urls, operator=FilterOperator.IN)])
+
+    results = index.as_retriever(similarity_top_k=top_k, filters=filters).retrieve(f"{sport} news")
+
+    # A page is split into several chunks; keep its best-scoring one
+    best_by_url = {}
+    for result in sorted(results, key=lambda r: r.score or 0.0, reverse=True):
+        if (result.score or 0.0) < min_score:
+            break
+        url = result.node.metadata.get('url') or result.node.ref_doc_id
+        best_by_url.setdefault(url, result)
+    candidates = list(best_by_url.values())
+    if not candidates:
+        return []
+
+    kept = collapse_near_duplicates(_node_embeddings(index, candidates), threshold)
+    logger.info(f"Ranked {len(candidates)} {sport} articles, dropped {len(candidates) - len(kept)} near-duplicates")
+    ranked_urls = list(best_by_url)
+    return [
+        RankedArticle(ranked_urls[i], candidates[i].node.get_content(), candidates[i].score or 0.0)
+        for i in kept[:max_articles]
+    ]
+
+def ranked_content(sport: str, **kwargs) -> List[Tuple[str, str]]:
+    """
+    rank_articles as (url, text) items ready for the newsletter generator
+    """
+    return [(article.url, article.text) for article in rank_articles(sport, **kwargs)]
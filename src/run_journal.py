@@ -0,0 +1,227 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from src.extract_user_information import UserPreference
+except ImportError:  # running as a script from inside src/
+    from extract_user_information import UserPreference
+
+DEFAULT_JOURNAL_PATH = os.getenv('RUN_JOURNAL_PATH', os.path.join('.cache', 'runs.sqlite'))
+
+# Recipient states, in the order a recipient moves through them
+QUEUED = 'queued'
+RENDERED = 'rendered'
+SENDING = 'sending'  # Handed to SendGrid, outcome not yet recorded
+SENT = 'sent'
+FAILED = 'failed'
+
+# States a resumed run picks up again. SENDING is left alone: the request
+# may have gone through, and re-sending could deliver the email twice.
+RETRYABLE_STATES = (QUEUED, RENDERED, FAILED)
+
+def idempotency_key(run_id: str, user_id: str) -> str:
+    """
+    Stable key for one recipient's email in one run
+    """
+    return hashlib.sha256(f"{run_id}:{user_id}".encode('utf-8')).hexdigest()
+
+class RunJournal:
+    """
+    Per-run record of every recipient's state, in SQLite (WAL mode).
+
+    Subscribers are journaled as they are loaded, so a resumed run can
+    pick up the recipients that were not sent without querying Firestore
+    again, as long as the original run finished loading.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                frequency TEXT NOT NULL,
+                loaded INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recipients (
+                run_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                subscriber TEXT NOT NULL,
+                state TEXT NOT NULL,
+                idempotency_key TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, user_id)
+            )
+        """)
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_recipients_state ON recipients (run_id, state)'
+        )
+        self._conn.commit()
+
+    def start_run(self, run_id: str, frequency: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO runs (run_id, frequency, created_at) VALUES (?, ?, ?)',
+                (run_id, frequency, time.time())
+            )
+
+    def latest_run_id(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT run_id FROM runs ORDER BY created_at DESC, rowid DESC LIMIT 1'
+            ).fetchone()
+        return row[0] if row else None
+
+    def run_frequency(self, run_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT frequency FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def mark_loaded(self, run_id: str) -> None:
+        """
+        Record that every due subscriber of the run has been journaled
+        """
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE runs SET loaded = 1 WHERE run_id = ?', (run_id,))
+
+    def is_loaded(self, run_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute('SELECT loaded FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return bool(row and row[0])
+
+    def record_queued(self, run_id: str, subscribers: Iterable[UserPreference]) -> None:
+        """
+        Journal loaded subscribers; ones already journaled keep their state
+        """
+        now = time.time()
+        rows = [
+            (run_id, s.user_id, json.dumps(_subscriber_to_dict(s)), QUEUED, idempotency_key(run_id, s.user_id), now)
+            for s in subscribers
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO recipients '
+                '(run_id, user_id, subscriber, state, idempotency_key, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def set_state(self, run_id: str, user_ids: Iterable[str], state: str, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE recipients SET state = ?, error = ?, updated_at = ? WHERE run_id = ? AND user_id = ?',
+                [(state, error, now, run_id, user_id) for user_id in user_ids]
+            )
+
+    def states(self, run_id: str, user_ids: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """
+        Current state per journaled user, optionally only for some users
+        """
+        if user_ids is None:
+            with self._lock:
+                return dict(self._conn.execute(
+                    'SELECT user_id, state FROM recipients WHERE run_id = ?', (run_id,)
+                ).fetchall())
+        user_ids = list(user_ids)
+        states = {}
+        with self._lock:
+            # Looked up by primary key, staying well below SQLite's bound-parameter limit
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                states.update(self._conn.execute(
+                    f'SELECT user_id, state FROM recipients WHERE run_id = ? AND user_id IN ({placeholders})',
+                    [run_id, *chunk]
+                ).fetchall())
+        return states
+
+    def user_ids(self, run_id: str, state: str) -> List[str]:
+        """
+        Journaled users in a state, in the order they were loaded
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id FROM recipients WHERE run_id = ? AND state = ? ORDER BY rowid', (run_id, state)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def release_in_doubt(self, run_id: str) -> int:
+        """
+        Mark recipients whose send was never confirmed as failed, so the
+        next resume sends to them again. Only do this once the provider's
+        activity log shows their email did not go out.
+
+        Returns:
+            Recipients released
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'UPDATE recipients SET state = ?, error = ?, updated_at = ? WHERE run_id = ? AND state = ?',
+                (FAILED, 'in doubt, released for retry', time.time(), run_id, SENDING)
+            )
+        return cursor.rowcount
+
+    def pending_subscribers(self, run_id: str) -> List[UserPreference]:
+        """
+        Journaled subscribers that still need their newsletter
+        """
+        placeholders = ', '.join('?' for _ in RETRYABLE_STATES)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT subscriber FROM recipients WHERE run_id = ? AND state IN ({placeholders}) '
+                'ORDER BY rowid',
+                (run_id, *RETRYABLE_STATES)
+            ).fetchall()
+        return [_subscriber_from_dict(json.loads(row[0])) for row in rows]
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT state, COUNT(*) FROM recipients WHERE run_id = ? GROUP BY state', (run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def _subscriber_to_dict(subscriber: UserPreference) -> Dict:
+    last_sent = subscriber.last_newsletter_sent
+    return {
+        'user_id': subscriber.user_id,
+        'email': subscriber.email,
+        'name': subscriber.name,
+        'sport_preferences': list(subscriber.sport_preferences),
+        'notification_frequency': subscriber.notification_frequency,
+        'last_newsletter_sent': last_sent.isoformat() if hasattr(last_sent, 'isoformat') else None,
+        'is_active': subscriber.is_active,
+    }
+
+def _subscriber_from_dict(data: Dict) -> UserPreference:
+    last_sent = data.get('last_newsletter_sent')
+    return UserPreference(
+        user_id=data['user_id'],
+        email=data['email'],
+        name=data['name'],
+        sport_preferences=data['sport_preferences'],
+        notification_frequency=data['notification_frequency'],
+        last_newsletter_sent=datetime.fromisoformat(last_sent) if last_sent else None,
+        is_active=data['is_active']
+    )
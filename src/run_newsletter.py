@@ -0,0 +1,577 @@
+# End-to-end newsletter run: load due subscribers, fetch and render content, send.
+#
+#   python -m src.run_newsletter --frequency weekly
+#   python -m src.run_newsletter --dry-run --outbox outbox/
+#   python -m src.run_newsletter --resume          # pick up the last run where it stopped
+#   python -m src.run_newsletter --metrics run.prom # per-stage timings, or run.json
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+import threading
+import time
+
+try:
+    from src.extract_user_information import DEFAULT_PAGE_SIZE, FirebaseManager, UserPreference
+    from src.metrics import metrics
+    from src.newsletter import (MAX_PERSONALIZATIONS, DeliveryStatus, NewsletterGenerator, PreparedNewsletter,
+                                Recipient, ScrapedItem, unsubscribe_url_for)
+    from src.run_journal import (DEFAULT_JOURNAL_PATH, FAILED, RENDERED, RETRYABLE_STATES, SENDING, SENT,
+                                 RunJournal, idempotency_key)
+    from src.send_queue import SendGridSender, SendJob, SendQueue
+    from src.scrape_plan import ScrapePlan
+    from src.segments import SegmentKey, segment_key, segment_label
+except ImportError:  # running as a script from inside src/
+    from extract_user_information import DEFAULT_PAGE_SIZE, FirebaseManager, UserPreference
+    from metrics import metrics
+    from newsletter import (MAX_PERSONALIZATIONS, DeliveryStatus, NewsletterGenerator, PreparedNewsletter,
+                            Recipient, ScrapedItem, unsubscribe_url_for)
+    from run_journal import (DEFAULT_JOURNAL_PATH, FAILED, RENDERED, RETRYABLE_STATES, SENDING, SENT,
+                             RunJournal, idempotency_key)
+    from send_queue import SendGridSender, SendJob, SendQueue
+    from scrape_plan import ScrapePlan
+    from segments import SegmentKey, segment_key, segment_label
+
+# Subscribers buffered between stages before the producer waits
+DEFAULT_QUEUE_SIZE = int(os.getenv('RUN_QUEUE_SIZE', '200'))
+DEFAULT_RENDER_WORKERS = int(os.getenv('RUN_RENDER_WORKERS', '4'))
+# Rendered recipients held for batching, across segments, before the largest batch is sent early
+DEFAULT_MAX_PENDING = int(os.getenv('RUN_MAX_PENDING', str(MAX_PERSONALIZATIONS)))
+# Seconds a partial batch waits for more recipients of its segment before it is sent anyway
+DEFAULT_FLUSH_SECONDS = float(os.getenv('RUN_SEND_FLUSH_SECONDS', '5'))
+
+@dataclass
+class RunReport:
+    run_id: str = ''
+    subscribers: int = 0
+    segments: int = 0
+    sports_fetched: int = 0
+    renders: int = 0
+    renders_avoided: int = 0  # Per-recipient, per-sport renders that were not needed
+    urls_scraped: int = 0
+    fetches_saved: int = 0  # Page fetches avoided by scraping each URL once per run
+    sends: int = 0  # Bulk send requests
+    sent: int = 0
+    failed: int = 0
+    failed_user_ids: List[str] = field(default_factory=list)
+    stopped_early: bool = False
+    skipped: int = 0   # Resumed run: recipients already handled by an earlier attempt
+    in_doubt: int = 0  # Resumed run: sends whose outcome was never recorded, not retried
+    in_doubt_user_ids: List[str] = field(default_factory=list)
+    # Sent, but the last-sent timestamp could not be saved: these may be due again next run
+    unrecorded_user_ids: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+class EmptyNewsletterError(Exception):
+    """A segment's newsletter has no articles to send"""
+
+def new_run_id(frequency: str) -> str:
+    return f"{frequency}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
+
+@dataclass
+class _SendItem:
+    subscriber: UserPreference
+    key: SegmentKey
+    prepared: PreparedNewsletter
+
+class SportContentFetcher:
+    """
+    Default content source: adds each sport to the run's scrape plan as it
+    comes up, scrapes only the URLs the plan has not scraped yet, then
+    ranks the sport's articles
+    """
+
+    def __init__(self, scrape: Optional[Callable[[List[str]], list]] = None):
+        """
+        Args:
+            scrape: Takes a list of URLs and returns documents; defaults to
+                scraping into the shared index
+        """
+        self.plan = ScrapePlan()
+        self.scrape = scrape
+        # The scraper updates a module-level index, so scrapes run one at a time
+        self._lock = threading.Lock()
+
+    def __call__(self, sport: str) -> List[ScrapedItem]:
+        try:
+            from src.ranking import ranked_content
+        except ImportError:  # running as a script from inside src/
+            from ranking import ranked_content
+
+        with self._lock:
+            urls = self.plan.add_sport(sport)
+            self.plan.execute(self.scrape)
+        return ranked_content(sport, urls=urls) or self.plan.content_for(sport)
+
+    def reset(self) -> None:
+        """
+        Start a new plan, so the next run scrapes fresh pages
+        """
+        with self._lock:
+            self.plan = ScrapePlan()
+
+    def close(self) -> None:
+        """
+        Shut down the scraper's embedding workers
+        """
+        try:
+            from src.scraper import close_embedding_pipeline
+        except ImportError:  # running as a script from inside src/
+            from scraper import close_embedding_pipeline
+        close_embedding_pipeline()
+
+class NewsletterRun:
+    """
+    Runs the newsletter as a pipeline of concurrent stages joined by
+    bounded queues, so loading subscribers, fetching and rendering content,
+    and sending all overlap:
+
+        load -> [subscribers] -> render workers -> [rendered] -> send
+
+    A full queue makes the stage feeding it wait (backpressure). Each
+    sport is fetched and each segment rendered once per run. stop() stops
+    loading new subscribers and lets the ones already loaded finish.
+
+    With a journal, every recipient's progress is checkpointed so an
+    interrupted run can be resumed under the same run_id: recipients
+    already sent are skipped, and if the first attempt finished loading,
+    the rest come from the journal instead of Firestore.
+    """
+
+    def __init__(self, subscriber_source: FirebaseManager,
+                 newsletter_generator: NewsletterGenerator,
+                 fetch_content: Optional[Callable[[str], List[ScrapedItem]]] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 render_workers: int = DEFAULT_RENDER_WORKERS,
+                 send_batch_size: int = MAX_PERSONALIZATIONS,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 flush_after: float = DEFAULT_FLUSH_SECONDS,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 journal: Optional[RunJournal] = None,
+                 run_id: Optional[str] = None,
+                 resume: bool = False,
+                 send_queue: Optional[SendQueue] = None):
+        """
+        Args:
+            subscriber_source: FirebaseManager, or anything with its
+                iter_users_due_for_newsletter and update_last_sent_timestamps
+            newsletter_generator: Renders and sends the newsletters
+            fetch_content: Scraped content for a sport; defaults to a
+                SportContentFetcher. A SportContentFetcher starts a new
+                scrape plan every run
+            queue_size: Capacity of each queue between stages
+            render_workers: Subscribers resolved to a rendered segment concurrently
+            send_batch_size: Recipients per bulk send
+            max_pending: Recipients waiting to fill batches, across all
+                segments; beyond this the largest batch is sent early
+            flush_after: Seconds a partial batch waits before it is sent
+            page_size: Subscribers read from Firestore per page
+            journal: Checkpoints each recipient's state, if given
+            run_id: Identifies the run in the journal and in idempotency keys,
+                defaults to the frequency and start time
+            resume: Continue run_id from its journal instead of starting fresh
+            send_queue: Sends the bulk payloads with rate limiting, retries
+                and dead-lettering; without one, the generator's send_bulk
+                sends them
+        """
+        self.subscriber_source = subscriber_source
+        self.newsletter_generator = newsletter_generator
+        self.fetch_content = fetch_content
+        self.queue_size = queue_size
+        self.render_workers = render_workers
+        self.send_batch_size = send_batch_size
+        self.max_pending = max_pending
+        self.flush_after = flush_after
+        self.page_size = page_size
+        self.journal = journal
+        self.run_id = run_id
+        self._requested_run_id = run_id
+        self.resume = resume
+        self.send_queue = send_queue
+        self._job_ids = itertools.count()
+        self._stopping = asyncio.Event()
+        self._start_run()
+
+    def _start_run(self) -> None:
+        """
+        Fresh per-run state, so a second run() fetches and renders again
+        """
+        self.report = RunReport()
+        self._fetch_content = self.fetch_content or SportContentFetcher()
+        if isinstance(self._fetch_content, SportContentFetcher):
+            self._fetch_content.reset()
+        self._content: Dict[str, asyncio.Future] = {}
+        self._rendered: Dict[SegmentKey, asyncio.Future] = {}
+        self._followers: Dict[str, int] = {}  # Subscribers rendered per sport, for the fetch stats
+
+    def stop(self) -> None:
+        """
+        Stop loading subscribers; those already loaded are still sent
+        """
+        if not self._stopping.is_set():
+            print("Stopping: finishing subscribers already in the pipeline")
+            self._stopping.set()
+
+    def _content_for(self, sport: str) -> asyncio.Future:
+        if sport not in self._content:
+            self.report.sports_fetched += 1
+            self._content[sport] = asyncio.ensure_future(asyncio.to_thread(self._fetch, sport))
+        return self._content[sport]
+
+    def _fetch(self, sport: str) -> List[ScrapedItem]:
+        with metrics.timer('content_fetch_seconds'):
+            return self._fetch_content(sport)
+
+    async def _render(self, key: SegmentKey) -> PreparedNewsletter:
+        contents = await asyncio.gather(*(self._content_for(sport) for sport in key or ('',)))
+        scraped_data = [item for content in contents for item in content]
+        prepared = await asyncio.to_thread(
+            self.newsletter_generator.prepare_newsletter, segment_label(key), scraped_data
+        )
+        self.report.renders += 1
+        if not prepared.article_count:
+            # Nothing was scraped or extracted: better no email than an empty one
+            raise EmptyNewsletterError(f"no articles for {segment_label(key)}")
+        return prepared
+
+    def _rendered_for(self, key: SegmentKey) -> asyncio.Future:
+        if key not in self._rendered:
+            self.report.segments += 1
+            self._rendered[key] = asyncio.ensure_future(self._render(key))
+        return self._rendered[key]
+
+    def _checkpoint(self, user_ids: List[str], state: str, error: Optional[str] = None) -> None:
+        if self.journal is not None:
+            self.journal.set_state(self.run_id, user_ids, state, error)
+
+    async def _journaled_pages(self) -> AsyncIterator[List[UserPreference]]:
+        pending = self.journal.pending_subscribers(self.run_id)
+        for start in range(0, len(pending), self.page_size):
+            yield pending[start:start + self.page_size]
+
+    def _unfinished(self, page: List[UserPreference]) -> List[UserPreference]:
+        """
+        Journal a loaded page and drop recipients an earlier attempt already handled
+        """
+        if self.journal is None:
+            return page
+        self.journal.record_queued(self.run_id, page)
+        if not self.resume:
+            return page
+        states = self.journal.states(self.run_id, [s.user_id for s in page])
+        return [s for s in page if states.get(s.user_id) in RETRYABLE_STATES]
+
+    async def _load(self, frequency: str, subscribers: asyncio.Queue) -> None:
+        if self.resume and self.journal is not None and self.journal.is_loaded(self.run_id):
+            pages = self._journaled_pages()
+        else:
+            pages = self.subscriber_source.iter_users_due_for_newsletter(frequency, page_size=self.page_size)
+        try:
+            async for page in pages:
+                for subscriber in self._unfinished(page):
+                    if self._stopping.is_set():
+                        break
+                    self.report.subscribers += 1
+                    await subscribers.put(subscriber)
+                if self._stopping.is_set():
+                    self.report.stopped_early = True
+                    break
+            else:
+                if self.journal is not None:
+                    self.journal.mark_loaded(self.run_id)
+        except Exception as e:
+            # Whoever was loaded before the error still gets their newsletter
+            print(f"Error loading subscribers, finishing the ones already loaded: {e}")
+            self.report.stopped_early = True
+        # One end-of-stream marker per render worker
+        for _ in range(self.render_workers):
+            await subscribers.put(None)
+
+    async def _render_worker(self, subscribers: asyncio.Queue, rendered: asyncio.Queue) -> None:
+        while True:
+            subscriber = await subscribers.get()
+            if subscriber is None:
+                break
+            key = segment_key(subscriber.sport_preferences)
+            for sport in key or ('',):
+                self._followers[sport] = self._followers.get(sport, 0) + 1
+            try:
+                prepared = await self._rendered_for(key)
+            except Exception as e:
+                print(f"Error rendering {segment_label(key)} newsletter: {e}")
+                self._record_failure(subscriber, e)
+                continue
+            self._checkpoint([subscriber.user_id], RENDERED)
+            await rendered.put(_SendItem(subscriber, key, prepared))
+        await rendered.put(None)
+
+    async def _send(self, rendered: asyncio.Queue) -> None:
+        """
+        Batch rendered recipients per segment. A batch is sent when it is
+        full, when its first recipient has waited flush_after seconds, or,
+        largest first, when more than max_pending recipients are waiting,
+        so sending keeps pace with loading instead of waiting for the end
+        """
+        pending: Dict[SegmentKey, List[_SendItem]] = {}
+        started: Dict[SegmentKey, float] = {}  # When each pending batch got its first recipient
+        pending_count = 0
+        finished_workers = 0
+        while finished_workers < self.render_workers:
+            timeout = None
+            if started:
+                timeout = max(min(started.values()) + self.flush_after - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(rendered.get(), timeout)
+            except asyncio.TimeoutError:
+                item = False  # A batch is due
+            if item is None:
+                finished_workers += 1
+            elif item:
+                if item.key not in pending:
+                    started[item.key] = time.monotonic()
+                pending.setdefault(item.key, []).append(item)
+                pending_count += 1
+
+            now = time.monotonic()
+            due = [key for key, batch in pending.items()
+                   if len(batch) >= self.send_batch_size or now - started[key] >= self.flush_after]
+            while pending_count - sum(len(pending[key]) for key in due) > self.max_pending:
+                due.append(max((key for key in pending if key not in due), key=lambda key: len(pending[key])))
+            for key in due:
+                batch = pending.pop(key)
+                del started[key]
+                pending_count -= len(batch)
+                await self._flush(batch)
+        for batch in pending.values():
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[_SendItem]) -> None:
+        """
+        One bulk send for recipients of the same segment, then record who got it
+        """
+        prepared, key = batch[0].prepared, batch[0].key
+        recipients = [
+            Recipient(item.subscriber.email, item.subscriber.name, unsubscribe_url_for(item.subscriber.user_id),
+                      custom_args={'run_id': self.run_id,
+                                   'idempotency_key': idempotency_key(self.run_id, item.subscriber.user_id)})
+            for item in batch
+        ]
+        # Checkpointed before the request: if the run dies mid-send, a resumed
+        # run treats these recipients as in doubt rather than sending again
+        self._checkpoint([item.subscriber.user_id for item in batch], SENDING)
+        try:
+            statuses = await self._deliver(recipients, prepared.with_substitution_tags(),
+                                           f'Your {segment_label(key)} Newsletter Update')
+        except Exception as e:
+            print(f"Error sending {segment_label(key)} newsletter: {e}")
+            for item in batch:
+                self._record_failure(item.subscriber, e)
+            return
+        self.report.sends += 1
+
+        delivered = {}
+        for item, status in zip(batch, statuses):
+            if status.delivered:
+                self.report.sent += 1
+                delivered[item.subscriber.user_id] = item.subscriber.notification_frequency
+            else:
+                self._record_failure(item.subscriber, status.error or f"status {status.status_code}")
+        self._checkpoint(list(delivered), SENT)
+        if delivered:
+            try:
+                saved = await self.subscriber_source.update_last_sent_timestamps(list(delivered),
+                                                                                 frequencies=delivered)
+            except Exception as e:
+                print(f"Error saving last-sent timestamps: {e}")
+                saved = {}
+            # None: the subscriber's preferences were deleted, so there is nothing to record
+            unrecorded = [user_id for user_id in delivered if saved.get(user_id, False) is False]
+            if unrecorded:
+                self.report.unrecorded_user_ids.extend(unrecorded)
+                self._checkpoint(unrecorded, SENT, 'last-sent timestamp not saved')
+
+    async def _deliver(self, recipients: List[Recipient], html_content: str, subject: str) -> List[DeliveryStatus]:
+        if self.send_queue is None:
+            return await asyncio.to_thread(self.newsletter_generator.send_bulk, recipients, html_content, subject)
+        messages = self.newsletter_generator.build_bulk_messages(recipients, html_content, subject,
+                                                                 self.send_batch_size)
+        jobs = [SendJob(f"{self.run_id}-{next(self._job_ids)}", payload, [r.email for r in batch])
+                for batch, payload in messages]
+        results = {result.job_id: result for result in await self.send_queue.run(jobs)}
+        return [
+            DeliveryStatus(email, results[job.job_id].delivered, results[job.job_id].status_code,
+                           results[job.job_id].error)
+            for job in jobs for email in job.recipients
+        ]
+
+    def _record_failure(self, subscriber: UserPreference, error: object) -> None:
+        self.report.failed += 1
+        self.report.failed_user_ids.append(subscriber.user_id)
+        self._checkpoint([subscriber.user_id], FAILED, str(error))
+
+    def _count_savings(self) -> None:
+        """
+        Work saved compared with rendering and scraping each subscriber's sports separately
+        """
+        self.report.renders_avoided = sum(self._followers.values()) - self.report.renders
+        if isinstance(self._fetch_content, SportContentFetcher):
+            stats = self._fetch_content.plan.count_requests(self._followers)
+            self.report.urls_scraped = len(self._fetch_content.plan.scraped_urls)
+            self.report.fetches_saved = stats.fetches_saved
+
+    async def run(self, frequency: str) -> RunReport:
+        """
+        Send every due newsletter for a frequency
+
+        Args:
+            frequency: 'daily', 'weekly' or 'monthly'
+        """
+        start = time.perf_counter()
+        self._start_run()
+        self.run_id = self._requested_run_id or new_run_id(frequency)
+        self.report.run_id = self.run_id
+        if self.journal is not None:
+            self.journal.start_run(self.run_id, frequency)
+            if self.resume:
+                counts = self.journal.counts(self.run_id)
+                self.report.in_doubt_user_ids = self.journal.user_ids(self.run_id, SENDING)
+                self.report.in_doubt = len(self.report.in_doubt_user_ids)
+                self.report.skipped = counts.get(SENT, 0) + self.report.in_doubt
+                print(f"Resuming run {self.run_id}: skipping {self.report.skipped} recipients "
+                      f"({self.report.in_doubt} in doubt)")
+        subscribers: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        rendered: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        stages = [asyncio.ensure_future(self._load(frequency, subscribers))]
+        stages += [asyncio.ensure_future(self._render_worker(subscribers, rendered))
+                   for _ in range(self.render_workers)]
+        stages.append(asyncio.ensure_future(self._send(rendered)))
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            # A stage failed or the run was cancelled: tear the others down too
+            for stage in stages:
+                stage.cancel()
+            for future in (*self._content.values(), *self._rendered.values()):
+                future.cancel()
+            raise
+        finally:
+            # Settle every fetch and render, including ones nobody waited on
+            # because another sport of their segment failed first
+            await asyncio.gather(*stages, *self._content.values(), *self._rendered.values(),
+                                 return_exceptions=True)
+            self.report.seconds = time.perf_counter() - start
+        self._count_savings()
+
+        print(f"Run {self.run_id}: sent {self.report.sent} newsletters ({self.report.failed} failed) to "
+              f"{self.report.subscribers} subscribers in {self.report.segments} segments "
+              f"({self.report.renders_avoided} renders avoided), {self.report.seconds:.1f}s")
+        if self.report.in_doubt:
+            print(f"{self.report.in_doubt} recipients in doubt were not sent this issue. If SendGrid's activity "
+                  f"for run_id {self.run_id} shows they never got it, resend with "
+                  f"--resume {self.run_id} --retry-in-doubt")
+        if self.report.unrecorded_user_ids:
+            print(f"Sent to {len(self.report.unrecorded_user_ids)} subscribers whose last-sent time could not be "
+                  f"saved; they may be sent this issue again next run: {', '.join(self.report.unrecorded_user_ids)}")
+        return self.report
+
+def build_run(args: argparse.Namespace) -> NewsletterRun:
+    """
+    Wire up the live services, or local fakes for a dry run
+    """
+    options = dict(queue_size=args.queue_size, render_workers=args.render_workers,
+                   send_batch_size=args.batch_size, journal=args.journal, run_id=args.run_id,
+                   resume=bool(args.resume))
+    if args.dry_run:
+        try:
+            from src.dry_run import (DryRunSubscriberSource, OutboxNewsletterGenerator, dry_run_content,
+                                     load_dry_run_subscribers)
+        except ImportError:  # running as a script from inside src/
+            from dry_run import (DryRunSubscriberSource, OutboxNewsletterGenerator, dry_run_content,
+                                 load_dry_run_subscribers)
+        subscribers = load_dry_run_subscribers(args.subscribers, args.frequency)
+        return NewsletterRun(DryRunSubscriberSource(subscribers), OutboxNewsletterGenerator(args.outbox),
+                             dry_run_content, **options)
+
+    api_key = os.getenv('SENDGRID_API_KEY')
+    return NewsletterRun(FirebaseManager(), NewsletterGenerator(api_key), SportContentFetcher(),
+                         send_queue=SendQueue(SendGridSender(api_key)), **options)
+
+def resolve_resume(args: argparse.Namespace) -> None:
+    """
+    Open the journal and, for --resume, point the run at the run being
+    resumed and its frequency
+    """
+    args.journal = RunJournal(args.journal_path) if args.journal_path else None
+    if not args.resume:
+        return
+    if args.journal is None:
+        raise SystemExit("--resume needs a run journal")
+    run_id = args.journal.latest_run_id() if args.resume == 'latest' else args.resume
+    frequency = args.journal.run_frequency(run_id) if run_id else None
+    if frequency is None:
+        raise SystemExit(f"No run to resume in {args.journal_path}")
+    args.run_id, args.frequency = run_id, frequency
+    if args.retry_in_doubt:
+        print(f"Releasing {args.journal.release_in_doubt(run_id)} in-doubt recipients of run {run_id} for retry")
+
+async def run_from_args(args: argparse.Namespace) -> RunReport:
+    if args.metrics:
+        metrics.enable()
+    resolve_resume(args)
+    run = build_run(args)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, run.stop)
+        except (NotImplementedError, RuntimeError):  # Windows, or not the main thread
+            pass
+    try:
+        return await run.run(args.frequency)
+    finally:
+        run.newsletter_generator.close()
+        if isinstance(run.fetch_content, SportContentFetcher):
+            run.fetch_content.close()
+        if run.send_queue is not None:
+            await run.send_queue.close()
+        if args.journal is not None:
+            args.journal.close()
+        if args.metrics:
+            metrics.write(args.metrics)
+            print(f"Metrics written to {args.metrics}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build and send the sports newsletters that are due.")
+    parser.add_argument('--frequency', choices=['daily', 'weekly', 'monthly'], default='weekly')
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Use local fakes: no Firestore, no scraping, emails written to --outbox")
+    parser.add_argument('--subscribers', help="Dry run: JSON file of subscribers instead of the sample")
+    parser.add_argument('--outbox', default='outbox', help="Dry run: directory emails are written to")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument('--render-workers', type=int, default=DEFAULT_RENDER_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=MAX_PERSONALIZATIONS,
+                        help="Recipients per bulk send")
+    parser.add_argument('--journal', dest='journal_path', default=DEFAULT_JOURNAL_PATH,
+                        help="SQLite run journal; an empty value disables checkpointing")
+    parser.add_argument('--run-id', help="Name for this run, defaults to the frequency and start time")
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID',
+                        help="Resume a run from the journal, the latest one if no RUN_ID is given. "
+                             "Recipients whose send was in flight when the run stopped are in doubt "
+                             "and do not get this issue unless --retry-in-doubt is given")
+    parser.add_argument('--retry-in-doubt', action='store_true',
+                        help="With --resume: send again to in-doubt recipients. Check SendGrid's activity "
+                             "for the run first, or they may get the issue twice")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="Record timings and write them to PATH: JSON for .json, Prometheus text otherwise")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    report = asyncio.run(run_from_args(parse_args(argv)))
+    return 1 if report.failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+# Plans one scrape per run: every subscriber's URLs are unioned so each page is fetched once.
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+try:
+    from src.extract_user_information import UserPreference
+    from src.gen_urls import generate_urls_from_query
+    from src.newsletter import ScrapedItem
+    from src.segments import segment_key
+except ImportError:  # running as a script from inside src/
+    from extract_user_information import UserPreference
+    from gen_urls import generate_urls_from_query
+    from newsletter import ScrapedItem
+    from segments import segment_key
+
+@dataclass
+class ScrapePlanStats:
+    subscribers: int = 0
+    sports: int = 0
+    url_requests: int = 0  # Fetches a per-subscriber scrape would have made
+    unique_urls: int = 0
+    fetched: int = 0
+    failed: int = 0
+
+    @property
+    def fetches_saved(self) -> int:
+        return self.url_requests - self.unique_urls
+
+@dataclass
+class ScrapePlan:
+    """
+    Deduplicated URLs for every sport any subscriber follows, and once
+    executed, the scraped text of each URL keyed by URL. Sports can be
+    added as they come up; executing again only scrapes the new URLs.
+    """
+    urls_by_sport: Dict[str, List[str]] = field(default_factory=dict)
+    stats: ScrapePlanStats = field(default_factory=ScrapePlanStats)
+    documents_by_url: Dict[str, str] = field(default_factory=dict)
+    scraped_urls: Set[str] = field(default_factory=set)
+
+    @property
+    def urls(self) -> List[str]:
+        """
+        Union of all URLs in the plan, in first-seen order
+        """
+        return list(dict.fromkeys(url for urls in self.urls_by_sport.values() for url in urls))
+
+    def add_sport(self, sport: str, url_generator: Optional[Callable[[str], List[str]]] = None) -> List[str]:
+        """
+        Resolve a sport to its URLs, once per plan
+
+        Returns:
+            The sport's URLs
+        """
+        if sport not in self.urls_by_sport:
+            self.urls_by_sport[sport] = list(dict.fromkeys((url_generator or generate_urls_from_query)(sport)))
+            self.stats.sports = len(self.urls_by_sport)
+            self.stats.unique_urls = len(self.urls)
+        return self.urls_by_sport[sport]
+
+    def add_subscriber(self, subscriber: UserPreference,
+                       url_generator: Optional[Callable[[str], List[str]]] = None) -> None:
+        """
+        Add a subscriber's sports and count the fetches a per-subscriber scrape would make
+        """
+        self.stats.subscribers += 1
+        # Subscribers without sports get the default sources, as segment_label does
+        for sport in segment_key(subscriber.sport_preferences) or ('',):
+            self.stats.url_requests += len(self.add_sport(sport, url_generator))
+
+    def count_requests(self, followers: Dict[str, int]) -> ScrapePlanStats:
+        """
+        Count the fetches a per-subscriber scrape would have made
+
+        Args:
+            followers: Number of subscribers following each sport, with ''
+                for subscribers without sports
+        """
+        self.stats.subscribers = sum(followers.values())
+        self.stats.url_requests = sum(count * len(self.urls_by_sport.get(sport, []))
+                                      for sport, count in followers.items())
+        return self.stats
+
+    def execute(self, scrape: Optional[Callable[[List[str]], list]] = None) -> ScrapePlanStats:
+        """
+        Scrape every URL in the plan not scraped yet, so each is fetched exactly once
+
+        Args:
+            scrape: Takes a list of URLs and returns documents with `url`
+                metadata; defaults to scraping into the shared index
+        """
+        urls = [url for url in self.urls if url not in self.scraped_urls]
+        if not urls:
+            return self.stats
+        if scrape is None:
+            try:
+                from src.scraper import scrape_documents
+            except ImportError:  # running as a script from inside src/
+                from scraper import scrape_documents
+            scrape = scrape_documents
+
+        self.scraped_urls.update(urls)  # Failed fetches are not retried within the plan
+        for document in scrape(urls) or []:
+            url = document.metadata.get('url')
+            if url and document.text:
+                self.documents_by_url[url] = document.text
+        self.stats.fetched = len(self.documents_by_url)
+        self.stats.failed = len(self.scraped_urls) - self.stats.fetched
+        print(f"Scraped {len(urls)} new URLs, {len(self.scraped_urls)} this run")
+        return self.stats
+
+    def content_for(self, sport: str) -> List[ScrapedItem]:
+        """
+        Scraped (url, text) items for a sport's URLs
+        """
+        return [(url, self.documents_by_url[url])
+                for url in self.urls_by_sport.get(sport, [])
+                if url in self.documents_by_url]
+
+def build_scrape_plan(subscribers: List[UserPreference],
+                      url_generator: Optional[Callable[[str], List[str]]] = None) -> ScrapePlan:
+    """
+    Resolve each distinct sport across all subscribers to its URLs once
+
+    Args:
+        subscribers: Subscribers whose newsletters need content this run
+        url_generator: Maps a sport query to the URLs to scrape; defaults
+            to generate_urls_from_query
+    """
+    plan = ScrapePlan()
+    for subscriber in subscribers:
+        plan.add_subscriber(subscriber, url_generator)
+    return plan
@@ -1,15 +1,34 @@
-from llama_index.core import VectorStoreIndex, Settings
+from llama_index.core import VectorStoreIndex, Settings, load_index_from_storage
 from llama_index.core.schema import Document
 from llama_index.readers.web import BeautifulSoupWebReader
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from typing import List, Optional
-import requests
-from bs4 import BeautifulSoup
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import aiohttp
+import atexit
+import hashlib
+import json
 import logging
 import time
 from urllib.parse import urlparse
 import os
-from gen_urls import generate_urls_from_query
+
+try:
+    from src.embedding_pipeline import EmbeddingPipeline
+    from src.embeddings import get_model_name, use_shared_embed_model
+    from src.gen_urls import generate_urls_from_query
+    from src.html_extract import DEFAULT_BACKEND as DEFAULT_EXTRACTOR, get_extractor
+    from src.http_cache import DEFAULT_CACHE_PATH as DEFAULT_HTTP_CACHE_PATH, HttpCache
+    from src.index_store import INDEX_DB_FILE, IndexStorage
+    from src.metrics import metrics
+except ImportError:  # running as a script from inside src/
+    from embedding_pipeline import EmbeddingPipeline
+    from embeddings import get_model_name, use_shared_embed_model
+    from gen_urls import generate_urls_from_query
+    from html_extract import DEFAULT_BACKEND as DEFAULT_EXTRACTOR, get_extractor
+    from http_cache import DEFAULT_CACHE_PATH as DEFAULT_HTTP_CACHE_PATH, HttpCache
+    from index_store import INDEX_DB_FILE, IndexStorage
+    from metrics import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,12 +38,41 @@ logger = logging.getLogger(__name__)
 documents_list = []
 index = None
 
-def scrape_and_add_dynamic(urls: List[str]) -> str:
+# Whether the persisted index has been looked for yet; see get_index()
+index_load_attempted = False
+
+# Open SQLite index storage per persist directory
+index_storages: Dict[str, IndexStorage] = {}
+
+# Content hash of the currently indexed version of each URL
+document_hashes: Dict[str, str] = {}
+
+# Conditional-request response cache, opened on first use
+http_cache: Optional[HttpCache] = None
+
+# Chunking and batched embedding for index updates, created on first use
+embedding_pipeline: Optional[EmbeddingPipeline] = None
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Directory the index, docstore and embeddings are persisted to ('' disables persistence)
+INDEX_STORAGE_DIR = os.getenv('INDEX_STORAGE_DIR', 'storage')
+INDEX_META_FILE = 'index_meta.json'
+
+# Keep only a page's <main>/<article> text when it marks one up; '0' keeps the whole body
+HTML_MAIN_CONTENT = os.getenv('HTML_MAIN_CONTENT', '1') != '0'
+
+# Upper bound on in-flight requests across all hosts
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('SCRAPER_MAX_CONCURRENCY', '10'))
+
+def scrape_and_add_dynamic(urls: List[str], incremental: bool = True) -> str:
     """
     Scrapes the given URLs and adds them to the LlamaIndex dynamically.
     
     Args:
         urls (List[str]): List of URLs to scrape
+        incremental (bool): Embed only new or changed documents into the
+            existing index instead of rebuilding it from every document
         
     Returns:
         str: Summary of scraped content
@@ -35,22 +83,11 @@ def scrape_and_add_dynamic(urls: List[str]) -> str:
         # Print the URLs we're trying to scrape (for debugging)
         print(urls)
         
-        # IMPORTANT: Configure to use local Hugging Face embeddings with Settings
-        embed_model = HuggingFaceEmbedding(model_name="all-MiniLM-L6-v2")
-        Settings.embed_model = embed_model
-        
-        # Use rate-limited scraping instead of BeautifulSoupWebReader for more control
-        scraped_documents = scrape_with_rate_limit(urls, delay=1.0)
+        scraped_documents = scrape_documents(urls, incremental=incremental)
         
         if not scraped_documents:
             return "No content was successfully scraped from the provided URLs."
         
-        # Add to the global document list and update the index
-        documents_list.extend(scraped_documents)
-        
-        # Use settings-based approach instead of service_context
-        index = VectorStoreIndex.from_documents(documents_list)
-        
         # Generate a summary of the scraped data
         summary = []
         for doc in scraped_documents:
@@ -66,6 +103,282 @@ def scrape_and_add_dynamic(urls: List[str]) -> str:
         logger.error(f"Error during scraping: \n******\n{str(e)}\n******")
         return f"Error during scraping: \n******\n{str(e)}\n******"
 
+def scrape_documents(urls: List[str], incremental: bool = True) -> List[Document]:
+    """
+    Scrapes the given URLs and adds the documents to the index.
+    
+    Args:
+        urls (List[str]): List of URLs to scrape
+        incremental (bool): Embed only new or changed documents
+        
+    Returns:
+        List[Document]: Scraped documents, each with `url` metadata
+    """
+    # IMPORTANT: Configure to use the shared local Hugging Face embeddings with Settings
+    use_shared_embed_model()
+    
+    # Use rate-limited scraping instead of BeautifulSoupWebReader for more control
+    scraped_documents = scrape_with_rate_limit(urls, delay=1.0)
+    if scraped_documents:
+        update_index(scraped_documents, incremental=incremental)
+    return scraped_documents
+
+def content_hash(text: str) -> str:
+    """
+    Returns a stable hash of document text, used to detect unchanged pages.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _key_document(doc: Document, url: str, digest: str) -> None:
+    """
+    Key a document by its URL and tag it with its content hash, which is
+    kept out of the embedded and LLM text
+    """
+    doc.id_ = url
+    doc.metadata['content_hash'] = digest
+    for keys in (doc.excluded_embed_metadata_keys, doc.excluded_llm_metadata_keys):
+        if 'content_hash' not in keys:
+            keys.append('content_hash')
+
+def update_index(documents: List[Document], incremental: bool = True) -> List[Document]:
+    """
+    Adds scraped documents to the global index.
+    
+    In incremental mode each document is keyed by its URL: documents whose
+    content hash matches the indexed version are skipped, and documents from
+    an already indexed URL replace the old version instead of duplicating it.
+    Only the documents that actually changed are embedded.
+    
+    Args:
+        documents (List[Document]): Newly scraped documents
+        incremental (bool): If False, rebuild the whole index from `documents_list`
+        
+    Returns:
+        List[Document]: Documents that were (re-)indexed
+    """
+    global index, documents_list
+    
+    if not incremental:
+        get_index()  # So documents_list holds the persisted documents too
+        # One document per URL, the latest scraped version winning
+        by_key: Dict[str, Document] = {}
+        for doc in documents_list + list(documents):
+            url = doc.metadata.get('url')
+            if url is not None:
+                _key_document(doc, url, content_hash(doc.text))
+            by_key.pop(doc.id_, None)
+            by_key[doc.id_] = doc
+        rebuilt = list(by_key.values())
+        nodes, _ = get_embedding_pipeline().embed_documents(rebuilt)
+        with metrics.timer('index_insert_seconds', mode='rebuild'):
+            index = _new_index(nodes)
+        documents_list[:] = rebuilt
+        document_hashes.clear()
+        document_hashes.update(
+            (doc.metadata['url'], doc.metadata['content_hash']) for doc in rebuilt if doc.metadata.get('url')
+        )
+        storage = get_index_storage()
+        if storage is not None:
+            storage.save_documents(documents_list)
+        persist_index()
+        return documents
+    
+    if get_index() is None:
+        index = _new_index([])
+    
+    # Collect the changed documents first so they are embedded in one batched pass
+    changed: Dict[str, Document] = {}
+    for doc in documents:
+        url = doc.metadata.get('url')
+        if url is None:
+            changed[doc.id_] = doc
+            continue
+        
+        digest = content_hash(doc.text)
+        if document_hashes.get(url) == digest:
+            logger.info(f"Unchanged content skipped: {url}")
+            continue
+        _key_document(doc, url, digest)
+        changed[url] = doc
+    
+    if changed:
+        nodes, _ = get_embedding_pipeline().embed_documents(list(changed.values()))
+        # The old versions go only once the new ones are embedded, and the
+        # hashes are recorded only once they are indexed: if either step
+        # fails, the next scrape of the page retries it
+        storage = get_index_storage()
+        for url, doc in changed.items():
+            if doc.metadata.get('url') == url and url in document_hashes:
+                index.delete_ref_doc(url, delete_from_docstore=True)
+                documents_list[:] = [d for d in documents_list if d.metadata.get('url') != url]
+                if storage is not None:
+                    storage.delete_document(url)
+        with metrics.timer('index_insert_seconds', mode='incremental'):
+            index.insert_nodes(nodes)
+        metrics.incr('index_nodes_inserted', len(nodes))
+        for doc in changed.values():
+            index.docstore.set_document_hash(doc.id_, doc.hash)
+            if doc.metadata.get('url'):
+                document_hashes[doc.metadata['url']] = doc.metadata['content_hash']
+        documents_list.extend(changed.values())
+        if storage is not None:
+            storage.save_documents(changed.values())
+        persist_index()
+    return list(changed.values())
+
+def get_embedding_pipeline() -> EmbeddingPipeline:
+    """
+    Returns the batched embedding pipeline, created on first use with
+    EMBED_BATCH_SIZE and EMBED_WORKERS. Its worker processes are shut
+    down by close_embedding_pipeline, at the latest when the process exits.
+    """
+    global embedding_pipeline
+    if embedding_pipeline is None:
+        embedding_pipeline = EmbeddingPipeline()
+    return embedding_pipeline
+
+def close_embedding_pipeline() -> None:
+    """
+    Shut down the embedding pipeline's worker processes, if any were started
+    """
+    global embedding_pipeline
+    if embedding_pipeline is not None:
+        embedding_pipeline.close()
+        embedding_pipeline = None
+
+atexit.register(close_embedding_pipeline)
+
+def get_index() -> Optional[VectorStoreIndex]:
+    """
+    Returns the global index, loading the persisted one on first use.
+    
+    Returns:
+        Optional[VectorStoreIndex]: The index, or None if nothing is indexed yet
+    """
+    global index_load_attempted
+    if index is None and not index_load_attempted:
+        index_load_attempted = True
+        if INDEX_STORAGE_DIR and os.path.isdir(INDEX_STORAGE_DIR):
+            load_index()
+    return index
+
+def get_index_storage(persist_dir: Optional[str] = None) -> Optional[IndexStorage]:
+    """
+    Returns the SQLite storage the index is written through to, or None if
+    persistence is disabled.
+    
+    Args:
+        persist_dir (Optional[str]): Storage directory, defaults to INDEX_STORAGE_DIR
+    """
+    persist_dir = INDEX_STORAGE_DIR if persist_dir is None else persist_dir
+    if not persist_dir:
+        return None
+    if persist_dir not in index_storages:
+        index_storages[persist_dir] = IndexStorage(persist_dir)
+    return index_storages[persist_dir]
+
+def _new_index(nodes: List) -> VectorStoreIndex:
+    """
+    Builds an index from embedded nodes, replacing whatever was persisted.
+    """
+    storage = get_index_storage()
+    if storage is None:
+        return VectorStoreIndex(nodes=nodes)
+    storage.clear()
+    return VectorStoreIndex(nodes=nodes, storage_context=storage.context)
+
+def persist_index(persist_dir: Optional[str] = None) -> bool:
+    """
+    Records the name of the embedding model the persisted index was built
+    with. The index itself is written through to SQLite as it changes, so
+    this does not rewrite the docstore or vectors.
+    
+    Args:
+        persist_dir (Optional[str]): Storage directory, defaults to INDEX_STORAGE_DIR
+        
+    Returns:
+        bool: True if the metadata was written
+    """
+    persist_dir = INDEX_STORAGE_DIR if persist_dir is None else persist_dir
+    if index is None or not persist_dir:
+        return False
+    
+    try:
+        with open(os.path.join(persist_dir, INDEX_META_FILE), 'w') as f:
+            json.dump({
+                'embed_model': get_model_name(),
+                'documents': len(index.ref_doc_info),
+                'updated_at': time.time()
+            }, f)
+        return True
+    except Exception as e:
+        logger.error(f"Error persisting index to {persist_dir}: {e}")
+        return False
+
+def check_index_store(persist_dir: Optional[str] = None, model_name: Optional[str] = None) -> bool:
+    """
+    Checks that a persisted index exists and was built with the given
+    embedding model, so its vectors are comparable with new queries.
+    
+    Args:
+        persist_dir (Optional[str]): Storage directory, defaults to INDEX_STORAGE_DIR
+        model_name (Optional[str]): Expected embedding model, defaults to the configured one
+        
+    Returns:
+        bool: True if the store matches the embedding model
+    """
+    persist_dir = INDEX_STORAGE_DIR if persist_dir is None else persist_dir
+    meta_path = os.path.join(persist_dir, INDEX_META_FILE) if persist_dir else ''
+    if not os.path.exists(meta_path) or not os.path.exists(os.path.join(persist_dir, INDEX_DB_FILE)):
+        return False
+    
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable index metadata {meta_path}: {e}")
+        return False
+    
+    expected = model_name or get_model_name()
+    if meta.get('embed_model') != expected:
+        logger.warning(
+            f"Persisted index was built with {meta.get('embed_model')!r}, expected {expected!r}"
+        )
+        return False
+    return True
+
+def load_index(persist_dir: Optional[str] = None) -> bool:
+    """
+    Loads a persisted index into the global `index`, if one exists and
+    matches the configured embedding model, and the documents it was built
+    from into `documents_list`.
+    
+    Args:
+        persist_dir (Optional[str]): Storage directory, defaults to INDEX_STORAGE_DIR
+        
+    Returns:
+        bool: True if the index was loaded
+    """
+    global index
+    persist_dir = INDEX_STORAGE_DIR if persist_dir is None else persist_dir
+    if not check_index_store(persist_dir):
+        return False
+    
+    try:
+        storage = get_index_storage(persist_dir)
+        index = load_index_from_storage(storage.context, embed_model=use_shared_embed_model())
+        documents_list[:] = storage.documents()
+    except Exception as e:
+        logger.error(f"Error loading index from {persist_dir}: {e}")
+        return False
+    
+    document_hashes.clear()
+    for ref_doc_id, info in index.ref_doc_info.items():
+        if 'content_hash' in info.metadata:
+            document_hashes[info.metadata.get('url', ref_doc_id)] = info.metadata['content_hash']
+    logger.info(f"Loaded persisted index with {len(index.ref_doc_info)} documents from {persist_dir}")
+    return True
+
 def validate_url(url: str) -> bool:
     """
     Validates if a URL is properly formatted and accessible.
@@ -82,53 +395,203 @@ def validate_url(url: str) -> bool:
     except Exception:
         return False
 
-def scrape_with_rate_limit(urls: List[str], delay: float = 1.0) -> List[Document]:
+class HostRateLimiter:
     """
-    Scrapes URLs with rate limiting to be respectful to servers.
+    Per-host politeness: requests to the same host are spaced at least
+    `delay` seconds apart, while different hosts proceed independently.
+    """
+
+    def __init__(self, delay: float = 1.0):
+        self.delay = delay
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_request: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def request(self, host: str, semaphore: asyncio.Semaphore) -> AsyncIterator[None]:
+        """
+        Hold a request slot for `host`: waits out the host's delay first,
+        then takes a slot of the global `semaphore` for the request itself.
+        
+        The delay is waited without holding a global slot, so one busy host
+        cannot keep requests to other hosts waiting, and the host's time is
+        recorded when the request actually goes out.
+        """
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            last = self._last_request.get(host)
+            if last is not None:
+                remaining = self.delay - (time.monotonic() - last)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+            await semaphore.acquire()
+            self._last_request[host] = time.monotonic()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+def get_http_cache() -> Optional[HttpCache]:
+    """
+    Returns the shared HTTP response cache, or None if HTTP_CACHE_PATH is
+    set to an empty string.
+    """
+    global http_cache
+    if http_cache is None:
+        cache_path = os.getenv('HTTP_CACHE_PATH', DEFAULT_HTTP_CACHE_PATH)
+        if cache_path:
+            http_cache = HttpCache(cache_path)
+    return http_cache
+
+def html_to_document(url: str, html: str, extractor: Optional[str] = None,
+                     main_content: Optional[bool] = None) -> Optional[Document]:
+    """
+    Extracts the visible text of a page into a Document.
     
     Args:
-        urls (List[str]): List of URLs to scrape
-        delay (float): Delay between requests in seconds
+        url (str): URL the page was fetched from
+        html (str): Raw HTML of the page
+        extractor (Optional[str]): Extraction backend name, defaults to HTML_EXTRACTOR
+        main_content (Optional[bool]): Only keep the page's <main>/<article> text,
+            defaults to HTML_MAIN_CONTENT (on)
         
     Returns:
-        List[Document]: List of scraped documents
+        Optional[Document]: Document with `url` metadata, or None if the page has no text
     """
-    documents = []
+    if main_content is None:
+        main_content = HTML_MAIN_CONTENT
+    extract = get_extractor(extractor)
+    # Script, style, nav and footer content is skipped by the extractor
+    with metrics.timer('parse_seconds', extractor=extractor or DEFAULT_EXTRACTOR):
+        text = extract(html, main_content=True) if main_content else extract(html)
+    if not text:
+        logger.warning(f"No text content extracted from {url}")
+        return None
+    return Document(text=text, extra_info={'url': url})
+
+def extraction_key(extractor: Optional[str] = None, main_content: Optional[bool] = None) -> str:
+    """
+    Identifies the settings html_to_document extracts text with, so cached
+    text is only reused when it was extracted the same way
+    """
+    if main_content is None:
+        main_content = HTML_MAIN_CONTENT
+    return f"{extractor or DEFAULT_EXTRACTOR}:{'main' if main_content else 'page'}"
+
+async def _fetch_document(session: aiohttp.ClientSession,
+                          url: str,
+                          limiter: HostRateLimiter,
+                          semaphore: asyncio.Semaphore,
+                          cache: Optional[HttpCache] = None) -> Optional[Document]:
+    """
+    Fetches and parses a single URL, honouring the host limiter and the
+    global concurrency limit.
+    
+    With a cache, a conditional request is sent and a 304 reuses the cached
+    document without downloading the page again. The cached text is reused
+    if it was extracted with the current settings, otherwise the cached page
+    is extracted again.
+    """
+    cached = cache.get(url) if cache else None
+    headers = cache.conditional_headers(cached) if cache else {}
+    extraction = extraction_key()
     
+    try:
+        async with limiter.request(urlparse(url).netloc, semaphore):
+            if headers:
+                cache.record_revalidation()
+            with metrics.timer('fetch_seconds'):
+                async with session.get(url, headers=headers) as response:
+                    metrics.incr('fetch_responses', status=response.status)
+                    if response.status == 304 and cached is not None:
+                        cache.record_hit(cached)
+                        if cached.extraction == extraction:
+                            return Document(text=cached.text, extra_info={'url': url})
+                        html, etag, last_modified = cached.body, cached.etag, cached.last_modified
+                    else:
+                        response.raise_for_status()
+                        # Bytes as downloaded, before decoding
+                        metrics.incr('fetch_bytes', len(await response.read()))
+                        html = await response.text()
+                        etag = response.headers.get('ETag')
+                        last_modified = response.headers.get('Last-Modified')
+                        if cache:
+                            cache.record_miss()
+        
+        doc = html_to_document(url, html)
+        if cache and doc is not None:
+            cache.put(url, etag, last_modified, html, doc.text, extraction)
+        return doc
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error scraping {url}: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error processing {url}: {e}")
+    return None
+
+async def scrape_with_rate_limit_async(urls: List[str],
+                                       delay: float = 1.0,
+                                       max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                                       timeout: float = 10) -> List[Document]:
+    """
+    Scrapes URLs concurrently while staying polite to each server.
+    
+    Different hosts are fetched in parallel (bounded by `max_concurrency`),
+    and consecutive requests to the same host are spaced `delay` seconds apart.
+    
+    Args:
+        urls (List[str]): List of URLs to scrape
+        delay (float): Minimum delay between requests to the same host in seconds
+        max_concurrency (int): Maximum number of requests in flight at once
+        timeout (float): Total timeout per request in seconds
+        
+    Returns:
+        List[Document]: List of scraped documents, in the order of `urls`
+    """
+    valid_urls = []
     for url in urls:
         if not validate_url(url):
             logger.warning(f"Invalid URL skipped: {url}")
             continue
-            
-        try:
-            response = requests.get(
-                url, 
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                },
-                timeout=10
-            )
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # Remove unnecessary elements
-            for script in soup(['script', 'style', 'nav', 'footer']):
-                script.decompose()
-                
-            text = soup.get_text(separator='\n', strip=True)
-            if text:
-                documents.append(Document(text=text, extra_info={'url': url}))
-            else:
-                logger.warning(f"No text content extracted from {url}")
-            
-            time.sleep(delay)  # Rate limiting
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error scraping {url}: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error processing {url}: {e}")
-            
-    return documents
+        valid_urls.append(url)
+
+    if not valid_urls:
+        return []
+
+    limiter = HostRateLimiter(delay)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    cache = get_http_cache()
+    async with aiohttp.ClientSession(
+        headers={'User-Agent': USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        results = await asyncio.gather(*[
+            _fetch_document(session, url, limiter, semaphore, cache)
+            for url in valid_urls
+        ])
+
+    if cache:
+        logger.info(f"HTTP cache stats: {cache.stats_dict()}")
+    return [doc for doc in results if doc is not None]
+
+def scrape_with_rate_limit(urls: List[str],
+                           delay: float = 1.0,
+                           max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> List[Document]:
+    """
+    Scrapes URLs with rate limiting to be respectful to servers.
+    
+    Synchronous wrapper around `scrape_with_rate_limit_async` for callers
+    that are not running an event loop.
+    
+    Args:
+        urls (List[str]): List of URLs to scrape
+        delay (float): Minimum delay between requests to the same host in seconds
+        max_concurrency (int): Maximum number of requests in flight at once
+        
+    Returns:
+        List[Document]: List of scraped documents
+    """
+    return asyncio.run(
+        scrape_with_rate_limit_async(urls, delay=delay, max_concurrency=max_concurrency)
+    )
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,28 @@
+# Groups subscribers by sport preferences so each distinct newsletter is rendered once.
+
+from typing import Dict, List, Tuple
+
+try:
+    from src.extract_user_information import UserPreference
+except ImportError:  # running as a script from inside src/
+    from extract_user_information import UserPreference
+
+SegmentKey = Tuple[str, ...]
+
+def segment_key(sport_preferences: List[str]) -> SegmentKey:
+    """
+    Normalised, order-independent key for a combination of sports
+    """
+    return tuple(sorted({sport.strip().lower() for sport in sport_preferences if sport.strip()}))
+
+def segment_label(key: SegmentKey) -> str:
+    return ', '.join(key) if key else 'sports'
+
+def group_subscribers_by_segment(subscribers: List[UserPreference]) -> Dict[SegmentKey, List[UserPreference]]:
+    """
+    Group subscribers that share the same set of sport preferences
+    """
+    segments: Dict[SegmentKey, List[UserPreference]] = {}
+    for subscriber in subscribers:
+        segments.setdefault(segment_key(subscriber.sport_preferences), []).append(subscriber)
+    return segments
@@ -0,0 +1,265 @@
+# Asynchronous send queue with rate limiting, retries and a dead-letter file.
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import aiohttp
+
+try:
+    from src.metrics import metrics
+    from src.newsletter import SENDGRID_API_HOST
+except ImportError:  # running as a script from inside src/
+    from metrics import metrics
+    from newsletter import SENDGRID_API_HOST
+
+logger = logging.getLogger(__name__)
+
+# Jobs that could not be delivered, one JSON object per line, for replay
+DEFAULT_DEAD_LETTER_PATH = os.getenv('SEND_DEAD_LETTER_PATH', os.path.join('.cache', 'dead_letters.jsonl'))
+# Requests per second allowed by the provider quota
+DEFAULT_SEND_RATE = float(os.getenv('SENDGRID_RATE_LIMIT', '10'))
+
+class RetryableSendError(Exception):
+    """A send that may succeed later, e.g. a 429, a 5xx or a network error"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+class PermanentSendError(Exception):
+    """A send that will never succeed as-is, e.g. a 400 for a malformed payload"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+@dataclass
+class SendJob:
+    job_id: str
+    payload: Dict  # SendGrid mail/send JSON
+    recipients: List[str] = field(default_factory=list)
+    attempts: int = 0
+
+@dataclass
+class SendResult:
+    job_id: str
+    recipients: List[str]
+    delivered: bool
+    attempts: int
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: allows `rate` acquisitions per second on
+    average, with bursts of up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class SendGridSender:
+    """
+    Async SendGrid mail/send client on a pooled aiohttp session. Raises
+    RetryableSendError or PermanentSendError so SendQueue can decide what
+    to do with a failure.
+    """
+
+    def __init__(self, api_key: str, api_host: Optional[str] = None, max_connections: int = 16):
+        self.api_key = api_key
+        self.api_host = api_host or SENDGRID_API_HOST
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> 'SendGridSender':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                headers={'Authorization': f'Bearer {self.api_key}'},
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+
+    async def __call__(self, job: SendJob) -> None:
+        try:
+            with metrics.timer('sendgrid_seconds'):
+                async with self._get_session().post(f"{self.api_host}/v3/mail/send", json=job.payload) as response:
+                    metrics.incr('sendgrid_responses', status=response.status)
+                    if 200 <= response.status < 300:
+                        return
+                    body = (await response.text())[:500]
+                    if response.status == 429 or response.status >= 500:
+                        raise RetryableSendError(
+                            f"SendGrid returned {response.status}: {body}",
+                            retry_after=_parse_retry_after(response.headers.get('Retry-After')),
+                            status_code=response.status
+                        )
+                    # Any other 4xx (bad payload, auth, forbidden sender) fails the same way every time
+                    raise PermanentSendError(f"SendGrid returned {response.status}: {body}", response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RetryableSendError(f"Network error: {e}") from e
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After is either delay seconds or an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class SendQueue:
+    """
+    Sends jobs from an asyncio queue with a pool of workers, rate limited by
+    a token bucket. Retryable failures back off exponentially (or for as
+    long as Retry-After asks); jobs that fail permanently or run out of
+    retries are appended to a dead-letter file for replay.
+    """
+
+    def __init__(self, send: Callable[[SendJob], Awaitable[None]],
+                 workers: int = 4,
+                 rate: float = DEFAULT_SEND_RATE,
+                 burst: Optional[float] = None,
+                 max_retries: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 dead_letter_path: str = DEFAULT_DEAD_LETTER_PATH):
+        self.send = send
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_letter_path = dead_letter_path
+        self.results: List[SendResult] = []
+        self.retries = 0
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.base_delay * (2 ** (attempt - 1)), self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _process(self, job: SendJob) -> SendResult:
+        while True:
+            await self.bucket.acquire()
+            job.attempts += 1
+            try:
+                await self.send(job)
+                return SendResult(job.job_id, job.recipients, True, job.attempts)
+            except RetryableSendError as e:
+                if job.attempts > self.max_retries:
+                    return self._dead_letter(job, e, e.status_code)
+                self.retries += 1
+                delay = self._backoff(job.attempts, e.retry_after)
+                logger.warning(f"Retrying job {job.job_id} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+            except PermanentSendError as e:
+                return self._dead_letter(job, e, e.status_code)
+            except Exception as e:
+                logger.exception(f"Unexpected error sending job {job.job_id}")
+                return self._dead_letter(job, e)
+
+    def _dead_letter(self, job: SendJob, error: Exception, status_code: Optional[int] = None) -> SendResult:
+        logger.error(f"Job {job.job_id} failed after {job.attempts} attempts: {error}")
+        if self.dead_letter_path:
+            directory = os.path.dirname(self.dead_letter_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.dead_letter_path, 'a') as f:
+                f.write(json.dumps({
+                    **asdict(job),
+                    'error': str(error),
+                    'failed_at': datetime.now(timezone.utc).isoformat()
+                }) + '\n')
+        return SendResult(job.job_id, job.recipients, False, job.attempts, str(error), status_code)
+
+    async def _worker(self, queue: asyncio.Queue, results: List[SendResult]) -> None:
+        while True:
+            job = await queue.get()
+            try:
+                results.append(await self._process(job))
+            finally:
+                queue.task_done()
+
+    async def run(self, jobs: List[SendJob]) -> List[SendResult]:
+        """
+        Send every job and wait for all of them to finish or be dead-lettered
+
+        Returns:
+            Result per job of this call, in completion order
+        """
+        self.results = results = []
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        workers = [asyncio.create_task(self._worker(queue, results)) for _ in range(self.workers)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return results
+
+    async def close(self) -> None:
+        """
+        Close the sender, if it holds a connection pool
+        """
+        close = getattr(self.send, 'close', None)
+        if close is not None:
+            await close()
+
+def load_dead_letters(path: str = DEFAULT_DEAD_LETTER_PATH) -> List[SendJob]:
+    """
+    Read dead-lettered jobs back for replay, with their attempt counts reset
+    """
+    if not os.path.exists(path):
+        return []
+    jobs = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                jobs.append(SendJob(entry['job_id'], entry['payload'], entry.get('recipients', [])))
+    return jobs
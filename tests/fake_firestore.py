@@ -0,0 +1,253 @@
+# tests/fake_firestore.py
+"""In-memory stand-in for the parts of the Firestore client FirebaseManager uses"""
+import asyncio
+import copy
+import operator
+from google.api_core import exceptions as google_exceptions
+
+_OPERATORS = {
+    '==': operator.eq,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field):
+        return self._data.get(field) if self.exists else None
+
+class FakeDocumentRef:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self):
+        self._collection.db.document_gets += 1
+        return self._snapshot()
+
+    def _snapshot(self):
+        self._collection.db.reads += 1
+        return FakeSnapshot(self, self._collection.docs.get(self.id))
+
+    def set(self, data, merge=False):
+        self._collection.db.writes += 1
+        if merge and self.id in self._collection.docs:
+            self._collection.docs[self.id].update(copy.deepcopy(data))
+        else:
+            self._collection.docs[self.id] = copy.deepcopy(data)
+
+    def update(self, data):
+        if self.id not in self._collection.docs:
+            raise KeyError(f"No document to update: {self.id}")
+        self._collection.db.writes += 1
+        self._collection.docs[self.id].update(copy.deepcopy(data))
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=(), cursor=None, max_results=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._order = tuple(order)
+        self._cursor = cursor
+        self._limit = max_results
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, order=self._order,
+                     cursor=self._cursor, max_results=self._limit)
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field):
+        return self._copy(order=self._order + (field,))
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    def limit(self, count):
+        return self._copy(max_results=count)
+
+    def _sort_key(self, item):
+        doc_id, data = item
+        key = tuple(doc_id if field == '__name__' else data.get(field) for field in self._order)
+        return key + (doc_id,)
+
+    def stream(self):
+        matches = []
+        for doc_id, data in sorted(self._collection.docs.items()):
+            if all(data.get(field) is not None and _OPERATORS[op](data[field], value)
+                   for field, op, value in self._filters):
+                matches.append((doc_id, data))
+        matches.sort(key=self._sort_key)
+
+        if self._cursor is not None:
+            cursor_key = self._sort_key((self._cursor.id, self._cursor.to_dict()))
+            matches = [m for m in matches if self._sort_key(m) > cursor_key]
+        if self._limit is not None:
+            matches = matches[:self._limit]
+
+        self._collection.db.reads += len(matches)
+        self._collection.db.queries += 1
+        for doc_id, _ in matches:
+            yield FakeSnapshot(self._collection.document(doc_id), self._collection.docs[doc_id])
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.docs = {}
+        super().__init__(self)
+
+    def document(self, doc_id):
+        return FakeDocumentRef(self, doc_id)
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._updates = []
+
+    def update(self, reference, data):
+        self._updates.append((reference, data))
+
+    def set(self, reference, data, merge=False):
+        self._updates.append((reference, data, merge))
+
+    def commit(self):
+        self._db.commits += 1
+        if self._db.fail_commits:
+            self._db.fail_commits -= 1
+            raise self._db.commit_error("commit failed")
+        for write in self._updates:
+            # Like Firestore, a batch with an update to a missing document writes nothing
+            if len(write) == 2 and write[0].id not in write[0]._collection.docs:
+                raise google_exceptions.NotFound(f"No document to update: {write[0].id}")
+        for write in self._updates:
+            if len(write) == 3:
+                reference, data, merge = write
+                reference.set(data, merge=merge)
+            else:
+                reference, data = write
+                reference.update(data)
+        return []
+
+class FakeFirestore:
+    def __init__(self):
+        self._collections = {}
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.document_gets = 0
+        self.get_all_calls = 0
+        self.commits = 0
+        self.fail_commits = 0
+        self.commit_error = google_exceptions.ServiceUnavailable  # Raised by failing commits
+
+    def collection(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name)
+        return self._collections[name]
+
+    def get_all(self, references):
+        self.get_all_calls += 1
+        for reference in references:
+            yield reference._snapshot()
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def add_subscriber(self, user_id, email, name, **preferences):
+        """Seed a user doc and its newsletter preferences doc"""
+        FakeFirestore.collection(self, 'users').docs[user_id] = {'email': email, 'name': name}
+        FakeFirestore.collection(self, 'newsletter_preferences').docs[user_id] = {
+            'sport_preferences': [],
+            'notification_frequency': 'weekly',
+            'is_active': True,
+            **preferences
+        }
+
+
+class AsyncFakeDocumentRef:
+    def __init__(self, reference):
+        self._reference = reference
+        self.id = reference.id
+
+    async def get(self):
+        await asyncio.sleep(0)
+        return self._reference.get()
+
+    async def set(self, data, merge=False):
+        await asyncio.sleep(0)
+        self._reference.set(data, merge=merge)
+
+    async def update(self, data):
+        await asyncio.sleep(0)
+        self._reference.update(data)
+
+class AsyncFakeQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def where(self, field, op, value):
+        return AsyncFakeQuery(self._query.where(field, op, value))
+
+    def order_by(self, field):
+        return AsyncFakeQuery(self._query.order_by(field))
+
+    def start_after(self, snapshot):
+        return AsyncFakeQuery(self._query.start_after(snapshot))
+
+    def limit(self, count):
+        return AsyncFakeQuery(self._query.limit(count))
+
+    async def stream(self):
+        for snapshot in self._query.stream():
+            await asyncio.sleep(0)
+            yield snapshot
+
+class AsyncFakeCollection(AsyncFakeQuery):
+    @property
+    def docs(self):
+        return self._query.docs
+
+    def document(self, doc_id):
+        return AsyncFakeDocumentRef(self._query.document(doc_id))
+
+class AsyncFakeWriteBatch:
+    def __init__(self, batch):
+        self._batch = batch
+
+    def update(self, reference, data):
+        self._batch.update(reference._reference, data)
+
+    def set(self, reference, data, merge=False):
+        self._batch.set(reference._reference, data, merge=merge)
+
+    async def commit(self):
+        await asyncio.sleep(0)
+        return self._batch.commit()
+
+class AsyncFakeFirestore(FakeFirestore):
+    """Same storage and counters as FakeFirestore, behind the AsyncClient interface"""
+
+    def collection(self, name):
+        return AsyncFakeCollection(super().collection(name))
+
+    async def get_all(self, references):
+        self.get_all_calls += 1
+        for reference in references:
+            await asyncio.sleep(0)
+            yield reference._reference._snapshot()
+
+    def batch(self):
+        return AsyncFakeWriteBatch(super().batch())
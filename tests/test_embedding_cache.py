@@ -0,0 +1,39 @@
+# tests/test_embedding_cache.py
+import pytest
+from src.embedding_cache import EmbeddingCache
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'embeddings.sqlite')
+
+class TestEmbeddingCache:
+    def test_miss_then_hit(self, cache_path):
+        cache = EmbeddingCache(cache_path)
+        assert cache.get_many('model', ['lakers win']) == [None]
+
+        cache.put_many('model', ['lakers win'], [[0.5, 0.25]])
+        assert cache.get_many('model', ['lakers win']) == [[0.5, 0.25]]
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_keyed_by_model_name(self, cache_path):
+        cache = EmbeddingCache(cache_path)
+        cache.put_many('model-a', ['lakers win'], [[1.0]])
+        assert cache.get_many('model-b', ['lakers win']) == [None]
+
+    def test_persists_across_instances(self, cache_path):
+        cache = EmbeddingCache(cache_path)
+        cache.put_many('model', ['lakers win'], [[1.0, 2.0]])
+        cache.close()
+
+        reopened = EmbeddingCache(cache_path)
+        assert reopened.get_many('model', ['lakers win']) == [[1.0, 2.0]]
+
+    def test_least_recently_used_entries_are_evicted(self, cache_path):
+        cache = EmbeddingCache(cache_path, max_entries=2)
+        cache.put_many('model', ['a'], [[1.0]])
+        cache.put_many('model', ['b'], [[2.0]])
+        cache.get_many('model', ['a'])  # 'b' is now least recently used
+        cache.put_many('model', ['c'], [[3.0]])
+
+        assert len(cache) == 2
+        assert cache.get_many('model', ['a', 'b', 'c']) == [[1.0], None, [3.0]]
@@ -0,0 +1,90 @@
+# tests/test_embedding_pipeline.py
+import pytest
+from unittest.mock import patch
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import Document, TextNode
+from src.embedding_cache import EmbeddingCache
+from src.embedding_pipeline import EmbeddingPipeline, _batches
+from src.embeddings import CachedEmbedding
+
+def mock_model():
+    return MockEmbedding(embed_dim=8)
+
+def other_model():
+    return MockEmbedding(embed_dim=8, model_name='other')
+
+def make_nodes(texts):
+    return [TextNode(text=text) for text in texts]
+
+class TestEmbeddingPipeline:
+    def test_batches_group_chunks_by_length(self):
+        texts = ['a' * 50, 'a', 'a' * 10, 'a' * 40, 'a' * 5]
+        
+        assert _batches(texts, 2) == [[1, 4], [2, 3], [0]]
+        
+    def test_every_chunk_embedded_in_sized_batches(self):
+        pipeline = EmbeddingPipeline(mock_model(), batch_size=2)
+        nodes = make_nodes(['one', 'two two', 'three three three'])
+        
+        with patch.object(MockEmbedding, 'get_text_embedding_batch',
+                          side_effect=lambda texts, **kwargs: [[1.0] * 8 for _ in texts]) as embed:
+            stats = pipeline.embed_nodes(nodes)
+        
+        assert [len(call.args[0]) for call in embed.call_args_list] == [2, 1]
+        assert all(node.embedding == [1.0] * 8 for node in nodes)
+        assert (stats.chunks, stats.embedded, stats.batches) == (3, 3, 2)
+        assert stats.chunks_per_second > 0
+        
+    def test_cache_is_checked_first(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path / 'embeddings.sqlite'))
+        embed_model = CachedEmbedding(mock_model(), cache)
+        pipeline = EmbeddingPipeline(embed_model, batch_size=8)
+        pipeline.embed_nodes(make_nodes(['lakers win']))
+        
+        with patch.object(MockEmbedding, 'get_text_embedding_batch',
+                          side_effect=lambda texts, **kwargs: [[2.0] * 8 for _ in texts]) as embed:
+            stats = pipeline.embed_nodes(make_nodes(['lakers win', 'celtics win']))
+        
+        embed.assert_called_once_with(['celtics win'])
+        assert (stats.cached, stats.embedded) == (1, 1)
+        assert cache.get_many(embed_model.model_name, ['celtics win'])[0] == [2.0] * 8
+        
+    def test_documents_are_chunked(self):
+        pipeline = EmbeddingPipeline(mock_model())
+        nodes, stats = pipeline.embed_documents([Document(text='word ' * 2000, id_='doc')])
+        
+        assert stats.documents == 1
+        assert stats.chunks == len(nodes) > 1
+        assert all(node.ref_doc_id == 'doc' and node.embedding for node in nodes)
+        
+    def test_process_pool(self):
+        pipeline = EmbeddingPipeline(mock_model(), batch_size=2, workers=2, model_factory=mock_model)
+        nodes = make_nodes([f'chunk {i}' for i in range(5)])
+        try:
+            stats = pipeline.embed_nodes(nodes)
+            # Workers are spawned, never forked from a process with torch loaded
+            start_method = pipeline._executor._mp_context.get_start_method()
+        finally:
+            pipeline.close()
+        
+        assert start_method == 'spawn'
+        assert stats.batches == 3
+        assert all(node.embedding == [0.5] * 8 for node in nodes)
+        
+    def test_other_models_are_embedded_in_process(self):
+        # Workers load the configured model, which is not the one in use here
+        pipeline = EmbeddingPipeline(mock_model(), batch_size=2, workers=2)
+        nodes = make_nodes([f'chunk {i}' for i in range(5)])
+        
+        stats = pipeline.embed_nodes(nodes)
+        
+        assert pipeline._executor is None
+        assert stats.batches == 3 and all(node.embedding == [0.5] * 8 for node in nodes)
+        
+    def test_worker_model_must_match_the_pipeline_model(self):
+        pipeline = EmbeddingPipeline(mock_model(), batch_size=2, workers=2, model_factory=other_model)
+        try:
+            with pytest.raises(ValueError, match='other'):
+                pipeline.embed_nodes(make_nodes([f'chunk {i}' for i in range(5)]))
+        finally:
+            pipeline.close()
@@ -0,0 +1,67 @@
+# tests/test_embeddings.py
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from unittest.mock import patch
+import src.embeddings as embeddings
+from src.embedding_cache import EmbeddingCache
+
+@pytest.fixture
+def mock_hf_embedding(monkeypatch, tmp_path):
+    monkeypatch.setenv('EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite'))
+    embeddings.set_embed_model(None)
+    with patch('src.embeddings.HuggingFaceEmbedding') as mock:
+        mock.side_effect = lambda **kwargs: MockEmbedding(embed_dim=8)
+        yield mock
+    embeddings.set_embed_model(None)
+
+class TestSharedEmbeddingModel:
+    def test_model_is_loaded_once(self, mock_hf_embedding):
+        first = embeddings.get_embed_model()
+        second = embeddings.get_embed_model()
+
+        assert first is second
+        assert mock_hf_embedding.call_count == 1
+
+    def test_settings_point_at_shared_model(self, mock_hf_embedding):
+        embed_model = embeddings.use_shared_embed_model()
+        assert Settings.embed_model is embed_model
+
+    def test_local_model_path(self, mock_hf_embedding, monkeypatch):
+        monkeypatch.setenv('EMBED_MODEL_PATH', '/models/minilm')
+        embeddings.get_embed_model()
+
+        assert mock_hf_embedding.call_args.kwargs['model_name'] == '/models/minilm'
+
+    def test_warm_up_runs_an_embedding(self, mock_hf_embedding):
+        with patch.object(MockEmbedding, '_get_text_embedding', return_value=[0.0] * 8) as embed:
+            embeddings.warm_up()
+        embed.assert_called_once()
+
+    def test_warm_up_bypasses_the_embedding_cache(self, mock_hf_embedding):
+        with patch.object(MockEmbedding, '_get_text_embedding', return_value=[0.0] * 8) as embed:
+            embeddings.warm_up()
+            embeddings.warm_up()
+        assert embed.call_count == 2
+
+    def test_shared_model_uses_embedding_cache(self, mock_hf_embedding):
+        embed_model = embeddings.get_embed_model()
+        assert isinstance(embed_model, embeddings.CachedEmbedding)
+
+    def test_cache_can_be_disabled(self, mock_hf_embedding, monkeypatch):
+        monkeypatch.setenv('EMBEDDING_CACHE_PATH', '')
+        assert isinstance(embeddings.get_embed_model(), MockEmbedding)
+
+class TestCachedEmbedding:
+    def test_only_uncached_texts_reach_the_model(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path / 'embeddings.sqlite'))
+        embed_model = embeddings.CachedEmbedding(MockEmbedding(embed_dim=8), cache)
+        first = embed_model.get_text_embedding_batch(["lakers win", "yankees win"])
+
+        with patch.object(MockEmbedding, '_get_text_embeddings',
+                          return_value=[[1.0] * 8]) as embed:
+            second = embed_model.get_text_embedding_batch(["lakers win", "celtics win"])
+
+        embed.assert_called_once_with(["celtics win"])
+        assert second[0] == pytest.approx(first[0])
+        assert second[1] == [1.0] * 8
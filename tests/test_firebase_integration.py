@@ -3,6 +3,9 @@ import pytest
 import asyncio
 from src.extract_user_information import FirebaseManager, UserPreference
 from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta, timezone
+from tests.fake_firestore import AsyncFakeFirestore, FakeFirestore
+from google.api_core import exceptions as google_exceptions
 
 @pytest.fixture
 def mock_firestore():
@@ -42,3 +45,244 @@ class TestFirebaseManager:
         assert user_pref is not None
         assert user_pref.email == 'test@example.com'
         assert user_pref.sport_preferences == ['basketball']
+
+@pytest.fixture
+def fake_db():
+    db = FakeFirestore()
+    for i in range(7):
+        db.add_subscriber(f"user{i}", f"user{i}@example.com", f"User {i}",
+                          sport_preferences=['basketball'])
+    db.add_subscriber("inactive", "inactive@example.com", "Inactive", is_active=False)
+    return db
+
+@pytest.mark.firebase
+@pytest.mark.asyncio
+class TestBatchedSubscriberLoading:
+    async def test_active_subscribers_loaded_in_batches(self, fake_db):
+        firebase_manager = FirebaseManager(db=fake_db, read_batch_size=3)
+        subscribers = await firebase_manager.get_active_subscribers()
+        
+        assert [s.user_id for s in subscribers] == [f"user{i}" for i in range(7)]
+        assert subscribers[0].email == "user0@example.com"
+        assert subscribers[0].sport_preferences == ['basketball']
+        assert fake_db.get_all_calls == 3
+        assert fake_db.document_gets == 0
+        
+    async def test_users_due_skip_per_user_reads(self, fake_db):
+        fake_db.collection('newsletter_preferences').docs['user0']['last_newsletter_sent'] = datetime.now()
+        
+        firebase_manager = FirebaseManager(db=fake_db, read_batch_size=100)
+        await firebase_manager.backfill_next_due_at()
+        users_due = await firebase_manager.get_users_due_for_newsletter('weekly')
+        
+        assert [u.user_id for u in users_due] == [f"user{i}" for i in range(1, 7)]
+        assert fake_db.get_all_calls == 1
+        assert fake_db.document_gets == 0
+        
+    async def test_subscribers_without_user_doc_are_skipped(self, fake_db):
+        del fake_db.collection('users').docs['user3']
+        
+        firebase_manager = FirebaseManager(db=fake_db, read_batch_size=2)
+        subscribers = await firebase_manager.get_active_subscribers()
+        
+        assert "user3" not in [s.user_id for s in subscribers]
+        assert len(subscribers) == 6
+
+@pytest.fixture
+def async_fake_db():
+    db = AsyncFakeFirestore()
+    for i in range(5):
+        db.add_subscriber(f"user{i}", f"user{i}@example.com", f"User {i}",
+                          sport_preferences=['tennis'])
+    return db
+
+@pytest.mark.firebase
+@pytest.mark.asyncio
+class TestAsyncFirestoreClient:
+    async def test_async_client_reads(self, async_fake_db):
+        firebase_manager = FirebaseManager(db=async_fake_db, read_batch_size=2,
+                                           use_async_client=True)
+        subscribers = await firebase_manager.get_active_subscribers()
+        user_pref = await firebase_manager.get_user_preferences("user2")
+        
+        assert [s.user_id for s in subscribers] == [f"user{i}" for i in range(5)]
+        assert user_pref.email == "user2@example.com"
+        assert async_fake_db.get_all_calls == 3
+        
+    async def test_async_client_writes(self, async_fake_db):
+        firebase_manager = FirebaseManager(db=async_fake_db, use_async_client=True)
+        
+        assert await firebase_manager.update_user_preferences("user1", {'sport_preferences': ['golf']})
+        assert await firebase_manager.update_last_sent_timestamp("user1")
+        
+        pref_data = async_fake_db.collection('newsletter_preferences').docs['user1']
+        assert pref_data['sport_preferences'] == ['golf']
+        assert pref_data['last_newsletter_sent'] is not None
+        
+    async def test_sync_client_runs_off_the_event_loop(self, fake_db):
+        import threading
+        loop_thread = threading.current_thread()
+        calling_threads = []
+        original_get_all = fake_db.get_all
+        def recording_get_all(refs):
+            calling_threads.append(threading.current_thread())
+            return original_get_all(refs)
+        fake_db.get_all = recording_get_all
+        
+        firebase_manager = FirebaseManager(db=fake_db)
+        assert firebase_manager.is_async is False
+        await firebase_manager.get_active_subscribers()
+        
+        assert calling_threads and loop_thread not in calling_threads
+
+@pytest.mark.firebase
+@pytest.mark.asyncio
+class TestStreamingSubscribers:
+    async def test_active_subscribers_streamed_in_pages(self, fake_db):
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        pages = [page async for page in firebase_manager.iter_active_subscribers(page_size=3)]
+        
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert [s.user_id for page in pages for s in page] == [f"user{i}" for i in range(7)]
+        
+    async def test_first_page_available_before_scan_finishes(self, fake_db):
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        pages = firebase_manager.iter_active_subscribers(page_size=2)
+        first_page = await pages.__anext__()
+        queries_after_first_page = fake_db.queries
+        await pages.aclose()
+        
+        assert [s.user_id for s in first_page] == ["user0", "user1"]
+        assert queries_after_first_page <= 2  # current page plus one prefetched page
+        
+    async def test_users_due_streamed_in_pages(self, async_fake_db):
+        prefs = async_fake_db.collection('newsletter_preferences').docs
+        prefs['user1']['last_newsletter_sent'] = datetime.now()
+        firebase_manager = FirebaseManager(db=async_fake_db, use_async_client=True)
+        await firebase_manager.backfill_next_due_at()
+        
+        pages = [page async for page in
+                 firebase_manager.iter_users_due_for_newsletter('weekly', page_size=2)]
+        
+        assert [s.user_id for page in pages for s in page] == ["user0", "user2", "user3", "user4"]
+
+
+@pytest.mark.firebase
+@pytest.mark.asyncio
+class TestNextDueAt:
+    async def test_due_query_reads_only_due_documents(self, fake_db):
+        prefs = fake_db.collection('newsletter_preferences').docs
+        now = datetime.now(timezone.utc)
+        for i in range(7):
+            prefs[f"user{i}"]['next_due_at'] = now + timedelta(days=1 if i % 2 else -1)
+        
+        firebase_manager = FirebaseManager(db=fake_db)
+        fake_db.reads = 0
+        users_due = await firebase_manager.get_users_due_for_newsletter('weekly')
+        
+        assert [u.user_id for u in users_due] == ["user0", "user2", "user4", "user6"]
+        assert fake_db.reads == 8  # four preference docs plus four user docs
+        
+    async def test_sending_moves_next_due_at(self, fake_db):
+        firebase_manager = FirebaseManager(db=fake_db)
+        await firebase_manager.update_last_sent_timestamp("user0", frequency='weekly')
+        
+        pref_data = fake_db.collection('newsletter_preferences').docs['user0']
+        assert pref_data['next_due_at'] == pref_data['last_newsletter_sent'] + timedelta(days=7)
+        assert "user0" not in [u.user_id for u in
+                               await firebase_manager.get_users_due_for_newsletter('weekly')]
+        
+    async def test_frequency_change_recomputes_next_due_at(self, fake_db):
+        last_sent = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        fake_db.collection('newsletter_preferences').docs['user0']['last_newsletter_sent'] = last_sent
+        
+        firebase_manager = FirebaseManager(db=fake_db)
+        await firebase_manager.update_user_preferences("user0", {'notification_frequency': 'monthly'})
+        
+        pref_data = fake_db.collection('newsletter_preferences').docs['user0']
+        assert pref_data['next_due_at'] == last_sent + timedelta(days=30)
+        
+    async def test_backfill_sets_missing_next_due_at(self, fake_db):
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        assert await firebase_manager.backfill_next_due_at(page_size=3) == 8
+        assert await firebase_manager.backfill_next_due_at(page_size=3) == 0
+        prefs = fake_db.collection('newsletter_preferences').docs
+        assert all('next_due_at' in pref_data for pref_data in prefs.values())
+
+@pytest.mark.firebase
+@pytest.mark.asyncio
+class TestBulkTimestampUpdates:
+    async def test_updates_committed_in_batches(self, fake_db):
+        firebase_manager = FirebaseManager(db=fake_db)
+        user_ids = [f"user{i}" for i in range(7)]
+        
+        outcomes = await firebase_manager.update_last_sent_timestamps(user_ids, chunk_size=3)
+        
+        assert outcomes == {user_id: True for user_id in user_ids}
+        assert fake_db.commits == 3
+        prefs = fake_db.collection('newsletter_preferences').docs
+        assert all(prefs[user_id]['next_due_at'] - prefs[user_id]['last_newsletter_sent']
+                   == timedelta(days=7) for user_id in user_ids)
+        
+    async def test_only_failed_chunks_are_retried(self, fake_db):
+        fake_db.fail_commits = 1
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        outcomes = await firebase_manager.update_last_sent_timestamps(
+            [f"user{i}" for i in range(4)], frequencies={f"user{i}": 'daily' for i in range(4)},
+            chunk_size=2, retry_delay=0
+        )
+        
+        assert all(outcomes.values())
+        assert fake_db.commits == 3  # two chunks plus one retry
+        
+    async def test_reports_per_user_failures(self, fake_db):
+        fake_db.fail_commits = 10
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        outcomes = await firebase_manager.update_last_sent_timestamps(
+            ["user0", "user1"], chunk_size=1, max_retries=1, retry_delay=0
+        )
+        
+        assert outcomes == {"user0": False, "user1": False}
+        assert fake_db.commits == 4
+        
+    async def test_deleted_preference_doc_is_reported_and_not_recreated(self, fake_db):
+        prefs = fake_db.collection('newsletter_preferences').docs
+        del prefs['user1']
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        outcomes = await firebase_manager.update_last_sent_timestamps(
+            ["user0", "user1", "user2"], frequencies={f"user{i}": 'weekly' for i in range(3)}
+        )
+        
+        assert outcomes == {"user0": True, "user1": None, "user2": True}
+        assert fake_db.commits == 2  # The first commit finds user1 gone and writes nothing
+        assert 'user1' not in prefs
+        assert 'last_newsletter_sent' in prefs['user0'] and 'last_newsletter_sent' in prefs['user2']
+        
+    async def test_deleted_doc_found_while_reading_frequencies_is_not_written(self, fake_db):
+        prefs = fake_db.collection('newsletter_preferences').docs
+        del prefs['user1']
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        outcomes = await firebase_manager.update_last_sent_timestamps(["user0", "user1"])
+        
+        assert outcomes == {"user0": True, "user1": None}
+        assert fake_db.commits == 1
+        assert 'user1' not in prefs
+        
+    async def test_permanent_errors_are_not_retried(self, fake_db):
+        fake_db.fail_commits = 10
+        fake_db.commit_error = google_exceptions.PermissionDenied
+        firebase_manager = FirebaseManager(db=fake_db)
+        
+        outcomes = await firebase_manager.update_last_sent_timestamps(
+            ["user0", "user1"], chunk_size=2, max_retries=3, retry_delay=0
+        )
+        
+        assert outcomes == {"user0": False, "user1": False}
+        assert fake_db.commits == 1
@@ -0,0 +1,56 @@
+# tests/test_gen_urls.py
+import pytest
+import json
+from src.gen_urls import UrlRegistry, generate_urls_from_query, get_registry, set_registry
+
+@pytest.fixture
+def registry_file(tmp_path, monkeypatch):
+    path = tmp_path / 'registry.json'
+    path.write_text(json.dumps({
+        'keywords': {
+            'fantasy football': ['https://fantasy.example.com/', 'https://nfl.example.com/'],
+            'football': ['https://nfl.example.com/'],
+            'soccer': ['https://soccer.example.com/', 'https://nfl.example.com/'],
+        },
+        'default': ['https://default.example.com/']
+    }))
+    monkeypatch.setenv('URL_REGISTRY_PATH', str(path))
+    set_registry(None)
+    yield path
+    set_registry(None)
+
+class TestUrlRegistry:
+    def test_overlapping_keywords_return_unique_urls_in_priority_order(self, registry_file):
+        urls = generate_urls_from_query('Fantasy Football and soccer')
+        
+        assert urls == ['https://fantasy.example.com/', 'https://nfl.example.com/',
+                        'https://soccer.example.com/']
+        
+    def test_longest_keyword_wins(self, registry_file):
+        assert get_registry().match_keywords('fantasy football tips') == ['fantasy football']
+        assert get_registry().match_keywords('football tonight') == ['football']
+        
+    def test_default_urls_when_nothing_matches(self, registry_file):
+        urls = generate_urls_from_query('curling')
+        urls.append('https://mutated.example.com/')
+        
+        assert generate_urls_from_query('curling') == ['https://default.example.com/']
+        
+    def test_registry_is_loaded_once(self, registry_file):
+        registry = get_registry()
+        registry_file.write_text(json.dumps({'keywords': {}}))
+        
+        assert get_registry() is registry
+        
+    def test_yaml_registry(self, tmp_path):
+        pytest.importorskip('yaml')
+        path = tmp_path / 'registry.yaml'
+        path.write_text("keywords:\n  golf:\n    - https://golf.example.com/\ndefault: []\n")
+        
+        assert UrlRegistry.from_file(str(path)).urls_for('golf') == ['https://golf.example.com/']
+        
+    def test_bundled_registry(self):
+        set_registry(None)
+        assert generate_urls_from_query('baseball')[0] == 'https://www.mlb.com/'
+        assert generate_urls_from_query('nothing here') == [
+            'https://www.sportsbettingdime.com/', 'https://www.actionnetwork.com/']
@@ -0,0 +1,62 @@
+# tests/test_html_extract.py
+import pytest
+import os
+from src.html_extract import (EXTRACTORS, benchmark, extract_text_bs4, extract_text_lxml, get_extractor,
+                              register_extractor)
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'mock_data', 'pages')
+
+def load_pages():
+    pages = {}
+    for filename in sorted(os.listdir(PAGES_DIR)):
+        with open(os.path.join(PAGES_DIR, filename), 'r') as f:
+            pages[filename] = f.read()
+    return pages
+
+PAGES = load_pages()
+
+@pytest.mark.scraper
+class TestHtmlExtraction:
+    @pytest.mark.parametrize('name', sorted(PAGES))
+    def test_lxml_matches_beautifulsoup(self, name):
+        assert extract_text_lxml(PAGES[name]) == extract_text_bs4(PAGES[name])
+        
+    @pytest.mark.parametrize('name', sorted(PAGES))
+    def test_main_content_matches_beautifulsoup(self, name):
+        assert extract_text_lxml(PAGES[name], main_content=True) == extract_text_bs4(PAGES[name], main_content=True)
+        
+    def test_boilerplate_is_skipped(self):
+        text = extract_text_lxml(PAGES['espn_nba.html'])
+        
+        assert 'Lakers edge Celtics' in text
+        assert 'All rights reserved' not in text  # footer
+        assert 'MLB' not in text                  # nav
+        assert 'trackArticleView' not in text     # script inside the article
+        assert 'font-family' not in text          # style
+        
+    def test_main_content_region(self):
+        text = extract_text_lxml(PAGES['espn_nba.html'], main_content=True)
+        
+        assert text.startswith('Lakers edge Celtics in overtime thriller')
+        assert 'Home' not in text
+        # Pages without a main region fall back to the whole body
+        assert extract_text_lxml(PAGES['bbc_football_landing.html'], main_content=True).startswith('Football')
+        
+    def test_empty_and_fragment_input(self):
+        assert extract_text_lxml('') == ''
+        assert extract_text_lxml('<p>Just &amp; text</p>') == extract_text_bs4('<p>Just &amp; text</p>')
+        
+    def test_backends_are_pluggable(self, monkeypatch):
+        monkeypatch.setattr('src.html_extract.EXTRACTORS', dict(EXTRACTORS))
+        register_extractor('upper', lambda html: html.upper())
+        
+        assert get_extractor('upper')('a') == 'A'
+        assert get_extractor() is extract_text_lxml
+        with pytest.raises(ValueError):
+            get_extractor('missing')
+            
+    def test_benchmark_reports_speedup_and_parity(self):
+        results = benchmark({'landing': PAGES['bbc_football_landing.html']}, repeat=2)
+        
+        assert results['landing']['lxml_matches'] == 1.0
+        assert results['landing']['speedup'] > 1
@@ -0,0 +1,51 @@
+# tests/test_index_store.py
+import pytest
+from llama_index.core.schema import Document, NodeRelationship, RelatedNodeInfo, TextNode
+from src.index_store import IndexStorage, SqliteKVStore, SqliteVectorStore
+
+def node(node_id, ref_doc_id, embedding):
+    return TextNode(id_=node_id, text=node_id, embedding=embedding,
+                    relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)})
+
+@pytest.mark.scraper
+class TestSqliteKVStore:
+    def test_put_get_delete_by_collection(self, tmp_path):
+        store = SqliteKVStore(str(tmp_path / 'index.sqlite'))
+        store.put_all([('a', {'v': 1}), ('b', {'v': 2})], collection='docs')
+        store.put('a', {'v': 3}, collection='other')
+
+        assert store.get('a', collection='docs') == {'v': 1}
+        assert store.get_all(collection='docs') == {'a': {'v': 1}, 'b': {'v': 2}}
+        assert store.delete('a', collection='docs') and not store.delete('a', collection='docs')
+        assert store.get('a', collection='other') == {'v': 3}
+        store.close()
+
+@pytest.mark.scraper
+class TestSqliteVectorStore:
+    def test_changes_survive_reopening(self, tmp_path):
+        path = str(tmp_path / 'index.sqlite')
+        store = SqliteVectorStore.from_path(path)
+        store.add([node('n1', 'doc-a', [1.0, 0.0]), node('n2', 'doc-b', [0.0, 1.0])])
+        store.add([node('n3', 'doc-b', [0.5, 0.5])])
+        store.delete('doc-a')
+        store.close()
+
+        reopened = SqliteVectorStore.from_path(path)
+        assert reopened.data.embedding_dict == {'n2': [0.0, 1.0], 'n3': [0.5, 0.5]}
+        assert reopened.data.text_id_to_ref_doc_id == {'n2': 'doc-b', 'n3': 'doc-b'}
+        reopened.close()
+
+@pytest.mark.scraper
+def test_index_storage_keeps_documents(tmp_path):
+    storage = IndexStorage(str(tmp_path))
+    doc = Document(text="Lakers win", extra_info={'url': 'https://example.com/nba', 'content_hash': 'x'})
+    doc.id_ = 'https://example.com/nba'
+    doc.excluded_embed_metadata_keys.append('content_hash')
+    storage.save_documents([doc])
+
+    [loaded] = IndexStorage(str(tmp_path)).documents()
+    assert (loaded.id_, loaded.text) == (doc.id_, "Lakers win")
+    assert 'content_hash' in loaded.excluded_embed_metadata_keys
+
+    storage.delete_document('https://example.com/nba')
+    assert storage.documents() == []
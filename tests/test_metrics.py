@@ -0,0 +1,135 @@
+# tests/test_metrics.py
+import pytest
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+from src.metrics import NULL_TIMER, Metrics, metrics
+from src.newsletter import NewsletterGenerator, Recipient
+from src.run_newsletter import main
+from src.scraper import html_to_document
+
+@pytest.fixture
+def recording():
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+class TestMetrics:
+    def test_counters_and_histograms_by_label(self):
+        registry = Metrics(enabled=True, buckets=(0.1, 1.0))
+        registry.incr('fetch_responses', status=200)
+        registry.incr('fetch_responses', 2, status=200)
+        registry.incr('fetch_responses', status=404)
+        for value in (0.05, 0.5, 5):
+            registry.observe('fetch_seconds', value)
+
+        assert registry.counter_value('fetch_responses', status=200) == 3
+        assert registry.counter_value('fetch_responses', status='404') == 1
+        histogram = registry.histogram('fetch_seconds')
+        assert (histogram.count, histogram.min, histogram.max) == (3, 0.05, 5)
+        assert histogram.cumulative() == {'0.1': 1, '1.0': 2, '+Inf': 3}
+
+    def test_disabled_registry_records_nothing(self):
+        registry = Metrics(enabled=False)
+        registry.incr('calls')
+        registry.observe('seconds', 1.0)
+
+        assert registry.timer('seconds') is NULL_TIMER
+        assert registry.snapshot()['counters'] == {} and registry.snapshot()['histograms'] == {}
+
+    def test_timer_counts_errors(self):
+        registry = Metrics(enabled=True)
+        with pytest.raises(ValueError):
+            with registry.timer('parse_seconds', extractor='lxml'):
+                raise ValueError("bad page")
+
+        assert registry.histogram('parse_seconds', extractor='lxml').count == 1
+        assert registry.counter_value('parse_seconds_errors', extractor='lxml') == 1
+
+    def test_timed_wraps_plain_and_async_functions(self):
+        registry = Metrics(enabled=True)
+
+        @registry.timed('render_seconds')
+        def render(x):
+            return x * 2
+
+        @registry.timed('send_seconds')
+        async def send(x):
+            return x + 1
+
+        assert render(2) == 4
+        assert asyncio.run(send(1)) == 2
+        assert registry.histogram('render_seconds').count == 1
+        assert registry.histogram('send_seconds').count == 1
+
+        registry.disable()
+        render(3)
+        assert registry.histogram('render_seconds').count == 1
+
+    def test_prometheus_export(self):
+        registry = Metrics(enabled=True, buckets=(1.0,))
+        registry.incr('sendgrid_responses', status=202)
+        registry.observe('firestore_seconds', 0.5, op='stream')
+
+        text = registry.to_prometheus(prefix='app_')
+
+        assert '# TYPE app_sendgrid_responses_total counter' in text
+        assert 'app_sendgrid_responses_total{status="202"} 1' in text
+        assert '# TYPE app_firestore_seconds histogram' in text
+        assert 'app_firestore_seconds_bucket{op="stream",le="1.0"} 1' in text
+        assert 'app_firestore_seconds_bucket{op="stream",le="+Inf"} 1' in text
+        assert 'app_firestore_seconds_sum{op="stream"} 0.5' in text
+        assert 'app_firestore_seconds_count{op="stream"} 1' in text
+
+    def test_write_picks_format_from_extension(self, tmp_path):
+        registry = Metrics(enabled=True)
+        registry.incr('index_nodes_inserted', 3)
+        registry.write(str(tmp_path / 'run.json'))
+        registry.write(str(tmp_path / 'run.prom'))
+
+        summary = json.loads((tmp_path / 'run.json').read_text())
+        assert summary['counters']['index_nodes_inserted'] == [{'labels': {}, 'value': 3}]
+        assert 'sports_newsletter_index_nodes_inserted_total 3' in (tmp_path / 'run.prom').read_text()
+
+class TestInstrumentedHotPaths:
+    def test_html_parsing_is_timed_per_extractor(self, recording):
+        html_to_document('https://example.com', '<html><body><p>Lakers win</p></body></html>', extractor='bs4')
+
+        assert recording.histogram('parse_seconds', extractor='bs4').count == 1
+
+    def test_fetched_bytes_are_counted_undecoded(self, recording, monkeypatch):
+        from aioresponses import aioresponses
+        import src.scraper as scraper
+        monkeypatch.setenv('HTTP_CACHE_PATH', '')
+        monkeypatch.setattr(scraper, 'http_cache', None)
+        page = '<html><body><p>Mbappé scores in São Paulo</p></body></html>'
+        with aioresponses() as mocked:
+            mocked.get('https://example.com/', body=page.encode('utf-8'), status=200,
+                       content_type='text/html; charset=utf-8')
+            scraper.scrape_with_rate_limit(['https://example.com/'], delay=0)
+
+        assert recording.counter_value('fetch_bytes') == len(page.encode('utf-8')) > len(page)
+
+    def test_sendgrid_requests_are_timed_and_counted(self, recording):
+        generator = NewsletterGenerator("mock_api_key")
+        response = MagicMock(status_code=202, text='')
+        with patch('requests.Session.post', return_value=response):
+            generator.send_bulk([Recipient('a@example.com'), Recipient('b@example.com')], "<p>hi</p>", "Subject")
+
+        assert recording.histogram('sendgrid_seconds').count == 1
+        assert recording.counter_value('sendgrid_responses', status=202) == 1
+        assert recording.counter_value('sendgrid_recipients') == 2
+
+def test_cli_writes_run_metrics(tmp_path):
+    path = tmp_path / 'run.json'
+    try:
+        assert main(['--dry-run', '--outbox', str(tmp_path / 'outbox'), '--journal', str(tmp_path / 'runs.sqlite'),
+                     '--metrics', str(path)]) == 0
+    finally:
+        metrics.disable()
+        metrics.reset()
+
+    summary = json.loads(path.read_text())
+    assert {'content_fetch_seconds', 'render_seconds'} <= set(summary['histograms'])
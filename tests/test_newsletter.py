@@ -1,8 +1,13 @@
 # tests/test_newsletter.py
 import pytest
-from src.newsletter import NewsletterGenerator
+from src.newsletter import (NewsletterGenerator, Recipient, article_cache, extract_article,
+                            template_env, unsubscribe_url_for)
 from unittest.mock import Mock, patch, MagicMock
 import json
+import os
+import responses
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'mock_data', 'pages')
 
 @pytest.fixture
 def mock_article():
@@ -104,4 +109,171 @@ class TestNewsletterGenerator:
             content = "Invalid content"
             result = generator.process_scraped_content(content)
             
-            assert result is None
\ No newline at end of file
+            assert result is None
+@pytest.fixture
+def clear_article_cache():
+    article_cache.clear()
+    yield article_cache
+    article_cache.clear()
+
+def make_article_html(title):
+    return f"""
+    <html><head><title>{title}</title></head>
+    <body><h1>{title}</h1>
+    <p>The home side closed the game with a late run, and the coach praised the
+    defense after a long week of travel and injuries across the roster.</p></body></html>
+    """
+
+@pytest.mark.newsletter
+class TestArticleExtraction:
+    def test_extraction_is_cached_by_url_and_content(self, clear_article_cache):
+        generator = NewsletterGenerator("mock_api_key", max_workers=1)
+        html = make_article_html("Lakers Rally")
+        
+        with patch('src.newsletter.extract_article', wraps=extract_article) as extract:
+            first = generator.process_scraped_content(html, url="https://example.com/a")
+            second = generator.process_scraped_content(html, url="https://example.com/a")
+            generator.process_scraped_content(html, url="https://example.com/b")
+        
+        assert first['title'] == "Lakers Rally"
+        assert second is first
+        assert extract.call_count == 2
+        assert clear_article_cache.hits == 1
+        
+    def test_items_extracted_across_process_pool(self, clear_article_cache):
+        generator = NewsletterGenerator("mock_api_key", max_workers=2)
+        items = [(f"https://example.com/{i}", make_article_html(f"Story {i}")) for i in range(3)]
+        
+        try:
+            articles = generator.process_scraped_items(items + [items[0]])
+            
+            # Everything is cached now, so the pool is not needed again
+            with patch.object(generator, '_get_executor', side_effect=AssertionError):
+                again = generator.process_scraped_items(items)
+        finally:
+            generator.close()
+        
+        assert [a['title'] for a in articles] == ["Story 0", "Story 1", "Story 2", "Story 0"]
+        assert [a['title'] for a in again] == ["Story 0", "Story 1", "Story 2"]
+        
+    def test_concurrent_callers_share_one_spawned_pool(self):
+        from concurrent.futures import ThreadPoolExecutor
+        generator = NewsletterGenerator("mock_api_key", max_workers=2)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=8) as threads:
+                executors = list(threads.map(lambda _: generator._get_executor(), range(8)))
+        finally:
+            generator.close()
+        
+        assert len({id(executor) for executor in executors}) == 1
+        assert executors[0]._mp_context.get_start_method() == 'spawn'
+
+    @pytest.mark.parametrize('page, url, expected', [
+        ('espn_nba.html', 'https://www.espn.com/nba/', "Lakers edge Celtics in overtime thriller"),
+        ('bbc_football_landing.html', 'https://www.bbc.com/sport/football', "Match report 0: United 2–0 City"),
+    ])
+    def test_scraped_documents_render_as_articles(self, clear_article_cache, page, url, expected):
+        from src.scraper import html_to_document
+        with open(os.path.join(PAGES_DIR, page), encoding='utf-8') as f:
+            doc = html_to_document(url, f.read())
+        generator = NewsletterGenerator("mock_api_key", max_workers=1)
+        
+        html = generator.prepare_newsletter('basketball', [(url, doc.text)]).personalize('Ann')
+        
+        assert "No updates available" not in html
+        assert expected in html
+
+@pytest.mark.newsletter
+class TestNewsletterTemplates:
+    @pytest.fixture
+    def generator(self, clear_article_cache):
+        generator = NewsletterGenerator("mock_api_key", max_workers=1)
+        generator.process_scraped_items = MagicMock(return_value=[{
+            'title': 'Lakers & Celtics',
+            'text': 'Preview text',
+            'summary': 'Overtime thriller',
+            'keywords': ['NBA'],
+            'publish_date': None
+        }])
+        return generator
+        
+    def test_shared_body_rendered_once_per_segment(self, generator):
+        with patch.object(template_env, 'get_template', wraps=template_env.get_template) as get_template:
+            prepared = generator.prepare_newsletter("basketball", ["<p>story</p>"])
+            first = prepared.personalize("Ana", "https://example.com/unsubscribe?user=1")
+            second = prepared.personalize("Ben")
+        
+        assert [call.args[0] for call in get_template.call_args_list].count('newsletter.html') == 1
+        assert generator.process_scraped_items.call_count == 1
+        assert "<p>Hi Ana,</p>" in first and "Unsubscribe" in first
+        assert "<p>Hi Ben,</p>" in second and "Unsubscribe" not in second
+        assert first.split("<p>Hi Ana,</p>")[1].split("<p class")[0] in second
+        
+    def test_unwritable_template_cache_is_skipped(self, tmp_path):
+        import subprocess, sys
+        blocker = tmp_path / 'not-a-directory'
+        blocker.write_text('')
+        code = ("from src.newsletter import PreparedNewsletter\n"
+                "assert 'Ann' in PreparedNewsletter('', '', '').personalize('Ann')")
+        env = {**os.environ, 'TEMPLATE_CACHE_DIR': str(blocker / 'jinja')}
+        
+        assert subprocess.run([sys.executable, '-c', code], env=env).returncode == 0
+        
+    def test_recipient_fields_are_escaped(self, generator):
+        html_content = generator.prepare_newsletter("basketball", []).personalize("<b>Eve</b>")
+        
+        assert "Hi &lt;b&gt;Eve&lt;/b&gt;," in html_content
+        assert "Lakers &amp; Celtics" in html_content
+        
+    def test_unsubscribe_url(self, monkeypatch):
+        monkeypatch.setattr('src.newsletter.UNSUBSCRIBE_URL', 'https://example.com/unsubscribe')
+        assert unsubscribe_url_for('user 1') == 'https://example.com/unsubscribe?user=user+1'
+
+@pytest.mark.newsletter
+class TestBulkSending:
+    API_HOST = 'http://sendgrid.local'
+    
+    @pytest.fixture(autouse=True)
+    def mock_sendgrid_host(self, monkeypatch):
+        monkeypatch.setattr('src.newsletter.SENDGRID_API_HOST', self.API_HOST)
+        
+    @responses.activate
+    def test_recipients_packed_into_personalization_batches(self):
+        responses.add(responses.POST, f'{self.API_HOST}/v3/mail/send', status=202)
+        generator = NewsletterGenerator("mock_api_key")
+        recipients = [Recipient(f"user{i}@example.com", f"User {i}") for i in range(5)]
+        
+        statuses = generator.send_bulk(recipients, "<p>Hi -name-,</p>", "Your Newsletter", batch_size=2)
+        
+        assert [s.delivered for s in statuses] == [True] * 5
+        assert len(responses.calls) == 3
+        payload = json.loads(responses.calls[0].request.body)
+        assert [p['to'][0]['email'] for p in payload['personalizations']] == [
+            "user0@example.com", "user1@example.com"
+        ]
+        assert payload['personalizations'][1]['substitutions']['-name-'] == "User 1"
+        assert responses.calls[0].request.headers['Authorization'] == 'Bearer mock_api_key'
+        
+    @responses.activate
+    def test_failed_batch_reported_per_recipient(self):
+        responses.add(responses.POST, f'{self.API_HOST}/v3/mail/send', status=202)
+        responses.add(responses.POST, f'{self.API_HOST}/v3/mail/send', status=400, body='bad request')
+        generator = NewsletterGenerator("mock_api_key")
+        recipients = [Recipient(f"user{i}@example.com") for i in range(3)]
+        
+        statuses = generator.send_bulk(recipients, "<p>body</p>", "Your Newsletter", batch_size=2)
+        
+        assert [(s.delivered, s.status_code) for s in statuses] == [(True, 202), (True, 202), (False, 400)]
+        assert statuses[2].error == 'bad request'
+        
+    def test_session_is_reused(self):
+        generator = NewsletterGenerator("mock_api_key")
+        assert generator.session is generator.session
+        
+    def test_substitution_values_are_escaped(self):
+        recipient = Recipient("eve@example.com", "<b>Eve</b>", "https://example.com/u?a=1&b=2")
+        assert recipient.substitutions() == {
+            '-name-': '&lt;b&gt;Eve&lt;/b&gt;',
+            '-unsubscribe_url-': 'https://example.com/u?a=1&amp;b=2'
+        }
@@ -0,0 +1,66 @@
+# tests/test_preference_store.py
+import pytest
+import json
+import sqlite3
+from src.newsletter import NewsletterGenerator
+from src.preference_store import PreferenceStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = PreferenceStore(str(tmp_path / 'preferences.sqlite'))
+    yield store
+    store.close()
+
+@pytest.mark.newsletter
+class TestPreferenceStore:
+    def test_upsert_replaces_existing_preference(self, store):
+        store.upsert('a@example.com', 'soccer')
+        store.upsert('a@example.com', 'basketball')
+        
+        assert store.get('a@example.com') == 'basketball'
+        assert len(store) == 1
+        
+    def test_batched_upserts_and_sport_lookup(self, store):
+        written = store.upsert_many([('a@example.com', 'soccer'), ('b@example.com', 'nfl'),
+                                     ('c@example.com', 'soccer')])
+        
+        assert written == 3
+        assert store.emails_for_sport('soccer') == ['a@example.com', 'c@example.com']
+        assert store.get('missing@example.com') is None
+        
+    def test_sport_lookup_uses_index(self, store):
+        plan = store._conn.execute(
+            'EXPLAIN QUERY PLAN SELECT email FROM subscriber_preferences WHERE sport = ?', ('nfl',)
+        ).fetchall()
+        assert 'idx_subscriber_preferences_sport' in ' '.join(str(row) for row in plan)
+        
+    def test_store_uses_wal(self, store):
+        conn = sqlite3.connect(store.path)
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        conn.close()
+        
+    def test_json_migration_runs_once(self, store, tmp_path):
+        legacy = tmp_path / 'subscriber_preferences.json'
+        legacy.write_text(json.dumps({'a@example.com': 'soccer', 'b@example.com': 'nfl'}))
+        store.upsert('a@example.com', 'tennis')
+        
+        assert store.migrate_from_json(str(legacy)) == 1
+        assert store.all() == {'a@example.com': 'tennis', 'b@example.com': 'nfl'}
+        
+        legacy.write_text(json.dumps({'c@example.com': 'golf'}))
+        assert store.migrate_from_json(str(legacy)) == 0
+        assert store.get('c@example.com') is None
+        
+    def test_generator_saves_to_store(self, store):
+        generator = NewsletterGenerator("mock_api_key", preference_store=store)
+        generator.save_subscriber_preference('a@example.com', 'soccer')
+        generator.save_subscriber_preferences({'b@example.com': 'nfl', 'a@example.com': 'mlb'})
+        
+        assert store.all() == {'a@example.com': 'mlb', 'b@example.com': 'nfl'}
+        
+    def test_generator_leaves_a_given_store_open(self, store):
+        generator = NewsletterGenerator("mock_api_key", preference_store=store)
+        generator.close()
+        
+        store.upsert('a@example.com', 'soccer')
+        assert store.get('a@example.com') == 'soccer'
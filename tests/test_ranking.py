@@ -0,0 +1,90 @@
+# tests/test_ranking.py
+import pytest
+import numpy as np
+from typing import List
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.embeddings import BaseEmbedding, MockEmbedding
+from llama_index.core.schema import Document
+from src.ranking import collapse_near_duplicates, rank_articles, ranked_content
+
+VOCABULARY = ['lakers', 'celtics', 'overtime', 'yankees', 'homer', 'ufc', 'knockout', 'news', 'basketball']
+
+class KeywordEmbedding(BaseEmbedding):
+    """Bag-of-words embedding so similar texts get similar vectors"""
+
+    def _embed(self, text: str) -> List[float]:
+        words = text.lower().split()
+        return [float(words.count(word)) + 0.01 for word in VOCABULARY]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+@pytest.fixture
+def sports_index():
+    Settings.embed_model = KeywordEmbedding()
+    texts = {
+        'https://espn.example.com/lakers': 'lakers celtics overtime basketball',
+        'https://bleacher.example.com/lakers': 'lakers celtics overtime basketball news',
+        'https://nba.example.com/celtics': 'celtics basketball',
+        'https://mlb.example.com/yankees': 'yankees homer',
+        'https://ufc.example.com/': 'ufc knockout',
+    }
+    yield VectorStoreIndex.from_documents([
+        Document(text=text, id_=url, extra_info={'url': url}) for url, text in texts.items()
+    ])
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+
+class TestNearDuplicates:
+    def test_duplicates_collapse_to_first_row(self):
+        embeddings = np.array([[1.0, 0.0], [0.99, 0.05], [0.0, 1.0], [0.0, 0.0]])
+        
+        assert collapse_near_duplicates(embeddings, threshold=0.95) == [0, 2, 3]
+        
+    def test_empty_input(self):
+        assert collapse_near_duplicates(np.empty((0, 4))) == []
+
+class TestRankArticles:
+    def test_wire_story_appears_once(self, sports_index):
+        articles = rank_articles('basketball', index=sports_index, top_k=5, threshold=0.85)
+        urls = [article.url for article in articles]
+        
+        assert sum('lakers' in url for url in urls) == 1
+        assert 'https://nba.example.com/celtics' in urls
+        assert articles == sorted(articles, key=lambda a: a.score, reverse=True)
+        
+    def test_top_k_bounds_candidates(self, sports_index):
+        assert len(rank_articles('basketball', index=sports_index, top_k=2, threshold=1.1)) == 2
+        
+    def test_max_articles_and_content_items(self, sports_index):
+        items = ranked_content('basketball', index=sports_index, max_articles=1)
+        
+        assert len(items) == 1
+        url, text = items[0]
+        assert url.startswith('https://') and 'basketball' in text
+        
+    def test_unrelated_articles_fall_below_min_score(self, sports_index):
+        urls = [article.url for article in rank_articles('basketball', index=sports_index, top_k=5, threshold=1.1)]
+        
+        assert len(urls) == 3
+        assert 'https://mlb.example.com/yankees' not in urls and 'https://ufc.example.com/' not in urls
+        
+    def test_urls_restrict_candidates(self, sports_index):
+        articles = rank_articles('basketball', index=sports_index, urls=['https://nba.example.com/celtics'])
+        
+        assert [article.url for article in articles] == ['https://nba.example.com/celtics']
+        # Nothing indexed for the sport's sources, so callers fall back to the scraped pages
+        assert rank_articles('basketball', index=sports_index, urls=['https://mlb.example.com/yankees']) == []
+        assert rank_articles('basketball', index=sports_index, urls=[]) == []
+        
+    def test_no_index_or_sport(self, sports_index, monkeypatch):
+        monkeypatch.setattr('src.scraper.index', None)
+        monkeypatch.setattr('src.scraper.INDEX_STORAGE_DIR', '')
+        
+        assert rank_articles('basketball') == []
+        assert rank_articles('', index=sports_index) == []
@@ -0,0 +1,187 @@
+# tests/test_run_journal.py
+import pytest
+import asyncio
+import threading
+from unittest.mock import MagicMock
+from src.dry_run import DryRunSubscriberSource
+from src.extract_user_information import UserPreference
+from src.newsletter import DeliveryStatus, NewsletterGenerator, PreparedNewsletter, Recipient
+from src.run_journal import FAILED, QUEUED, RENDERED, SENDING, SENT, RunJournal, idempotency_key
+from src.run_newsletter import NewsletterRun, main
+
+def subscriber(user_id, sports=('basketball',)):
+    return UserPreference(user_id, f'{user_id}@example.com', user_id, list(sports), 'weekly', None, True)
+
+class UnqueriedSource(DryRunSubscriberSource):
+    """
+    Subscriber source that fails the test if a resumed run queries it
+    """
+
+    def __init__(self):
+        super().__init__([])
+
+    async def iter_users_due_for_newsletter(self, frequency, page_size=100):
+        raise AssertionError("resumed run queried Firestore")
+        yield
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = RunJournal(str(tmp_path / 'runs.sqlite'))
+    yield journal
+    journal.close()
+
+@pytest.fixture
+def generator():
+    generator = MagicMock()
+    generator.prepare_newsletter.side_effect = lambda sport, data: PreparedNewsletter(
+        f"<html>{sport}", "", "", article_count=1
+    )
+    generator.send_bulk.side_effect = lambda recipients, html, subject: [
+        DeliveryStatus(r.email, True, 202) for r in recipients
+    ]
+    return generator
+
+def sent_emails(generator):
+    return [r.email for call in generator.send_bulk.call_args_list for r in call.args[0]]
+
+@pytest.mark.newsletter
+class TestRunJournal:
+    def test_records_state_transitions(self, journal):
+        journal.start_run('run-1', 'weekly')
+        journal.record_queued('run-1', [subscriber('u0'), subscriber('u1'), subscriber('u2')])
+        journal.set_state('run-1', ['u0'], SENT)
+        journal.set_state('run-1', ['u1'], FAILED, 'boom')
+        # Reloading a page keeps the state already recorded
+        journal.record_queued('run-1', [subscriber('u0')])
+
+        assert journal.states('run-1') == {'u0': SENT, 'u1': FAILED, 'u2': QUEUED}
+        assert journal.counts('run-1') == {SENT: 1, FAILED: 1, QUEUED: 1}
+        assert [s.user_id for s in journal.pending_subscribers('run-1')] == ['u1', 'u2']
+        assert journal.pending_subscribers('run-1')[0].sport_preferences == ['basketball']
+
+    def test_states_for_some_users_across_chunks(self, journal):
+        journal.start_run('run-1', 'weekly')
+        journal.record_queued('run-1', [subscriber(f'u{i}') for i in range(1200)])
+        journal.set_state('run-1', ['u1', 'u1100'], SENT)
+        journal.record_queued('run-2', [subscriber('u1')])
+
+        states = journal.states('run-1', ['u0', 'u1', 'u1100', 'nobody'])
+        assert states == {'u0': QUEUED, 'u1': SENT, 'u1100': SENT}
+        assert len(journal.states('run-1', [f'u{i}' for i in range(1200)])) == 1200
+
+    def test_latest_run_and_loaded_flag(self, journal):
+        journal.start_run('run-1', 'daily')
+        journal.start_run('run-2', 'weekly')
+        journal.mark_loaded('run-2')
+
+        assert journal.latest_run_id() == 'run-2'
+        assert journal.run_frequency('run-2') == 'weekly'
+        assert journal.is_loaded('run-2') and not journal.is_loaded('run-1')
+
+    def test_idempotency_key_is_stable_per_run_and_user(self):
+        assert idempotency_key('run-1', 'u0') == idempotency_key('run-1', 'u0')
+        assert idempotency_key('run-1', 'u0') != idempotency_key('run-2', 'u0')
+
+    def test_custom_args_are_added_to_personalizations(self):
+        generator = NewsletterGenerator("mock_api_key")
+        recipient = Recipient('a@example.com', 'A', custom_args={'idempotency_key': 'abc', 'run_id': 'run-1'})
+
+        [(_, payload)] = generator.build_bulk_messages([recipient], "<p>hi</p>", "Subject")
+
+        assert payload['personalizations'][0]['custom_args'] == {'idempotency_key': 'abc', 'run_id': 'run-1'}
+
+@pytest.mark.newsletter
+@pytest.mark.asyncio
+class TestResumableRun:
+    async def test_run_checkpoints_every_recipient(self, journal, generator):
+        source = DryRunSubscriberSource([subscriber(f'u{i}') for i in range(3)])
+
+        report = await NewsletterRun(source, generator, lambda sport: [], journal=journal,
+                                     run_id='run-1').run('weekly')
+
+        assert report.run_id == 'run-1' and report.sent == 3
+        assert journal.counts('run-1') == {SENT: 3}
+        assert journal.is_loaded('run-1')
+        recipients = generator.send_bulk.call_args.args[0]
+        assert recipients[0].custom_args == {'run_id': 'run-1', 'idempotency_key': idempotency_key('run-1', 'u0')}
+
+    async def test_resume_after_crash_never_sends_twice(self, journal, generator):
+        source = DryRunSubscriberSource([subscriber(f'u{i}') for i in range(6)])
+        second_send = threading.Event()
+        def crash_on_second_send(recipients, html, subject):
+            if generator.send_bulk.call_count > 1:
+                second_send.set()
+                threading.Event().wait(0.5)  # The process dies while this request is in flight
+            return [DeliveryStatus(r.email, True, 202) for r in recipients]
+        generator.send_bulk.side_effect = crash_on_second_send
+
+        run = NewsletterRun(source, generator, lambda sport: [], render_workers=1, send_batch_size=2,
+                            journal=journal, run_id='run-1')
+        task = asyncio.ensure_future(run.run('weekly'))
+        await asyncio.to_thread(second_send.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert journal.counts('run-1') == {SENT: 2, SENDING: 2, RENDERED: 2}
+
+        resumed = MagicMock()
+        resumed.prepare_newsletter.side_effect = generator.prepare_newsletter.side_effect
+        resumed.send_bulk.side_effect = lambda recipients, html, subject: [
+            DeliveryStatus(r.email, True, 202) for r in recipients
+        ]
+        report = await NewsletterRun(UnqueriedSource(), resumed, lambda sport: [], send_batch_size=2,
+                                     journal=journal, run_id='run-1', resume=True).run('weekly')
+
+        assert sent_emails(resumed) == ['u4@example.com', 'u5@example.com']
+        assert (report.sent, report.skipped, report.in_doubt) == (2, 4, 2)
+        assert report.in_doubt_user_ids == ['u2', 'u3']
+        assert journal.counts('run-1') == {SENT: 4, SENDING: 2}
+
+        # Once the provider confirms they never got it, in-doubt recipients can be released
+        assert journal.release_in_doubt('run-1') == 2
+        resumed.send_bulk.reset_mock()
+        report = await NewsletterRun(UnqueriedSource(), resumed, lambda sport: [], journal=journal,
+                                     run_id='run-1', resume=True).run('weekly')
+
+        assert sent_emails(resumed) == ['u2@example.com', 'u3@example.com']
+        assert (report.in_doubt, journal.counts('run-1')) == (0, {SENT: 6})
+
+    async def test_resume_requeries_when_loading_never_finished(self, journal, generator):
+        journal.start_run('run-1', 'weekly')
+        journal.record_queued('run-1', [subscriber('u0'), subscriber('u1')])
+        journal.set_state('run-1', ['u0'], SENT)
+        source = DryRunSubscriberSource([subscriber(f'u{i}') for i in range(4)])
+
+        report = await NewsletterRun(source, generator, lambda sport: [], journal=journal,
+                                     run_id='run-1', resume=True).run('weekly')
+
+        assert sorted(sent_emails(generator)) == ['u1@example.com', 'u2@example.com', 'u3@example.com']
+        assert report.skipped == 1
+        assert journal.counts('run-1') == {SENT: 4}
+
+    async def test_unsaved_timestamps_are_reported(self, journal, generator):
+        class FlakyTimestamps(DryRunSubscriberSource):
+            async def update_last_sent_timestamps(self, user_ids, frequencies=None):
+                # u1's save failed; u2's preferences were deleted, so there was nothing to save
+                return {user_id: {'u1': False, 'u2': None}.get(user_id, True) for user_id in user_ids}
+        source = FlakyTimestamps([subscriber(f'u{i}') for i in range(3)])
+
+        report = await NewsletterRun(source, generator, lambda sport: [], journal=journal,
+                                     run_id='run-1').run('weekly')
+
+        assert (report.sent, report.unrecorded_user_ids) == (3, ['u1'])
+        assert journal.counts('run-1') == {SENT: 3}
+
+def test_cli_resume_picks_up_latest_run(tmp_path):
+    journal_path = str(tmp_path / 'runs.sqlite')
+    options = ['--dry-run', '--outbox', str(tmp_path / 'outbox'), '--journal', journal_path]
+    assert main(options + ['--frequency', 'weekly', '--run-id', 'weekly-1']) == 0
+
+    # Nothing left to send: the resumed run skips every recipient
+    assert main(options + ['--resume']) == 0
+    journal = RunJournal(journal_path)
+    try:
+        assert journal.counts('weekly-1') == {SENT: 4}
+        assert journal.latest_run_id() == 'weekly-1'
+    finally:
+        journal.close()
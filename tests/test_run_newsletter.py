@@ -0,0 +1,279 @@
+# tests/test_run_newsletter.py
+import pytest
+import asyncio
+import os
+import threading
+from unittest.mock import MagicMock
+from src.dry_run import DryRunSubscriberSource
+from src.extract_user_information import UserPreference
+from aioresponses import aioresponses
+from src.newsletter import DeliveryStatus, NewsletterGenerator, PreparedNewsletter
+from src.run_newsletter import NewsletterRun, main
+from src.send_queue import SendGridSender, SendQueue, load_dead_letters
+
+def subscriber(user_id, sports):
+    return UserPreference(user_id, f'{user_id}@example.com', user_id, list(sports), 'weekly', None, True)
+
+def make_source(count, sports=('basketball',)):
+    return DryRunSubscriberSource([subscriber(f'u{i}', sports) for i in range(count)])
+
+def sent_emails(generator):
+    return [r.email for call in generator.send_bulk.call_args_list for r in call.args[0]]
+
+@pytest.fixture
+def generator():
+    generator = MagicMock()
+    generator.prepare_newsletter.side_effect = lambda sport, data: PreparedNewsletter(
+        f"<html>{sport}", "", "", article_count=1
+    )
+    generator.send_bulk.side_effect = lambda recipients, html, subject: [
+        DeliveryStatus(r.email, True, 202) for r in recipients
+    ]
+    return generator
+
+@pytest.mark.newsletter
+@pytest.mark.asyncio
+class TestNewsletterRun:
+    async def test_sports_fetched_and_segments_rendered_once(self, generator):
+        source = DryRunSubscriberSource([subscriber(f't{i}', ['tennis']) for i in range(4)] +
+                                        [subscriber(f'g{i}', ['golf', 'tennis']) for i in range(3)])
+        fetch_content = MagicMock(side_effect=lambda sport: [(f'https://{sport}.example.com', sport)])
+
+        report = await NewsletterRun(source, generator, fetch_content, page_size=2).run('weekly')
+
+        assert sorted(call.args[0] for call in fetch_content.call_args_list) == ['golf', 'tennis']
+        assert (report.subscribers, report.segments, report.renders, report.sent) == (7, 2, 2, 7)
+        assert report.sends == 2
+        assert len(source.last_sent) == 7
+
+    async def test_bounded_queues_apply_backpressure(self, generator):
+        source = make_source(50)
+        release = threading.Event()
+        def slow_send(recipients, html, subject):
+            release.wait(5)
+            return [DeliveryStatus(r.email, True, 202) for r in recipients]
+        generator.send_bulk.side_effect = slow_send
+
+        run = NewsletterRun(source, generator, lambda sport: [], queue_size=1, render_workers=1, send_batch_size=1)
+        task = asyncio.ensure_future(run.run('weekly'))
+        await asyncio.sleep(0.2)
+        # Sending is blocked, so loading must stall after filling the queues
+        assert run.report.subscribers <= 5
+        release.set()
+        report = await task
+
+        assert report.sent == 50
+
+    async def test_sending_overlaps_loading_with_default_batch_size(self, generator):
+        source = make_source(50)
+        release = threading.Event()
+        def slow_send(recipients, html, subject):
+            release.wait(5)
+            return [DeliveryStatus(r.email, True, 202) for r in recipients]
+        generator.send_bulk.side_effect = slow_send
+
+        run = NewsletterRun(source, generator, lambda sport: [], queue_size=1, render_workers=1,
+                            max_pending=5, page_size=5)
+        task = asyncio.ensure_future(run.run('weekly'))
+        await asyncio.sleep(0.2)
+        # A batch went out long before 1000 recipients were loaded, and loading waits on it
+        assert generator.send_bulk.call_count == 1
+        assert run.report.subscribers <= 15
+        release.set()
+        report = await task
+
+        assert report.sent == 50
+
+    async def test_partial_batches_are_sent_after_flush_after(self, generator):
+        loaded_more = asyncio.Event()
+        class SlowSource(DryRunSubscriberSource):
+            async def iter_users_due_for_newsletter(self, frequency, page_size=100):
+                yield [subscriber('u0', ['golf'])]
+                await loaded_more.wait()
+                yield [subscriber('u1', ['golf'])]
+        source = SlowSource([])
+
+        task = asyncio.ensure_future(NewsletterRun(source, generator, lambda sport: [],
+                                                   flush_after=0.05).run('weekly'))
+        await asyncio.sleep(0.3)
+        assert sent_emails(generator) == ['u0@example.com']
+        loaded_more.set()
+        report = await task
+
+        assert report.sent == 2 and report.sends == 2
+
+    async def test_stop_finishes_loaded_subscribers(self, generator):
+        source = make_source(20)
+        run = NewsletterRun(source, generator, lambda sport: [], queue_size=1, render_workers=1,
+                            send_batch_size=1, page_size=5)
+        def send_and_stop(recipients, html, subject):
+            run.stop()
+            return [DeliveryStatus(r.email, True, 202) for r in recipients]
+        generator.send_bulk.side_effect = send_and_stop
+
+        report = await run.run('weekly')
+
+        assert report.stopped_early
+        assert 0 < report.sent == report.subscribers < 20
+        assert report.failed == 0
+
+    async def test_failed_segment_does_not_stop_the_run(self, generator):
+        source = DryRunSubscriberSource([subscriber('u0', ['golf']), subscriber('u1', ['golf']),
+                                         subscriber('t1', ['tennis'])])
+        def fetch_content(sport):
+            if sport == 'golf':
+                raise RuntimeError("golf sites down")
+            return []
+
+        report = await NewsletterRun(source, generator, fetch_content).run('weekly')
+
+        assert report.sent == 1
+        assert sorted(report.failed_user_ids) == ['u0', 'u1']
+        assert list(source.last_sent) == ['t1']
+
+    async def test_segment_without_articles_is_not_sent(self, generator):
+        source = DryRunSubscriberSource([subscriber('g0', ['golf']), subscriber('t0', ['tennis'])])
+        generator.prepare_newsletter.side_effect = lambda sport, data: PreparedNewsletter(
+            f"<html>{sport}", "", "", article_count=0 if sport == 'tennis' else 1
+        )
+
+        report = await NewsletterRun(source, generator, lambda sport: []).run('weekly')
+
+        assert (report.sent, report.failed_user_ids) == (1, ['t0'])
+        assert sent_emails(generator) == ['g0@example.com']
+
+    async def test_fetches_nobody_awaited_are_settled(self, generator):
+        source = DryRunSubscriberSource([subscriber('u0', ['golf', 'tennis'])])
+        def fetch_content(sport):
+            if sport == 'golf':
+                raise RuntimeError("golf sites down")
+            threading.Event().wait(0.2)
+            return []
+        run = NewsletterRun(source, generator, fetch_content)
+
+        report = await run.run('weekly')
+
+        assert report.failed_user_ids == ['u0']
+        assert all(future.done() for future in run._content.values())
+
+    async def test_cancellation_stops_every_stage(self, generator):
+        started = threading.Event()
+        def hanging_fetch(sport):
+            started.set()
+            threading.Event().wait(0.5)
+            return []
+        run = NewsletterRun(make_source(10), generator, hanging_fetch, queue_size=2)
+        task = asyncio.ensure_future(run.run('weekly'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert started.is_set()
+        generator.send_bulk.assert_not_called()
+        others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        assert all(t.done() for t in others)
+
+    async def test_second_run_fetches_fresh_content(self, generator, monkeypatch):
+        from src.run_newsletter import SportContentFetcher
+        from llama_index.core.schema import Document
+        monkeypatch.setattr('src.scrape_plan.generate_urls_from_query', lambda sport: [f'https://{sport}.example.com/'])
+        monkeypatch.setattr('src.ranking.ranked_content', lambda sport, urls: [])
+        issues = iter(['first issue', 'second issue'])
+        scrape = MagicMock(side_effect=lambda urls: [Document(text=next(issues), extra_info={'url': url})
+                                                      for url in urls])
+        source = make_source(2, sports=('golf',))
+        run = NewsletterRun(source, generator, SportContentFetcher(scrape))
+
+        first = await run.run('weekly')
+        source.last_sent.clear()
+        second = await run.run('weekly')
+
+        assert scrape.call_count == 2
+        assert [call.args[1] for call in generator.prepare_newsletter.call_args_list] == [
+            [('https://golf.example.com/', 'first issue')], [('https://golf.example.com/', 'second issue')]
+        ]
+        assert (first.sent, second.sent, second.renders, second.sports_fetched) == (2, 2, 1, 1)
+        assert first is not second
+
+    async def test_sends_go_through_the_send_queue(self, tmp_path):
+        send_url = 'http://sendgrid.local/v3/mail/send'
+        source = DryRunSubscriberSource([subscriber(f't{i}', ['tennis']) for i in range(2)] +
+                                        [subscriber('g0', ['golf'])])
+        generator = NewsletterGenerator("mock_api_key", max_workers=1)
+        generator.prepare_newsletter = MagicMock(
+            side_effect=lambda sport, data: PreparedNewsletter(f"<html>{sport}", "", "", article_count=1))
+        dead_letter_path = str(tmp_path / 'dead_letters.jsonl')
+
+        with aioresponses() as mocked:
+            mocked.post(send_url, status=429, headers={'Retry-After': '0'})
+            mocked.post(send_url, status=202)
+            mocked.post(send_url, status=401, body='bad key')
+            async with SendGridSender('key', 'http://sendgrid.local') as sender:
+                queue = SendQueue(sender, workers=1, rate=100, dead_letter_path=dead_letter_path)
+                report = await NewsletterRun(source, generator, lambda sport: [], render_workers=1,
+                                             send_queue=queue).run('weekly')
+
+        assert (report.sent, report.failed) == (2, 1)
+        assert queue.retries == 1
+        assert [job.recipients for job in load_dead_letters(dead_letter_path)] == [['g0@example.com']]
+        assert sorted(source.last_sent) == ['t0', 't1']
+
+@pytest.fixture
+def live_scraper(monkeypatch):
+    """The real scraper and index in memory, with a cheap embedding model"""
+    import src.embeddings as embeddings
+    import src.scraper as scraper
+    from llama_index.core import Settings
+    from llama_index.core.embeddings import MockEmbedding
+    monkeypatch.setenv('HTTP_CACHE_PATH', '')
+    for name, value in [('http_cache', None), ('index', None), ('documents_list', []), ('document_hashes', {}),
+                        ('INDEX_STORAGE_DIR', ''), ('index_load_attempted', False), ('index_storages', {}),
+                        ('embedding_pipeline', None)]:
+        monkeypatch.setattr(scraper, name, value)
+    monkeypatch.setattr(Settings, '_embed_model', None)
+    embeddings.set_embed_model(MockEmbedding(embed_dim=8))
+    yield scraper
+    embeddings.set_embed_model(None)
+
+@pytest.mark.newsletter
+@pytest.mark.scraper
+@pytest.mark.asyncio
+async def test_scraped_pages_reach_the_inbox(live_scraper, tmp_path, monkeypatch):
+    """Subscribers through scraping, ranking, rendering and SendGrid, with only HTTP stubbed"""
+    from src.run_newsletter import SportContentFetcher
+    page_url = 'https://www.espn.com/nba/'
+    send_url = 'http://sendgrid.local/v3/mail/send'
+    monkeypatch.setattr('src.scrape_plan.generate_urls_from_query',
+                        lambda sport: [page_url] if sport == 'basketball' else [])
+    with open(os.path.join(os.path.dirname(__file__), 'mock_data', 'pages', 'espn_nba.html'), encoding='utf-8') as f:
+        page = f.read()
+    source = DryRunSubscriberSource([subscriber('b0', ['basketball']), subscriber('c0', ['curling'])])
+    generator = NewsletterGenerator("mock_api_key", max_workers=1)
+
+    with aioresponses() as mocked:
+        mocked.get(page_url, body=page, status=200)
+        mocked.post(send_url, status=202, repeat=True)
+        async with SendGridSender('key', 'http://sendgrid.local') as sender:
+            queue = SendQueue(sender, rate=100, dead_letter_path=str(tmp_path / 'dead_letters.jsonl'))
+            report = await NewsletterRun(source, generator, SportContentFetcher(), send_queue=queue).run('weekly')
+        [request] = [call for (method, url), calls in mocked.requests.items() if method == 'POST' for call in calls]
+
+    # Nothing was found for curling, so that segment is not sent an empty newsletter
+    assert (report.sent, report.failed_user_ids) == (1, ['c0'])
+    payload = request.kwargs['json']
+    assert [p['to'][0]['email'] for p in payload['personalizations']] == ['b0@example.com']
+    body = payload['content'][0]['value']
+    assert 'Lakers edge Celtics in overtime thriller' in body
+    assert 'No updates available' not in body
+
+def test_dry_run_cli_writes_outbox(tmp_path):
+    outbox = tmp_path / 'outbox'
+
+    assert main(['--dry-run', '--outbox', str(outbox), '--frequency', 'weekly',
+                 '--journal', str(tmp_path / 'runs.sqlite')]) == 0
+    assert sorted(os.listdir(outbox)) == ['ann_example.com.html', 'ben_example.com.html',
+                                          'cat_example.com.html', 'dan_example.com.html']
+    body = (outbox / 'ben_example.com.html').read_text()
+    assert 'Subject: Your soccer, tennis Newsletter Update' in body
+    assert 'Hi Ben,' in body and 'Soccer roundup' in body
@@ -0,0 +1,91 @@
+# tests/test_scrape_plan.py
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+from llama_index.core.schema import Document
+from src.extract_user_information import FirebaseManager, UserPreference
+from src.newsletter import DeliveryStatus, PreparedNewsletter
+from src.scrape_plan import build_scrape_plan
+from src.run_newsletter import NewsletterRun, SportContentFetcher
+from tests.fake_firestore import FakeFirestore
+
+URLS = {
+    'soccer': ['https://espn.example.com/', 'https://soccer.example.com/'],
+    'football': ['https://espn.example.com/', 'https://nfl.example.com/'],
+    '': ['https://default.example.com/'],
+}
+
+def subscriber(user_id, sports):
+    return UserPreference(user_id, f'{user_id}@example.com', user_id, sports, 'weekly', None, True)
+
+def fake_scrape(urls):
+    return [Document(text=f'text of {url}', extra_info={'url': url})
+            for url in urls if 'nfl' not in url]
+
+@pytest.fixture
+def subscribers():
+    return [subscriber('u1', ['soccer', 'football']), subscriber('u2', ['Soccer']),
+            subscriber('u3', ['football']), subscriber('u4', [])]
+
+class TestScrapePlan:
+    def test_urls_are_unioned_across_subscribers(self, subscribers):
+        url_generator = MagicMock(side_effect=URLS.get)
+        plan = build_scrape_plan(subscribers, url_generator)
+        
+        assert plan.urls == ['https://espn.example.com/', 'https://nfl.example.com/',
+                             'https://soccer.example.com/', 'https://default.example.com/']
+        assert url_generator.call_count == 3
+        # u1: 4, u2: 2, u3: 2, u4: 1 per-subscriber fetches vs 4 unique URLs
+        assert plan.stats.url_requests == 9
+        assert plan.stats.fetches_saved == 5
+        
+    def test_each_url_scraped_once_and_shared(self, subscribers):
+        plan = build_scrape_plan(subscribers, URLS.get)
+        scrape = MagicMock(side_effect=fake_scrape)
+        stats = plan.execute(scrape)
+        
+        scrape.assert_called_once_with(plan.urls)
+        assert stats.fetched == 3 and stats.failed == 1
+        assert plan.content_for('football') == [('https://espn.example.com/', 'text of https://espn.example.com/')]
+        assert plan.content_for('soccer')[0] == plan.content_for('football')[0]
+        assert plan.content_for('curling') == []
+
+class TestSportContentFetcher:
+    def test_urls_scraped_once_as_sports_come_up(self, monkeypatch):
+        monkeypatch.setattr('src.scrape_plan.generate_urls_from_query', URLS.get)
+        monkeypatch.setattr('src.ranking.ranked_content', lambda sport, urls: [])
+        scrape = MagicMock(side_effect=fake_scrape)
+        fetch_content = SportContentFetcher(scrape)
+        
+        assert fetch_content('soccer') == [(url, f'text of {url}') for url in URLS['soccer']]
+        assert fetch_content('football') == [('https://espn.example.com/', 'text of https://espn.example.com/')]
+        fetch_content('soccer')
+        
+        assert [call.args[0] for call in scrape.call_args_list] == [URLS['soccer'], ['https://nfl.example.com/']]
+
+@pytest.mark.newsletter
+@pytest.mark.asyncio
+async def test_run_scrapes_once_per_run(monkeypatch):
+    db = FakeFirestore()
+    db.add_subscriber("u1", "u1@example.com", "One", sport_preferences=['soccer'])
+    db.add_subscriber("u2", "u2@example.com", "Two", sport_preferences=['football', 'soccer'])
+    firebase_manager = FirebaseManager(db=db)
+    await firebase_manager.backfill_next_due_at()
+    generator = MagicMock()
+    generator.prepare_newsletter.side_effect = lambda sport, data: PreparedNewsletter(str(data), "", "",
+                                                                                      article_count=len(data))
+    generator.send_bulk.side_effect = lambda recipients, html, subject: [
+        DeliveryStatus(r.email, True, 202) for r in recipients
+    ]
+    scrape = MagicMock(side_effect=fake_scrape)
+    monkeypatch.setattr('src.scrape_plan.generate_urls_from_query', URLS.get)
+    monkeypatch.setattr('src.ranking.ranked_content', lambda sport, urls: [])
+    
+    report = await NewsletterRun(firebase_manager, generator, SportContentFetcher(scrape)).run('weekly')
+    
+    scraped = [url for call in scrape.call_args_list for url in call.args[0]]
+    assert sorted(scraped) == sorted(set(scraped))
+    assert report.urls_scraped == 3
+    # u1: 2, u2: 4 per-subscriber fetches vs 3 unique URLs
+    assert report.fetches_saved == 3
+    assert report.sent == 2
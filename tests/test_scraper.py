@@ -1,7 +1,15 @@
 # tests/test_scraper.py
 import pytest
-import responses
-from src.scraper import scrape_and_add_dynamic, validate_url, scrape_with_rate_limit
+from unittest.mock import MagicMock
+from aioresponses import aioresponses
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import Document
+import src.embeddings as embeddings
+import src.scraper as scraper
+from src.scraper import scrape_and_add_dynamic, validate_url, scrape_with_rate_limit, update_index
+from src.http_cache import HttpCache
+from yarl import URL
 from bs4 import BeautifulSoup
 import json
 
@@ -17,23 +25,63 @@ def mock_html_content():
     </html>
     """
 
+@pytest.fixture(autouse=True)
+def no_http_cache(monkeypatch):
+    """Keep tests from reading or writing the on-disk HTTP cache"""
+    monkeypatch.setenv('HTTP_CACHE_PATH', '')
+    monkeypatch.setattr(scraper, 'http_cache', None)
+
+@pytest.fixture
+def empty_index(monkeypatch):
+    """Reset the module-level index and use a cheap embedding model"""
+    monkeypatch.setattr(scraper, 'index', None)
+    monkeypatch.setattr(scraper, 'documents_list', [])
+    monkeypatch.setattr(scraper, 'document_hashes', {})
+    monkeypatch.setattr(scraper, 'INDEX_STORAGE_DIR', '')
+    monkeypatch.setattr(scraper, 'index_load_attempted', False)
+    monkeypatch.setattr(scraper, 'index_storages', {})
+    # Patched through the private field: reading Settings.embed_model while
+    # unset would resolve the default (OpenAI) model just to save it
+    monkeypatch.setattr(Settings, '_embed_model', MockEmbedding(embed_dim=8))
+    yield
+
 @pytest.mark.scraper
 class TestScraper:
-    @responses.activate
     def test_scrape_valid_url(self, mock_html_content):
         # Setup mock response
         test_url = "https://example.com/sports"
-        responses.add(
-            responses.GET,
-            test_url,
-            body=mock_html_content,
-            status=200
-        )
-        
-        # Test scraping
-        result = scrape_with_rate_limit([test_url], delay=0)
+        with aioresponses() as mocked:
+            mocked.get(test_url, body=mock_html_content, status=200)
+            
+            # Test scraping
+            result = scrape_with_rate_limit([test_url], delay=0)
         assert len(result) == 1
         assert "Sports News" in result[0].text
+        assert result[0].metadata['url'] == test_url
+        
+    def test_documents_keep_the_main_content_region(self, monkeypatch):
+        import os
+        path = os.path.join(os.path.dirname(__file__), 'mock_data', 'pages', 'espn_nba.html')
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        
+        doc = scraper.html_to_document('https://www.espn.com/nba/', html)
+        assert doc.text.startswith('Lakers edge Celtics in overtime thriller')
+        assert 'Home' not in doc.text
+        
+        monkeypatch.setattr(scraper, 'HTML_MAIN_CONTENT', False)
+        assert scraper.html_to_document('https://www.espn.com/nba/', html).text.startswith('NBA News')
+        
+    def test_scrape_skips_failed_urls(self, mock_html_content):
+        with aioresponses() as mocked:
+            mocked.get("https://example.com/ok", body=mock_html_content, status=200)
+            mocked.get("https://example.com/missing", status=404)
+            
+            result = scrape_with_rate_limit(
+                ["https://example.com/missing", "not_a_url", "https://example.com/ok"],
+                delay=0
+            )
+        assert [doc.metadata['url'] for doc in result] == ["https://example.com/ok"]
         
     def test_validate_url(self):
         assert validate_url("https://example.com") == True
@@ -42,12 +90,263 @@ class TestScraper:
     @pytest.mark.slow
     def test_rate_limiting(self, mock_html_content):
         urls = ["https://example.com/1", "https://example.com/2"]
-        for url in urls:
-            responses.add(responses.GET, url, body=mock_html_content, status=200)
+        import time
+        with aioresponses() as mocked:
+            for url in urls:
+                mocked.get(url, body=mock_html_content, status=200)
+                
+            start = time.time()
+            results = scrape_with_rate_limit(urls, delay=1)
+            duration = time.time() - start
+        
+        assert len(results) == 2
+        assert duration >= 0.75  # Same host, so the second request waits for the delay
+
+    @pytest.mark.slow
+    def test_different_hosts_fetched_in_parallel(self, mock_html_content):
+        urls = ["https://a.example.com/", "https://b.example.com/", "https://c.example.com/"]
+        import time
+        with aioresponses() as mocked:
+            for url in urls:
+                mocked.get(url, body=mock_html_content, status=200)
+                
+            start = time.time()
+            results = scrape_with_rate_limit(urls, delay=1)
+            duration = time.time() - start
+        
+        assert len(results) == 3
+        assert duration < 0.75  # No host is hit twice, so nobody waits
+
+    @pytest.mark.slow
+    def test_host_spacing_holds_when_concurrency_is_saturated(self, mock_html_content):
+        import asyncio, time
+        from aioresponses import CallbackResult
+        sent = []
+        async def respond(url, **kwargs):
+            sent.append((url.host, time.monotonic()))
+            if url.host == 'slow.example.com':
+                await asyncio.sleep(0.5)
+            return CallbackResult(body=mock_html_content, status=200)
+        urls = ["https://slow.example.com/"] + [f"https://a.example.com/{i}" for i in range(3)]
+        with aioresponses() as mocked:
+            for url in urls:
+                mocked.get(url, callback=respond)
             
+            results = scrape_with_rate_limit(urls, delay=0.2, max_concurrency=1)
+        
+        assert len(results) == 4
+        times = [t for host, t in sent if host == 'a.example.com']
+        # Queued behind the slow request, same-host requests still go out spaced apart
+        assert all(later - earlier >= 0.15 for earlier, later in zip(times, times[1:]))
+
+    @pytest.mark.slow
+    def test_busy_host_does_not_hold_up_other_hosts(self, mock_html_content):
         import time
-        start = time.time()
-        results = scrape_with_rate_limit(urls, delay=1)
-        duration = time.time() - start
+        from aioresponses import CallbackResult
+        sent = {}
+        def respond(url, **kwargs):
+            sent.setdefault(url.host, []).append(time.monotonic())
+            return CallbackResult(body=mock_html_content, status=200)
+        urls = [f"https://busy.example.com/{i}" for i in range(8)] + ["https://a.example.com/", "https://b.example.com/"]
+        with aioresponses() as mocked:
+            for url in urls:
+                mocked.get(url, callback=respond)
+            
+            start = time.monotonic()
+            results = scrape_with_rate_limit(urls, delay=0.5, max_concurrency=4)
         
-        assert duration >= 0.75  # Should take at least 1 second due to rate limiting
+        assert len(results) == 10
+        # Requests waiting out busy.example.com's delay hold no concurrency slot
+        assert sent['a.example.com'][0] - start < 0.3
+        assert sent['b.example.com'][0] - start < 0.3
+
+
+@pytest.mark.scraper
+class TestIncrementalIndex:
+    def test_unchanged_documents_are_skipped(self, empty_index):
+        doc = Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})
+        assert len(update_index([doc])) == 1
+        
+        again = Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})
+        assert update_index([again]) == []
+        assert len(scraper.index.ref_doc_info) == 1
+        
+    def test_changed_documents_replace_previous_version(self, empty_index):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        update_index([Document(text="Lakers lose", extra_info={'url': 'https://example.com/nba'})])
+        
+        assert list(scraper.index.ref_doc_info) == ['https://example.com/nba']
+        assert [d.text for d in scraper.documents_list] == ["Lakers lose"]
+        nodes = scraper.index.docstore.docs.values()
+        assert [n.text for n in nodes] == ["Lakers lose"]
+        
+    def test_only_new_documents_are_embedded(self, empty_index, monkeypatch):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        
+        embedded = []
+        original = MockEmbedding._get_text_embeddings
+        def spy(self, texts):
+            embedded.extend(texts)
+            return original(self, texts)
+        monkeypatch.setattr(MockEmbedding, '_get_text_embeddings', spy)
+        
+        update_index([
+            Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'}),
+            Document(text="Yankees win", extra_info={'url': 'https://example.com/mlb'}),
+        ])
+        assert len(embedded) == 1
+        assert "Yankees win" in embedded[0]
+
+        
+    def test_failed_embedding_is_retried_next_scrape(self, empty_index, monkeypatch):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        pipeline = scraper.get_embedding_pipeline()
+        original = pipeline.embed_documents
+        monkeypatch.setattr(pipeline, 'embed_documents', MagicMock(side_effect=RuntimeError("model crashed")))
+        with pytest.raises(RuntimeError):
+            update_index([Document(text="Lakers lose", extra_info={'url': 'https://example.com/nba'})])
+        # The old version is still served
+        assert [d.text for d in scraper.documents_list] == ["Lakers win"]
+        
+        monkeypatch.setattr(pipeline, 'embed_documents', original)
+        assert len(update_index([Document(text="Lakers lose", extra_info={'url': 'https://example.com/nba'})])) == 1
+        assert list(scraper.index.ref_doc_info) == ['https://example.com/nba']
+        assert [d.text for d in scraper.documents_list] == ["Lakers lose"]
+        
+    def test_rebuild_keys_documents_by_url(self, empty_index):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        update_index([Document(text="Lakers win again", extra_info={'url': 'https://example.com/nba'})],
+                     incremental=False)
+        update_index([Document(text="Lakers lose", extra_info={'url': 'https://example.com/nba'})])
+        
+        assert list(scraper.index.ref_doc_info) == ['https://example.com/nba']
+        assert [d.text for d in scraper.documents_list] == ["Lakers lose"]
+
+
+@pytest.mark.scraper
+class TestPersistedIndex:
+    @pytest.fixture
+    def storage_dir(self, empty_index, monkeypatch, tmp_path):
+        embeddings.set_embed_model(MockEmbedding(embed_dim=8))
+        monkeypatch.setattr(scraper, 'INDEX_STORAGE_DIR', str(tmp_path / 'storage'))
+        yield str(tmp_path / 'storage')
+        embeddings.set_embed_model(None)
+        
+    def test_index_is_reloaded_after_restart(self, storage_dir, monkeypatch):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        
+        # Simulate a fresh process
+        monkeypatch.setattr(scraper, 'index', None)
+        monkeypatch.setattr(scraper, 'document_hashes', {})
+        
+        assert scraper.load_index() is True
+        assert list(scraper.index.ref_doc_info) == ['https://example.com/nba']
+        assert update_index([
+            Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})
+        ]) == []
+        
+    def test_store_built_with_other_model_is_rejected(self, storage_dir):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        
+        assert scraper.check_index_store(storage_dir) is True
+        assert scraper.check_index_store(storage_dir, model_name='other-model') is False
+        
+    def test_persisted_documents_are_reloaded(self, storage_dir, monkeypatch):
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        update_index([Document(text="Yankees win", extra_info={'url': 'https://example.com/mlb'})])
+        update_index([Document(text="Lakers lose", extra_info={'url': 'https://example.com/nba'})])
+        
+        # A fresh process, with the storage opened again from disk
+        monkeypatch.setattr(scraper, 'index', None)
+        monkeypatch.setattr(scraper, 'documents_list', [])
+        monkeypatch.setattr(scraper, 'index_storages', {})
+        monkeypatch.setattr(scraper, 'index_load_attempted', False)
+        
+        assert scraper.get_index() is not None
+        assert [d.text for d in scraper.documents_list] == ["Yankees win", "Lakers lose"]
+        assert sorted(scraper.index.ref_doc_info) == ['https://example.com/mlb', 'https://example.com/nba']
+        
+        # A full rebuild starts from every persisted document, not just the new ones
+        update_index([Document(text="Celtics win", extra_info={'url': 'https://example.com/nba2'})],
+                     incremental=False)
+        assert len(scraper.index.ref_doc_info) == 3
+        
+    def test_import_does_not_load_the_index_or_model(self, storage_dir):
+        import os, subprocess, sys
+        update_index([Document(text="Lakers win", extra_info={'url': 'https://example.com/nba'})])
+        
+        code = ("import sys, src.embeddings as e\n"
+                "from llama_index.core.embeddings import MockEmbedding\n"
+                "loaded = []\n"
+                "e.HuggingFaceEmbedding = lambda **kwargs: loaded.append(1) or MockEmbedding(embed_dim=8)\n"
+                "import src.scraper\n"
+                "sys.exit(1 if loaded or src.scraper.index is not None else 0)")
+        env = {**os.environ, 'INDEX_STORAGE_DIR': storage_dir, 'EMBEDDING_CACHE_PATH': ''}
+        assert subprocess.run([sys.executable, '-c', code], env=env).returncode == 0
+        
+    def test_missing_store(self, storage_dir):
+        assert scraper.check_index_store(storage_dir) is False
+        assert scraper.load_index() is False
+
+
+@pytest.mark.scraper
+class TestHttpCache:
+    @pytest.fixture
+    def cache(self, monkeypatch, tmp_path):
+        cache = HttpCache(str(tmp_path / 'http.sqlite'))
+        monkeypatch.setattr(scraper, 'http_cache', cache)
+        return cache
+        
+    def test_not_modified_reuses_cached_document(self, cache, mock_html_content, monkeypatch):
+        url = "https://example.com/sports"
+        with aioresponses() as mocked:
+            mocked.get(url, body=mock_html_content, status=200, headers={'ETag': '"v1"'})
+            first = scrape_with_rate_limit([url], delay=0)
+            
+        parsed = []
+        monkeypatch.setattr(scraper, 'html_to_document',
+                            lambda *args: parsed.append(args))
+        with aioresponses() as mocked:
+            mocked.get(url, status=304)
+            second = scrape_with_rate_limit([url], delay=0)
+            request = mocked.requests[('GET', URL(url))][0]
+            
+        assert request.kwargs['headers']['If-None-Match'] == '"v1"'
+        assert parsed == []
+        assert second[0].text == first[0].text
+        assert cache.stats_dict() == {
+            'hits': 1, 'misses': 1, 'revalidations': 1,
+            'bytes_saved': len(mock_html_content.encode('utf-8'))
+        }
+        
+    def test_not_modified_page_is_extracted_again_with_other_settings(self, cache, monkeypatch):
+        url = "https://example.com/sports"
+        page = "<html><body><p>Scores ticker</p><main><p>Match report</p></main></body></html>"
+        with aioresponses() as mocked:
+            mocked.get(url, body=page, status=200, headers={'ETag': '"v1"'})
+            first = scrape_with_rate_limit([url], delay=0)
+            
+        monkeypatch.setattr(scraper, 'HTML_MAIN_CONTENT', False)
+        with aioresponses() as mocked:
+            mocked.get(url, status=304)
+            second = scrape_with_rate_limit([url], delay=0)
+            
+        assert first[0].text == "Match report"
+        assert "Scores ticker" in second[0].text
+        assert cache.get(url).extraction == scraper.extraction_key(main_content=False)
+        assert cache.stats_dict()['hits'] == 1
+        
+    def test_changed_page_is_downloaded_again(self, cache):
+        url = "https://example.com/sports"
+        with aioresponses() as mocked:
+            mocked.get(url, body="<p>Old score</p>", status=200,
+                       headers={'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+            mocked.get(url, body="<p>New score</p>", status=200,
+                       headers={'Last-Modified': 'Tue, 02 Jan 2024 00:00:00 GMT'})
+            scrape_with_rate_limit([url], delay=0)
+            result = scrape_with_rate_limit([url], delay=0)
+            
+        assert result[0].text == "New score"
+        assert cache.get(url).last_modified == 'Tue, 02 Jan 2024 00:00:00 GMT'
+        assert cache.stats_dict()['misses'] == 2
+        assert cache.stats_dict()['revalidations'] == 1
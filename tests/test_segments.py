@@ -0,0 +1,70 @@
+# tests/test_segments.py
+import pytest
+from unittest.mock import MagicMock
+from src.extract_user_information import FirebaseManager
+from src.newsletter import DeliveryStatus, PreparedNewsletter
+from src.run_newsletter import NewsletterRun
+from src.segments import group_subscribers_by_segment, segment_key
+from tests.fake_firestore import FakeFirestore
+
+@pytest.fixture
+def fake_db():
+    db = FakeFirestore()
+    db.add_subscriber("u1", "u1@example.com", "One", sport_preferences=['basketball', 'tennis'])
+    db.add_subscriber("u2", "u2@example.com", "Two", sport_preferences=['Tennis', 'basketball'])
+    db.add_subscriber("u3", "u3@example.com", "Three", sport_preferences=['golf'])
+    db.add_subscriber("u4", "u4@example.com", "Four", sport_preferences=['golf'])
+    db.add_subscriber("u5", "u5@example.com", "Five", sport_preferences=['golf'])
+    return db
+
+@pytest.fixture
+def generator():
+    generator = MagicMock()
+    generator.prepare_newsletter.side_effect = lambda sport, data: PreparedNewsletter(
+        f"<html>{sport}", "<body>", "</body></html>", article_count=1
+    )
+    generator.send_bulk.side_effect = lambda recipients, html, subject: [
+        DeliveryStatus(r.email, True, 202) for r in recipients
+    ]
+    return generator
+
+def test_segment_key_ignores_order_and_case():
+    assert segment_key(['Tennis', 'basketball']) == segment_key(['basketball', 'tennis '])
+
+@pytest.mark.newsletter
+@pytest.mark.asyncio
+class TestSegmentedRun:
+    async def test_each_segment_rendered_once(self, fake_db, generator):
+        firebase_manager = FirebaseManager(db=fake_db)
+        fetch_content = MagicMock(side_effect=lambda sport: [f"{sport} story"])
+        await firebase_manager.backfill_next_due_at()
+        
+        report = await NewsletterRun(firebase_manager, generator, fetch_content).run('weekly')
+        
+        assert report.segments == 2
+        assert report.renders == 2
+        assert generator.prepare_newsletter.call_count == 2
+        # Naively: u1, u2 render two sports each, u3-u5 one each = 7 renders
+        assert report.renders_avoided == 5
+        assert report.sent == 5
+        assert generator.send_bulk.call_count == 2
+        assert sorted(call.args[0] for call in fetch_content.call_args_list) == ['basketball', 'golf', 'tennis']
+        
+    async def test_segment_body_fanned_out_and_timestamps_recorded(self, fake_db, generator):
+        firebase_manager = FirebaseManager(db=fake_db)
+        await firebase_manager.backfill_next_due_at()
+        generator.send_bulk.side_effect = lambda recipients, html, subject: [
+            DeliveryStatus(r.email, r.email != "u4@example.com") for r in recipients
+        ]
+        
+        report = await NewsletterRun(firebase_manager, generator, lambda sport: []).run('weekly')
+        
+        assert generator.send_bulk.call_count == 2
+        [(recipients, body, subject)] = [call.args for call in generator.send_bulk.call_args_list
+                                         if call.args[2] == "Your basketball, tennis Newsletter Update"]
+        assert [r.name for r in recipients] == ["One", "Two"]
+        assert body.startswith("<html>basketball, tennis<p>Hi -name-,</p>")
+        assert report.failed_user_ids == ["u4"]
+        prefs = fake_db.collection('newsletter_preferences').docs
+        assert 'last_newsletter_sent' in prefs['u3']
+        assert 'last_newsletter_sent' not in prefs['u4']
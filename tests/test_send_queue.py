@@ -0,0 +1,95 @@
+# tests/test_send_queue.py
+import pytest
+import json
+import time
+from aioresponses import aioresponses
+from src.send_queue import (PermanentSendError, RetryableSendError, SendGridSender, SendJob,
+                            SendQueue, TokenBucket, load_dead_letters)
+
+API_HOST = 'http://sendgrid.local'
+SEND_URL = f'{API_HOST}/v3/mail/send'
+
+def make_job(job_id):
+    return SendJob(job_id, {'personalizations': [{'to': [{'email': f'{job_id}@example.com'}]}]},
+                   [f'{job_id}@example.com'])
+
+@pytest.fixture
+def dead_letter_path(tmp_path):
+    return str(tmp_path / 'dead_letters.jsonl')
+
+@pytest.mark.newsletter
+@pytest.mark.asyncio
+class TestSendQueue:
+    async def test_429_retried_after_retry_after(self, dead_letter_path):
+        with aioresponses() as mocked:
+            mocked.post(SEND_URL, status=429, headers={'Retry-After': '0'})
+            mocked.post(SEND_URL, status=202)
+            async with SendGridSender('key', API_HOST) as sender:
+                queue = SendQueue(sender, workers=1, rate=100, dead_letter_path=dead_letter_path)
+                results = await queue.run([make_job('a')])
+        
+        assert results[0].delivered
+        assert results[0].attempts == 2
+        assert queue.retries == 1
+        
+    async def test_exhausted_retries_go_to_dead_letter_file(self, dead_letter_path):
+        with aioresponses() as mocked:
+            for _ in range(3):
+                mocked.post(SEND_URL, status=503)
+            async with SendGridSender('key', API_HOST) as sender:
+                queue = SendQueue(sender, workers=1, rate=100, max_retries=2, base_delay=0,
+                                  dead_letter_path=dead_letter_path)
+                results = await queue.run([make_job('a')])
+        
+        assert not results[0].delivered
+        assert results[0].attempts == 3
+        replay = load_dead_letters(dead_letter_path)
+        assert [job.job_id for job in replay] == ['a']
+        assert replay[0].payload == make_job('a').payload
+        assert replay[0].attempts == 0
+        
+    async def test_permanent_failures_are_not_retried(self, dead_letter_path):
+        with aioresponses() as mocked:
+            mocked.post(SEND_URL, status=400, body='bad payload')
+            async with SendGridSender('key', API_HOST) as sender:
+                queue = SendQueue(sender, workers=1, rate=100, dead_letter_path=dead_letter_path)
+                results = await queue.run([make_job('a')])
+        
+        assert results[0].attempts == 1
+        assert results[0].status_code == 400
+        assert 'bad payload' in results[0].error
+        with open(dead_letter_path) as f:
+            assert json.loads(f.readline())['job_id'] == 'a'
+            
+    async def test_results_are_per_run(self, dead_letter_path):
+        async def send(job):
+            pass
+        queue = SendQueue(send, workers=1, rate=1000, dead_letter_path=dead_letter_path)
+        await queue.run([make_job('a')])
+        
+        assert [r.job_id for r in await queue.run([make_job('b')])] == ['b']
+        assert [r.job_id for r in queue.results] == ['b']
+            
+    async def test_workers_send_concurrently(self, dead_letter_path):
+        import asyncio
+        in_flight = []
+        peak = []
+        async def slow_send(job):
+            in_flight.append(job)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(job)
+        
+        queue = SendQueue(slow_send, workers=3, rate=1000, dead_letter_path=dead_letter_path)
+        results = await queue.run([make_job(str(i)) for i in range(6)])
+        
+        assert len(results) == 6 and all(r.delivered for r in results)
+        assert max(peak) == 3
+        
+    async def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        
+        assert time.monotonic() - start >= 0.15  # four refills at 50ms each